@@ -0,0 +1,9 @@
+"""
+Offline benchmarks of sassy, run with `python -m benchmarks --help`.
+"""
+import os
+
+# importing sassy reads its configuration from the environment, nothing
+# here talks to the real services
+os.environ.setdefault('OPENAI_API_KEY', 'fake')
+os.environ.setdefault('DEFAULT_ACCESS_TOKEN', 'fake')
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+
+from . import chat, micro
+
+
+def run():
+    parser = argparse.ArgumentParser(
+            prog='benchmarks', description='offline benchmarks of sassy')
+
+    subparsers = parser.add_subparsers(
+        help='sub-command help', dest='command', required=True)
+
+    chat_parser = subparsers.add_parser(
+        'chat', help='/chat latency and throughput against local fakes')
+    chat_parser.add_argument('--requests', type=int, default=200)
+    chat_parser.add_argument('--concurrency', type=int, default=20)
+    chat_parser.add_argument(
+        '--think-time', type=float, default=0.05,
+        help='seconds the fake assistant takes per run step')
+    chat_parser.add_argument(
+        '--sf-latency', type=float, default=0.02,
+        help='seconds the fake Salesforce takes per request')
+    chat_parser.add_argument(
+        '--stream', action='store_true', help='use /chat/stream')
+    chat_parser.add_argument('--poll-qps', type=float, default=20.0)
+    chat_parser.add_argument(
+        '--no-composite', dest='composite', action='store_false',
+        help='send every tool call on its own')
+
+    micro_parser = subparsers.add_parser(
+        'micro', help='spec compilation on synthetic specs')
+    micro_parser.add_argument('--operations', type=int, default=2000)
+    micro_parser.add_argument('--schemas', type=int, default=200)
+    micro_parser.add_argument('--unused-schemas', type=int, default=2000)
+    micro_parser.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args()
+
+    if args.command == 'chat':
+        result = asyncio.run(chat.run_chat_benchmark(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            think_time=args.think_time,
+            sf_latency=args.sf_latency,
+            stream=args.stream,
+            server_options={
+                'poll_qps': args.poll_qps, 'composite': args.composite}))
+        print(chat.format_report(result))
+
+    elif args.command == 'micro':
+        print(micro.format_report(micro.run_micro_benchmarks(
+            operations=args.operations,
+            schemas=args.schemas,
+            unused_schemas=args.unused_schemas,
+            repeat=args.repeat)))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,217 @@
+"""
+End to end /chat benchmark: drives the real Quart app against the local
+fakes of OpenAI and Salesforce.
+"""
+import asyncio
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import re
+import statistics
+import tempfile
+import time
+from typing import Any
+
+import httpx
+from jinja2 import Environment, FileSystemLoader
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from sassy.functions import FunctionRegistry
+from sassy.server import Server, app
+from sassy.transport import HTTPTransport
+
+from .fakes import FakeOpenAI, FakeSalesforce, LocalServer, Step
+
+TMPL_DIR = os.path.join(os.path.dirname(__file__), '..', 'tmpl')
+
+_OPENAI_STAGES = [
+    ('POST', re.compile(r'/threads/[^/]+/messages$'), 'messages.create'),
+    ('GET', re.compile(r'/threads/[^/]+/messages$'), 'messages.list'),
+    ('POST', re.compile(r'/threads/[^/]+/runs$'), 'runs.create'),
+    ('GET', re.compile(r'/threads/[^/]+/runs/[^/]+$'), 'runs.retrieve'),
+    ('POST', re.compile(r'/submit_tool_outputs$'), 'runs.submit_tool_outputs'),
+]
+
+
+def _stage(req: httpx.Request) -> str:
+    if '/services/' in req.url.path:
+        return f'tool {req.method} {req.url.path.split("/services", 1)[1]}'
+    for method, path, stage in _OPENAI_STAGES:
+        if req.method == method and path.search(req.url.path):
+            return stage
+    return f'openai {req.method} {req.url.path}'
+
+
+class StageTimer:
+    """
+    httpx event hooks timing every outgoing request by stage, up to the
+    response headers
+    """
+    stages: dict[str, list[float]]
+
+    def __init__(self) -> None:
+        self.stages = {}
+
+    async def _on_request(self, req: httpx.Request) -> None:
+        req.extensions['bench_started'] = time.perf_counter()
+
+    async def _on_response(self, resp: httpx.Response) -> None:
+        started = resp.request.extensions.get('bench_started')
+        if started is not None:
+            self.stages.setdefault(_stage(resp.request), []).append(
+                time.perf_counter() - started)
+
+    @property
+    def hooks(self) -> dict[str, list[Any]]:
+        return {'request': [self._on_request], 'response': [self._on_response]}
+
+
+@dataclass
+class ChatBenchmarkResult:
+    latencies: list[float]
+    errors: list[str]
+    elapsed: float
+    stages: dict[str, list[float]] = field(default_factory=dict)
+    upstream: dict[str, dict[str, int]] = field(default_factory=dict)
+    """fake -> endpoint -> number of requests"""
+    metrics: str = ''
+    """the /metrics exposition of the server once done"""
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def render_spec(server_url: str) -> str:
+    env = Environment(loader=FileSystemLoader(searchpath=TMPL_DIR))
+    spec = json.loads(env.get_template("api.json.j2").render(host='fake'))
+    spec['servers'] = [{'url': f'{server_url}/services'}]
+    return json.dumps(spec)
+
+
+async def _chat(client: Any, thread_id: str, stream: bool) -> str:
+    body = {
+        'thread_id': thread_id,
+        'content': 'show me my accounts',
+        'security': {},
+    }
+    if not stream:
+        resp = await client.post('/chat', json=body)
+        if resp.status_code != 200:
+            raise RuntimeError(f'/chat answered {resp.status_code}')
+        return (await resp.get_json())['response']
+
+    resp = await client.post('/chat/stream', json=body)
+    if resp.status_code != 200:
+        raise RuntimeError(f'/chat/stream answered {resp.status_code}')
+    events = (await resp.get_data(as_text=True)).split('\n\n')
+    for event in events:
+        if event.startswith('event: done'):
+            return json.loads(event.split('data: ', 1)[1])['response']
+    raise RuntimeError('/chat/stream ended without a done event')
+
+
+async def run_chat_benchmark(
+        requests: int = 100,
+        concurrency: int = 10,
+        think_time: float = 0.05,
+        sf_latency: float = 0.02,
+        stream: bool = False,
+        script: list[Step] | None = None,
+        server_options: dict[str, Any] | None = None) \
+        -> ChatBenchmarkResult:
+    """
+    send `requests` chats, `concurrency` at a time, each on its own thread
+    """
+    fake_openai = FakeOpenAI(script, think_time)
+    fake_sf = FakeSalesforce(sf_latency)
+    timer = StageTimer()
+
+    async with LocalServer(fake_openai.app) as openai_server, \
+            LocalServer(fake_sf.app) as sf_server:
+        openai = AsyncOpenAI(
+            api_key='fake',
+            base_url=f'{openai_server.url}/v1',
+            http_client=DefaultAsyncHttpxClient(event_hooks=timer.hooks))
+        registry = FunctionRegistry.from_openapi_spec(
+            render_spec(sf_server.url), 'fake',
+            HTTPTransport(event_hooks=timer.hooks))
+
+        logger = logging.getLogger('benchmarks.chat')
+        logger.setLevel(logging.WARNING)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            def_file = os.path.join(tmp, 'assistant.json')
+            with open(def_file, 'w') as file:
+                json.dump(
+                    {'instructions': '', 'model': 'fake', 'tools': []}, file)
+
+            app.config['SERVER'] = Server(
+                openai, logger, registry,
+                assistant_def_file=def_file,
+                assistant_lock_file=os.path.join(tmp, 'assistant.lock'),
+                **(server_options or {}))
+
+            latencies: list[float] = []
+            errors: list[str] = []
+            pending = iter(range(requests))
+
+            async def worker(client: Any) -> None:
+                resp = await client.post('/thread')
+                thread_id = (await resp.get_json())['id']
+                for _ in pending:
+                    started = time.perf_counter()
+                    try:
+                        await _chat(client, thread_id, stream)
+                        latencies.append(time.perf_counter() - started)
+                    except Exception as e:
+                        errors.append(f'{type(e).__name__}: {e}')
+
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                started = time.perf_counter()
+                await asyncio.gather(
+                    *(worker(client) for _ in range(concurrency)))
+                elapsed = time.perf_counter() - started
+                metrics = await (await client.get('/metrics')) \
+                    .get_data(as_text=True)
+
+        await openai.close()
+
+    return ChatBenchmarkResult(
+        latencies=latencies,
+        errors=errors,
+        elapsed=elapsed,
+        stages=timer.stages,
+        upstream={
+            'openai': fake_openai.requests,
+            'salesforce': fake_sf.requests,
+        },
+        metrics=metrics)
+
+
+def format_report(result: ChatBenchmarkResult) -> str:
+    lat = result.latencies
+    lines = [
+        f'chats: {len(lat)} ok, {len(result.errors)} failed '
+        f'in {result.elapsed:.2f}s '
+        f'({len(lat) / result.elapsed if result.elapsed else 0:.1f} req/s)',
+        f'latency p50 {percentile(lat, 50) * 1000:.1f}ms '
+        f'p95 {percentile(lat, 95) * 1000:.1f}ms '
+        f'p99 {percentile(lat, 99) * 1000:.1f}ms',
+        '',
+        f'{"stage":<48}{"count":>8}{"total s":>10}{"mean ms":>10}'
+        f'{"p95 ms":>10}',
+    ]
+    for stage, times in sorted(result.stages.items()):
+        lines.append(
+            f'{stage:<48}{len(times):>8}{sum(times):>10.2f}'
+            f'{statistics.fmean(times) * 1000:>10.1f}'
+            f'{percentile(times, 95) * 1000:>10.1f}')
+    for error in sorted(set(result.errors))[:10]:
+        lines.append(f'error: {error}')
+    return '\n'.join(lines)
@@ -0,0 +1,493 @@
+"""
+Local stand-ins for the OpenAI Assistants API and for the Salesforce REST
+API, served as Quart apps so sassy can be exercised without any account.
+"""
+import asyncio
+from dataclasses import dataclass, field
+import itertools
+import json
+import socket
+import time
+from typing import Any, AsyncIterator
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
+from quart import Quart, Response, jsonify, request
+
+
+@dataclass
+class ToolCalls:
+    """a run step asking for the given (function name, arguments) calls"""
+    calls: list[tuple[str, dict[str, Any]]]
+
+
+@dataclass
+class Reply:
+    """a run step completing the run with an assistant message"""
+    text: str
+
+
+Step = ToolCalls | Reply
+
+DEFAULT_SCRIPT: list[Step] = [
+    ToolCalls([
+        ("querySalesforceRecords", {"q": "SELECT Id FROM Account LIMIT 5"}),
+        ("getWelcomeMessage", {}),
+    ]),
+    Reply("Here are your accounts."),
+]
+
+
+@dataclass
+class _Run:
+    id: str
+    thread_id: str
+    assistant_id: str
+    script: list[Step]
+    created_at: int
+    step: int = 0
+    status: str = "queued"
+    phase_started: float = field(default_factory=time.monotonic)
+    tool_calls: list[dict[str, Any]] = field(default_factory=list)
+
+
+class FakeOpenAI:
+    """
+    Assistants API fake.
+
+    Every run plays `script`: each step becomes available `think_time`
+    seconds after the run is created or after the previous tool outputs
+    were submitted, either as `requires_action` tool calls or as the final
+    assistant reply. Runs can be polled or streamed.
+    """
+    script: list[Step]
+    think_time: float
+    app: Quart
+    requests: dict[str, int]
+    """endpoint -> number of requests served"""
+    _ids: itertools.count
+    _assistants: dict[str, dict[str, Any]]
+    _messages: dict[str, list[dict[str, Any]]]
+    _runs: dict[str, _Run]
+
+    def __init__(
+            self,
+            script: list[Step] | None = None,
+            think_time: float = 0.0) -> None:
+        self.script = script if script is not None else DEFAULT_SCRIPT
+        self.think_time = think_time
+        self.requests = {}
+        self._ids = itertools.count(1)
+        self._assistants = {}
+        self._messages = {}
+        self._runs = {}
+        self.app = self._build_app()
+
+    def _id(self, prefix: str) -> str:
+        return f'{prefix}_{next(self._ids)}'
+
+    def _count(self, endpoint: str) -> None:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def _message(
+            self, thread_id: str, role: str, text: str,
+            run_id: str | None = None) -> dict[str, Any]:
+        return {
+            "id": self._id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "status": "completed",
+            "run_id": run_id,
+            "assistant_id": None,
+            "attachments": [],
+            "metadata": {},
+            "content": [{
+                "type": "text",
+                "text": {"value": text, "annotations": []},
+            }],
+        }
+
+    def _run_json(self, run: _Run) -> dict[str, Any]:
+        required_action = None
+        if run.status == "requires_action":
+            required_action = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": run.tool_calls},
+            }
+        return {
+            "id": run.id,
+            "object": "thread.run",
+            "created_at": run.created_at,
+            "thread_id": run.thread_id,
+            "assistant_id": run.assistant_id,
+            "status": run.status,
+            "required_action": required_action,
+            "model": "fake",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+
+    def _advance(self, run: _Run) -> None:
+        """
+        move a polled run to its next scripted step once it had time to
+        think
+        """
+        if run.status not in ("queued", "in_progress"):
+            return
+        if time.monotonic() - run.phase_started < self.think_time:
+            run.status = "in_progress"
+            return
+        self._next_step(run)
+
+    def _next_step(self, run: _Run) -> None:
+        match run.script[run.step]:
+            case ToolCalls(calls=calls):
+                run.status = "requires_action"
+                run.tool_calls = [{
+                    "id": self._id("call"),
+                    "type": "function",
+                    "function": {
+                        "name": name, "arguments": json.dumps(args)},
+                } for name, args in calls]
+            case Reply(text=text):
+                run.status = "completed"
+                self._messages[run.thread_id].insert(
+                    0, self._message(
+                        run.thread_id, "assistant", text, run.id))
+
+    async def _stream(self, run: _Run) -> AsyncIterator[str]:
+        def sse(event: str, data: Any) -> str:
+            return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+        if run.step == 0 and run.status == "queued":
+            yield sse("thread.run.created", self._run_json(run))
+        run.status = "in_progress"
+        yield sse("thread.run.in_progress", self._run_json(run))
+
+        await asyncio.sleep(self.think_time)
+        step = run.script[run.step]
+        self._next_step(run)
+
+        if isinstance(step, ToolCalls):
+            yield sse("thread.run.requires_action", self._run_json(run))
+        else:
+            message = self._messages[run.thread_id][0]
+            delta_message = {**message, "status": "in_progress",
+                             "content": []}
+            yield sse("thread.message.created", delta_message)
+            for i, word in enumerate(step.text.split(' ')):
+                yield sse("thread.message.delta", {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{
+                        "index": 0,
+                        "type": "text",
+                        "text": {"value": word if i == 0 else f' {word}'},
+                    }]},
+                })
+            yield sse("thread.message.completed", message)
+            yield sse("thread.run.completed", self._run_json(run))
+
+        yield 'event: done\ndata: [DONE]\n\n'
+
+    async def _respond(self, run: _Run, stream: bool) -> Response:
+        if not stream:
+            return jsonify(self._run_json(run))
+        response = Response(
+            self._stream(run), headers={'Content-Type': 'text/event-stream'})
+        response.timeout = None
+        return response
+
+    def _build_app(self) -> Quart:
+        app = Quart('fake_openai')
+
+        @app.post('/v1/assistants')
+        async def create_assistant():
+            self._count('assistants.create')
+            data = await request.get_json()
+            assistant = {
+                "id": self._id("asst"),
+                "object": "assistant",
+                "created_at": int(time.time()),
+                "name": None,
+                "description": None,
+                "metadata": {},
+                **data,
+            }
+            self._assistants[assistant["id"]] = assistant
+            return jsonify(assistant)
+
+        @app.get('/v1/assistants/<assistant_id>')
+        async def retrieve_assistant(assistant_id: str):
+            self._count('assistants.retrieve')
+            return jsonify(self._assistants[assistant_id])
+
+        @app.post('/v1/assistants/<assistant_id>')
+        async def update_assistant(assistant_id: str):
+            self._count('assistants.update')
+            self._assistants[assistant_id].update(await request.get_json())
+            return jsonify(self._assistants[assistant_id])
+
+        @app.post('/v1/threads')
+        async def create_thread():
+            self._count('threads.create')
+            thread_id = self._id("thread")
+            self._messages[thread_id] = []
+            return jsonify({
+                "id": thread_id,
+                "object": "thread",
+                "created_at": int(time.time()),
+                "metadata": {},
+            })
+
+        @app.post('/v1/threads/<thread_id>/messages')
+        async def create_message(thread_id: str):
+            self._count('messages.create')
+            data = await request.get_json()
+            message = self._message(thread_id, "user", data["content"])
+            self._messages.setdefault(thread_id, []).insert(0, message)
+            return jsonify(message)
+
+        @app.get('/v1/threads/<thread_id>/messages')
+        async def list_messages(thread_id: str):
+            self._count('messages.list')
+            data = self._messages.get(thread_id, [])
+            return jsonify({
+                "object": "list",
+                "data": data,
+                "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None,
+                "has_more": False,
+            })
+
+        @app.post('/v1/threads/<thread_id>/runs')
+        async def create_run(thread_id: str):
+            self._count('runs.create')
+            data = await request.get_json()
+            run = _Run(
+                id=self._id("run"),
+                thread_id=thread_id,
+                assistant_id=data["assistant_id"],
+                script=list(self.script),
+                created_at=int(time.time()))
+            self._messages.setdefault(thread_id, [])
+            self._runs[run.id] = run
+            return await self._respond(run, data.get("stream", False))
+
+        @app.get('/v1/threads/<thread_id>/runs/<run_id>')
+        async def retrieve_run(thread_id: str, run_id: str):
+            self._count('runs.retrieve')
+            run = self._runs[run_id]
+            self._advance(run)
+            return jsonify(self._run_json(run))
+
+        @app.post('/v1/threads/<thread_id>/runs/<run_id>/submit_tool_outputs')
+        async def submit_tool_outputs(thread_id: str, run_id: str):
+            self._count('runs.submit_tool_outputs')
+            data = await request.get_json()
+            run = self._runs[run_id]
+            expected = {call["id"] for call in run.tool_calls}
+            submitted = {out["tool_call_id"] for out in data["tool_outputs"]}
+            if run.status != "requires_action" or expected != submitted:
+                return jsonify({"error": {
+                    "message": "unexpected tool outputs",
+                    "type": "invalid_request_error"}}), 400
+
+            run.step += 1
+            run.status = "queued"
+            run.tool_calls = []
+            run.phase_started = time.monotonic()
+            return await self._respond(run, data.get("stream", False))
+
+        @app.post('/v1/threads/<thread_id>/runs/<run_id>/cancel')
+        async def cancel_run(thread_id: str, run_id: str):
+            self._count('runs.cancel')
+            run = self._runs[run_id]
+            run.status = "cancelled"
+            return jsonify(self._run_json(run))
+
+        return app
+
+
+class FakeSalesforce:
+    """
+    Salesforce REST fake serving the operations of `tmpl/api.json.j2`, each
+    answering after `latency` seconds.
+    """
+    latency: float
+    records: int
+    """number of records returned by queries"""
+    app: Quart
+    requests: dict[str, int]
+    """operation -> number of requests served"""
+    sessions: set[str] | None
+    """tokens issued by the OAuth token endpoint, once it is used the
+    other tokens are turned down with a 401"""
+    outage: tuple[int, Any] | None
+    """status and json body every request is answered with when set"""
+
+    def __init__(self, latency: float = 0.0, records: int = 5) -> None:
+        self.latency = latency
+        self.records = records
+        self.requests = {}
+        self.sessions = None
+        self.outage = None
+        self.app = self._build_app()
+
+    async def _serve(self, operation: str) -> None:
+        self.requests[operation] = self.requests.get(operation, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _build_app(self) -> Quart:
+        app = Quart('fake_salesforce')
+        ids = itertools.count(1)
+
+        @app.before_request
+        async def authenticate():
+            if self.outage is not None:
+                await self._serve('outage')
+                status, body = self.outage
+                return jsonify(body), status
+            if self.sessions is None \
+                    or request.path == '/services/oauth2/token':
+                return None
+            auth = request.headers.get('Authorization', '')
+            if auth.removeprefix('Bearer ') not in self.sessions:
+                return jsonify([{
+                    "message": "Session expired or invalid",
+                    "errorCode": "INVALID_SESSION_ID",
+                }]), 401
+            return None
+
+        @app.post('/services/oauth2/token')
+        async def token():
+            await self._serve('oauth2.token')
+            form = await request.form
+            if form.get('grant_type') != 'client_credentials' \
+                    or form.get('client_secret') != 'secret':
+                return jsonify({
+                    "error": "invalid_client",
+                    "error_description": "invalid client credentials",
+                }), 400
+            access_token = f'session{next(ids)}'
+            if self.sessions is None:
+                self.sessions = set()
+            self.sessions.add(access_token)
+            return jsonify({
+                "access_token": access_token,
+                "instance_url": request.host_url.rstrip('/'),
+                "token_type": "Bearer",
+            })
+
+        @app.get('/services/data/v59.0/sobjects/<sobject>')
+        async def get_object_metadata(sobject: str):
+            await self._serve('getObjectMetadata')
+            return jsonify({
+                "objectDescribe": {"name": sobject, "queryable": True},
+                "recentItems": [],
+            })
+
+        @app.post('/services/data/v59.0/sobjects/<sobject>')
+        async def post_sobject(sobject: str):
+            await self._serve(f'post{sobject}')
+            return jsonify({
+                "id": f'{sobject[:3]}{next(ids):015d}',
+                "success": True,
+                "errors": [],
+            }), 201
+
+        @app.get('/services/data/v59.0/query')
+        async def query():
+            await self._serve('querySalesforceRecords')
+            return jsonify({
+                "totalSize": self.records,
+                "done": True,
+                "records": [{
+                    "attributes": {"type": "Account"},
+                    "Id": f'001{i:015d}',
+                    "Name": f'Account {i}',
+                } for i in range(self.records)],
+            })
+
+        @app.post('/services/data/v59.0/composite')
+        async def composite():
+            await self._serve('composite')
+            client = app.test_client()
+            auth = request.headers.get('Authorization', '')
+            subresponses = []
+            for sub in (await request.get_json())["compositeRequest"]:
+                # subrequests run in the session of the composite request
+                resp = await client.open(
+                    sub["url"], method=sub["method"], json=sub.get("body"),
+                    headers={"Authorization": auth})
+                subresponses.append({
+                    "body": await resp.get_json(),
+                    "httpHeaders": {},
+                    "httpStatusCode": resp.status_code,
+                    "referenceId": sub["referenceId"],
+                })
+            return jsonify({"compositeResponse": subresponses})
+
+        @app.get('/services/apexrest/examples/welcome')
+        async def welcome():
+            await self._serve('getWelcomeMessage')
+            return jsonify({"message": "Welcome to Salesforce!"})
+
+        return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """
+    serves a Quart app on a free localhost port for the lifetime of the
+    `async with` block
+    """
+    app: Quart
+    port: int
+    _shutdown: asyncio.Event
+    _task: asyncio.Task | None
+
+    def __init__(self, app: Quart) -> None:
+        self.app = app
+        self.port = free_port()
+        self._shutdown = asyncio.Event()
+        self._task = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    async def __aenter__(self) -> 'LocalServer':
+        config = HypercornConfig()
+        config.bind = [f'127.0.0.1:{self.port}']
+        config.accesslog = None
+        config.errorlog = None
+        self._task = asyncio.create_task(serve(
+            self.app, config,  # type: ignore[arg-type]
+            shutdown_trigger=self._shutdown.wait))  # type: ignore[arg-type]
+
+        # wait for the port to accept connections
+        for _ in range(200):
+            try:
+                _, writer = await asyncio.open_connection(
+                    '127.0.0.1', self.port)
+                writer.close()
+                return self
+            except OSError:
+                await asyncio.sleep(0.01)
+        raise RuntimeError(f'{self.app.name} did not start')
+
+    async def __aexit__(self, *_) -> None:
+        self._shutdown.set()
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,132 @@
+"""
+Micro-benchmarks of the spec compilation on synthetic large specs.
+"""
+import json
+import statistics
+import time
+from typing import Any, Callable
+
+from sassy.data_model.oas import OpenAPI, Reference
+from sassy.functions import FunctionRegistry
+from sassy.oasx import as_json_schema
+
+
+def synthetic_spec(
+        operations: int = 2000,
+        schemas: int = 200,
+        properties: int = 10,
+        unused_schemas: int = 0) -> dict[str, Any]:
+    """
+    a spec of `operations` operations, alternating GETs with query params
+    and POSTs whose request body references one of `schemas` component
+    schemas. Component schemas nest a logarithmic chain of parents and
+    a shared leaf, `unused_schemas` more are never referenced.
+    """
+    components: dict[str, Any] = {}
+    for i in range(schemas + unused_schemas):
+        props: dict[str, Any] = {
+            f'field{j}': {'type': 'string', 'description': f'field {j}'}
+            for j in range(properties)}
+        if 0 < i < schemas:
+            props['parent'] = {'$ref': f'#/components/schemas/Object{i // 2}'}
+            props['tags'] = {
+                'type': 'array',
+                'items': {'$ref': '#/components/schemas/Object0'},
+            }
+        components[f'Object{i}'] = {
+            'type': 'object',
+            'description': f'object {i}',
+            'properties': props,
+        }
+
+    paths: dict[str, Any] = {}
+    for i in range(operations):
+        if i % 2:
+            op = {
+                'summary': f'create object {i}',
+                'operationId': f'postObject{i}',
+                'requestBody': {
+                    'description': 'the object',
+                    'content': {'application/json': {'schema': {
+                        '$ref': f'#/components/schemas/Object{i % schemas}',
+                    }}},
+                },
+                'responses': {'201': {'description': 'created'}},
+            }
+            paths[f'/objects/{i}'] = {'post': op}
+        else:
+            op = {
+                'summary': f'query objects {i}',
+                'operationId': f'getObject{i}',
+                'parameters': [{
+                    'name': f'q{j}', 'in': 'query', 'required': j == 0,
+                    'description': f'filter {j}',
+                    'schema': {'type': 'string'},
+                } for j in range(3)],
+                'responses': {'200': {'description': 'the objects'}},
+            }
+            paths[f'/objects/{i}'] = {'get': op}
+
+    return {
+        'openapi': '3.0.3',
+        'info': {'version': '1.0.0', 'title': 'synthetic'},
+        'servers': [{'url': 'https://example.com/services'}],
+        'paths': paths,
+        'components': {'schemas': components},
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def run_micro_benchmarks(
+        operations: int = 2000,
+        schemas: int = 200,
+        unused_schemas: int = 2000,
+        repeat: int = 3) -> dict[str, list[float]]:
+    spec_json = synthetic_spec(
+        operations, schemas, unused_schemas=unused_schemas)
+    spec_text = json.dumps(spec_json)
+    snapshot_text = json.dumps(
+        FunctionRegistry.from_openapi_spec(spec_text, None).dump_snapshot())
+    compiled = FunctionRegistry.from_openapi_spec(spec_text, None)
+    spec = OpenAPI(**spec_json)
+    refs = [Reference(**{'$ref': f'#/components/schemas/Object{i}'})
+            for i in range(schemas)]
+
+    def convert_all() -> None:
+        spec._ref_index = None
+        for ref in refs:
+            as_json_schema(spec, ref, None)
+
+    return {
+        'from_openapi_spec (text, lazy)': measure(
+            lambda: FunctionRegistry.from_openapi_spec(spec_text, None),
+            repeat),
+        'from_openapi_spec (parsed json)': measure(
+            lambda: FunctionRegistry.from_openapi_spec(
+                json.loads(spec_text), None),
+            repeat),
+        'reload_openapi_spec (unchanged)': measure(
+            lambda: compiled.reload_openapi_spec(spec_text, None), repeat),
+        'from_snapshot (text)': measure(
+            lambda: FunctionRegistry.from_snapshot(
+                json.loads(snapshot_text), None),
+            repeat),
+        'as_json_schema (all components)': measure(convert_all, repeat),
+    }
+
+
+def format_report(results: dict[str, list[float]]) -> str:
+    lines = [f'{"benchmark":<40}{"min ms":>10}{"median ms":>12}']
+    for name, times in results.items():
+        lines.append(
+            f'{name:<40}{min(times) * 1000:>10.1f}'
+            f'{statistics.median(times) * 1000:>12.1f}')
+    return '\n'.join(lines)
@@ -0,0 +1,143 @@
+import asyncio
+import math
+import time
+from typing import Callable
+
+
+DEFAULT_MAX_CONCURRENT_CHATS = 64
+DEFAULT_MAX_QUEUED_CHATS = 256
+
+
+class Overloaded(Exception):
+    """
+    raised when a chat cannot even wait for its turn, the caller should
+    come back after `retry_after` seconds
+    """
+    retry_after: int
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f'too many chats in flight, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class _ThreadLock:
+    lock: asyncio.Lock
+    users: int
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class Ticket:
+    """
+    a chat admitted to the queue, entering it waits for the thread and for
+    a free slot, leaving it lets the next chat in
+    """
+    _admission: 'AdmissionControl'
+    _thread_id: str
+    _started: float | None
+
+    def __init__(self, admission: 'AdmissionControl', thread_id: str) -> None:
+        self._admission = admission
+        self._thread_id = thread_id
+        self._started = None
+
+    async def __aenter__(self) -> 'Ticket':
+        admission = self._admission
+        thread = admission._threads[self._thread_id]
+        try:
+            await thread.lock.acquire()
+            try:
+                await admission._slots.acquire()
+            except BaseException:
+                thread.lock.release()
+                raise
+        except BaseException:
+            admission._waiting -= 1
+            admission._leave_thread(self._thread_id)
+            raise
+
+        admission._waiting -= 1
+        self._started = admission._clock()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        admission = self._admission
+        if self._started is not None:
+            admission._observe(admission._clock() - self._started)
+        admission._slots.release()
+        admission._threads[self._thread_id].lock.release()
+        admission._leave_thread(self._thread_id)
+
+
+class AdmissionControl:
+    """
+    Runs the chats of a thread one at a time in arrival order, since a
+    thread only takes one active run, and at most `max_concurrent` chats
+    overall. At most `max_queued` more may wait for their turn, beyond
+    that chats are turned away with an estimate of when to retry instead
+    of piling up.
+    """
+    max_concurrent: int
+    max_queued: int
+    _slots: asyncio.Semaphore
+    _threads: dict[str, _ThreadLock]
+    _waiting: int
+    _mean_duration: float
+    """moving average of the seconds a chat holds its slot"""
+    _clock: Callable[[], float]
+
+    def __init__(
+            self,
+            max_concurrent: int = DEFAULT_MAX_CONCURRENT_CHATS,
+            max_queued: int = DEFAULT_MAX_QUEUED_CHATS,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        assert max_concurrent > 0, "concurrency limit must be positive"
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._threads = {}
+        self._waiting = 0
+        self._mean_duration = 1.0
+        self._clock = clock
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def check(self, thread_id: str) -> None:
+        """
+        raises `Overloaded` when the queue of `thread_id` is full, without
+        taking a place in it
+        """
+        if self._waiting >= self.max_queued and (
+                self._slots.locked() or thread_id in self._threads):
+            raise Overloaded(self.retry_after())
+
+    def admit(self, thread_id: str) -> Ticket:
+        """
+        take a place in the queue of `thread_id`, raises `Overloaded` when
+        the queue is full. The place is only given back by entering and
+        leaving the ticket.
+        """
+        self.check(thread_id)
+        self._waiting += 1
+        self._threads.setdefault(thread_id, _ThreadLock()).users += 1
+        return Ticket(self, thread_id)
+
+    def retry_after(self) -> int:
+        """
+        seconds until the queue has likely drained enough to take a chat
+        """
+        rounds = (self._waiting + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._mean_duration))
+
+    def _observe(self, duration: float) -> None:
+        self._mean_duration += 0.1 * (duration - self._mean_duration)
+
+    def _leave_thread(self, thread_id: str) -> None:
+        thread = self._threads[thread_id]
+        thread.users -= 1
+        if thread.users == 0:
+            del self._threads[thread_id]
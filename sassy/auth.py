@@ -0,0 +1,256 @@
+"""
+Token providers, where the invokers get the bearer token of the calls that
+do not come with their own.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import time
+from typing import Any, Callable, Union
+
+import httpx
+
+from .cache import SingleFlight
+from .transport import HTTPTransport
+
+
+DEFAULT_LOGIN_URL = 'https://login.salesforce.com'
+DEFAULT_TOKEN_LIFETIME = 3600.0
+"""seconds a token is assumed to last when the token endpoint does not say,
+a token expiring earlier is caught by the 401 it gets"""
+DEFAULT_REFRESH_MARGIN = 60.0
+"""seconds before the expiry of a token its replacement is fetched"""
+JWT_ASSERTION_LIFETIME = 180
+"""seconds the JWT bearer assertion is valid, Salesforce allows 3 minutes"""
+
+
+class TokenProvider(ABC):
+    identity: str
+    """stable across token refreshes, keys the cached results of the calls
+    made with the tokens of this provider"""
+
+    @abstractmethod
+    async def token(self) -> str:
+        pass
+
+    @abstractmethod
+    def token_sync(self) -> str:
+        """
+        blocking counterpart of `token`
+        """
+
+    def invalidate(self, token: str) -> None:
+        """
+        `token` was turned down, the next call gets a fresh one
+        """
+
+
+Token = Union[str, TokenProvider, None]
+"""a static bearer token or where to get one from"""
+
+
+def as_token_provider(token: Token) -> TokenProvider | None:
+    if token is None or isinstance(token, TokenProvider):
+        return token
+    return StaticToken(token)
+
+
+class StaticToken(TokenProvider):
+    """
+    a token given once, such as `DEFAULT_ACCESS_TOKEN`, it cannot be
+    refreshed
+    """
+    _token: str
+
+    def __init__(self, token: str) -> None:
+        self._token = token
+        self.identity = token
+
+    async def token(self) -> str:
+        return self._token
+
+    def token_sync(self) -> str:
+        return self._token
+
+
+class OAuthTokenProvider(TokenProvider):
+    """
+    Fetches tokens from an OAuth token endpoint and caches them.
+
+    A token is served until `refresh_margin` seconds before it expires, from
+    then on it is still served while its replacement is fetched in the
+    background, so calls only wait for the token endpoint when the token is
+    missing or expired. Concurrent refreshes share one token request.
+    """
+    token_url: str
+    lifetime: float
+    refresh_margin: float
+    transport: HTTPTransport
+    _token: str | None
+    _expires_at: float
+    _flights: SingleFlight
+    _clock: Callable[[], float]
+
+    def __init__(
+            self,
+            login_url: str,
+            identity: str,
+            lifetime: float = DEFAULT_TOKEN_LIFETIME,
+            refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+            transport: HTTPTransport | None = None,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        self.token_url = f"{login_url.rstrip('/')}/services/oauth2/token"
+        self.identity = identity
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self.transport = transport if transport else HTTPTransport()
+        self._token = None
+        self._expires_at = 0.0
+        self._flights = SingleFlight()
+        self._clock = clock
+
+    @abstractmethod
+    def grant(self) -> dict[str, str]:
+        """
+        the form of the token request
+        """
+
+    def _store(self, resp: httpx.Response) -> str:
+        if resp.is_error:
+            raise PermissionError(
+                f'token request to {self.token_url} failed with '
+                f'{resp.status_code}: {resp.text}')
+        data: dict[str, Any] = resp.json()
+        self._token = data["access_token"]
+        self._expires_at = self._clock() + float(
+            data.get("expires_in", self.lifetime))
+        return data["access_token"]
+
+    async def _fetch(self) -> str:
+        client = self.transport.async_client(self.token_url)
+        return self._store(
+            await client.post(self.token_url, data=self.grant()))
+
+    def _fetch_sync(self) -> str:
+        client = self.transport.client(self.token_url)
+        return self._store(client.post(self.token_url, data=self.grant()))
+
+    def _refresh_in_background(self) -> None:
+        task = asyncio.ensure_future(self._flights.do('token', self._fetch))
+        # a failed early refresh is retried by the next call
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def token(self) -> str:
+        now = self._clock()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._expires_at - self.refresh_margin:
+                self._refresh_in_background()
+            return self._token
+        return await self._flights.do('token', self._fetch)
+
+    def token_sync(self) -> str:
+        if self._token is not None and self._clock() < self._expires_at:
+            return self._token
+        return self._flights.do_sync('token', self._fetch_sync)
+
+    def invalidate(self, token: str) -> None:
+        # calls turned down together only drop the token once
+        if token == self._token:
+            self._token = None
+
+
+class ClientCredentialsProvider(OAuthTokenProvider):
+    """
+    tokens of the OAuth client credentials flow, the calls run as the user
+    the connected app is set to run as
+    """
+    client_id: str
+    _client_secret: str
+
+    def __init__(
+            self,
+            client_id: str,
+            client_secret: str,
+            login_url: str = DEFAULT_LOGIN_URL,
+            **kwargs: Any) -> None:
+        super().__init__(login_url, f'client:{client_id}', **kwargs)
+        self.client_id = client_id
+        self._client_secret = client_secret
+
+    def grant(self) -> dict[str, str]:
+        return {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self._client_secret,
+        }
+
+
+class JWTBearerProvider(OAuthTokenProvider):
+    """
+    tokens of the OAuth JWT bearer flow, the calls run as `username`. The
+    assertion is signed with `private_key`, which needs `pyjwt` with its
+    `crypto` extra.
+    """
+    client_id: str
+    username: str
+    audience: str
+    _private_key: str
+
+    def __init__(
+            self,
+            client_id: str,
+            username: str,
+            private_key: str,
+            login_url: str = DEFAULT_LOGIN_URL,
+            **kwargs: Any) -> None:
+        try:
+            import jwt  # type: ignore[import]  # noqa: F401
+        except ImportError as e:
+            # fail early rather than on the first grant
+            raise ImportError(
+                'the JWT bearer flow needs pyjwt[crypto], install sassy '
+                'with the jwt extra') from e
+
+        super().__init__(login_url, f'jwt:{client_id}:{username}', **kwargs)
+        self.client_id = client_id
+        self.username = username
+        self.audience = login_url.rstrip('/')
+        self._private_key = private_key
+
+    def grant(self) -> dict[str, str]:
+        import jwt  # type: ignore[import]
+
+        assertion = jwt.encode({
+            "iss": self.client_id,
+            "sub": self.username,
+            "aud": self.audience,
+            "exp": int(time.time()) + JWT_ASSERTION_LIFETIME,
+        }, self._private_key, algorithm="RS256")
+        return {
+            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+            "assertion": assertion,
+        }
+
+
+def token_from_settings(
+        access_token: str | None = None,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        username: str | None = None,
+        private_key_file: str | None = None,
+        login_url: str | None = None,
+        transport: HTTPTransport | None = None) -> Token:
+    """
+    an OAuth token provider when a connected app is given, with a private
+    key for the JWT bearer flow and a secret for the client credentials
+    one, `access_token` otherwise
+    """
+    login_url = login_url or DEFAULT_LOGIN_URL
+    if client_id and username and private_key_file:
+        with open(private_key_file) as key:
+            return JWTBearerProvider(
+                client_id, username, key.read(), login_url,
+                transport=transport)
+    if client_id and client_secret:
+        return ClientCredentialsProvider(
+            client_id, client_secret, login_url, transport=transport)
+    return access_token
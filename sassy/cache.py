@@ -0,0 +1,156 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar('T')
+
+
+def bearer_fingerprint(bearer: str | None) -> str:
+    """
+    a stable digest of a bearer token, used in place of the token itself
+    wherever the caller identity needs to be part of a key
+    """
+    if not bearer:
+        return ""
+    return hashlib.sha256(bearer.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of invocation results with a per-entry TTL.
+
+    Entries are keyed by `ResponseCache.key`, which includes a fingerprint
+    of the bearer token so callers with different credentials never share
+    results.
+    """
+    max_size: int
+    hits: int
+    misses: int
+    _entries: OrderedDict[str, tuple[float, Any]]
+    """key -> (expires at, value)"""
+    _clock: Callable[[], float]
+    _lock: threading.Lock
+
+    def __init__(
+            self,
+            max_size: int,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        assert max_size > 0, "cache size must be positive"
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+            method: str,
+            url: str,
+            params: dict[str, Any],
+            bearer: str | None) -> str:
+        return json.dumps(
+            [method, url, params, bearer_fingerprint(bearer)],
+            sort_keys=True, default=str)
+
+    def lookup(self, key: str) -> tuple[bool, Any]:
+        """
+        returns (True, value) on a hit and (False, None) otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key into a single execution.
+
+    The first caller of a key runs the call, every caller arriving while it
+    is in flight waits for and receives the same result (or exception).
+    """
+    coalesced: int
+    """number of calls served by another caller's execution"""
+    _inflight: dict[str, asyncio.Task]
+    _sync_inflight: dict[str, Future]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._inflight = {}
+        self._sync_inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(ident: str, bearer: str | None, kwargs: dict[str, Any]) -> str:
+        return json.dumps(
+            [ident, bearer_fingerprint(bearer), kwargs],
+            sort_keys=True, default=str)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def done(t: asyncio.Task) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+
+            task.add_done_callback(done)
+
+        # a cancelled waiter must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def do_sync(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._sync_inflight.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                self._sync_inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._sync_inflight[key]
+
+        return future.result()
@@ -0,0 +1,71 @@
+"""
+Salesforce Composite API, several REST requests to the same org sent as one
+`/composite` request, see
+https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_composite.htm
+"""
+import re
+from typing import Any
+
+import httpx
+
+
+COMPOSITE_LIMIT = 25
+"""subrequests a single composite request may carry"""
+
+COMPOSITE_QUERY_LIMIT = 5
+"""query and sObject Collections subrequests a single composite request may
+carry"""
+
+_DATA_API = re.compile(r'^(https?://[^/]+)(/services/data/v\d+\.\d+)/')
+_QUERY_RESOURCE = re.compile(
+    r'^https?://[^/]+/services/data/v\d+\.\d+/'
+    r'(query|queryAll|composite/sobjects)(/|$)')
+
+
+def composite_url(endpoint: str) -> str | None:
+    """
+    the composite resource of the org and API version `endpoint` belongs
+    to, None for the resources the composite API does not reach, such as
+    Apex REST
+    """
+    m = _DATA_API.match(endpoint)
+    if m is None:
+        return None
+    return f'{m[1]}{m[2]}/composite'
+
+
+def counts_as_query(endpoint: str) -> bool:
+    """
+    whether a subrequest to `endpoint` counts against
+    `COMPOSITE_QUERY_LIMIT`
+    """
+    return _QUERY_RESOURCE.match(endpoint) is not None
+
+
+def subrequest_url(url: str, params: dict[str, Any]) -> str:
+    """
+    the server relative url of a subrequest, query included
+    """
+    return httpx.URL(url, params=params).raw_path.decode('ascii')
+
+
+async def send_composite(
+        client: httpx.AsyncClient,
+        url: str,
+        headers: dict[str, str],
+        subrequests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    send `subrequests` as one composite request, returns the subresponses
+    in the order of the subrequests. They do not depend on each other, one
+    failing leaves the others alone.
+    """
+    assert len(subrequests) <= COMPOSITE_LIMIT, \
+        f"at most {COMPOSITE_LIMIT} subrequests per composite request"
+    resp = await client.post(url, headers=headers, json={
+        "allOrNone": False,
+        "compositeRequest": subrequests,
+    })
+    resp.raise_for_status()
+    by_reference = {
+        sub["referenceId"]: sub for sub in resp.json()["compositeResponse"]}
+    return [by_reference[sub["referenceId"]] for sub in subrequests]
@@ -6,13 +6,37 @@ class Config:
     OPENAI_API_KEY: str
     DEFAULT_ACCESS_TOKEN: str | None
     SF_DOMAIN: str | None
+    SF_LOGIN_URL: str | None
+    SF_CLIENT_ID: str | None
+    """consumer key of the connected app, tokens are fetched with OAuth
+    instead of using `DEFAULT_ACCESS_TOKEN` when set"""
+    SF_CLIENT_SECRET: str | None
+    """for the client credentials flow"""
+    SF_USERNAME: str | None
+    SF_PRIVATE_KEY_FILE: str | None
+    """for the JWT bearer flow, along with `SF_USERNAME`"""
+    ADMIN_TOKEN: str | None
+    """bearer token of the admin routes, which only answer local callers
+    when unset"""
 
     def __init__(
-            self, openai_api_key: str, sf_access_token: str,
-            sf_domain: str | None) -> None:
+            self, openai_api_key: str, sf_access_token: str | None,
+            sf_domain: str | None,
+            sf_login_url: str | None = None,
+            sf_client_id: str | None = None,
+            sf_client_secret: str | None = None,
+            sf_username: str | None = None,
+            sf_private_key_file: str | None = None,
+            admin_token: str | None = None) -> None:
         self.OPENAI_API_KEY = openai_api_key
         self.DEFAULT_ACCESS_TOKEN = sf_access_token
         self.SF_DOMAIN = sf_domain
+        self.SF_LOGIN_URL = sf_login_url
+        self.SF_CLIENT_ID = sf_client_id
+        self.SF_CLIENT_SECRET = sf_client_secret
+        self.SF_USERNAME = sf_username
+        self.SF_PRIVATE_KEY_FILE = sf_private_key_file
+        self.ADMIN_TOKEN = admin_token
 
     @classmethod
     def from_env(cls) -> 'Config':
@@ -20,6 +44,12 @@ class Config:
 
         return cls(
             openai_api_key=os.environ["OPENAI_API_KEY"],
-            sf_access_token=os.environ["DEFAULT_ACCESS_TOKEN"],
-            sf_domain=os.environ.get("SF_DOMAIN", None)
+            sf_access_token=os.environ.get("DEFAULT_ACCESS_TOKEN", None),
+            sf_domain=os.environ.get("SF_DOMAIN", None),
+            sf_login_url=os.environ.get("SF_LOGIN_URL", None),
+            sf_client_id=os.environ.get("SF_CLIENT_ID", None),
+            sf_client_secret=os.environ.get("SF_CLIENT_SECRET", None),
+            sf_username=os.environ.get("SF_USERNAME", None),
+            sf_private_key_file=os.environ.get("SF_PRIVATE_KEY_FILE", None),
+            admin_token=os.environ.get("ADMIN_TOKEN", None)
         )
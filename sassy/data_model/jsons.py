@@ -1,5 +1,7 @@
-from typing import Literal
-from pydantic import BaseModel
+import hashlib
+import json
+from typing import Any, Iterable, Literal
+from pydantic import BaseModel, SerializeAsAny
 
 
 class JsonSchema(BaseModel):
@@ -15,7 +17,8 @@ class JsonObject(JsonSchema):
             "string",
             "boolean",
             "null"] = "object"
-    properties: dict[str, JsonSchema]
+    # serialize nested schemas with their own fields, not JsonSchema's
+    properties: dict[str, SerializeAsAny[JsonSchema]]
     required: list[str] = []
 
 
@@ -27,7 +30,7 @@ class JsonArray(JsonSchema):
             "string",
             "boolean",
             "null"] = "array"
-    items: JsonSchema
+    items: SerializeAsAny[JsonSchema]
 
 
 class JsonNumber(JsonSchema):
@@ -68,3 +71,125 @@ class JsonNull(JsonSchema):
             "string",
             "boolean",
             "null"] = "null"
+
+
+def _dump_fields(
+        schema: JsonSchema, children: dict[str, Any]) -> dict[str, Any]:
+    data: dict[str, Any] = {"type": schema.type}
+    if schema.description is not None:
+        data["description"] = schema.description
+    data.update(children)
+    return data
+
+
+class SharedSchemas:
+    """
+    Dumps json schemas keeping the subtrees they share shared: an object or
+    array schema found more than once is dumped a single time, under the
+    content hash of its dump, and stands as {"$ref": hash} wherever it
+    appears.
+    """
+    schemas: dict[str, dict[str, Any]]
+    """hash -> dump of each shared schema"""
+    _counts: dict[int, int]
+    """id -> times each schema object is met"""
+    _refs: dict[int, dict[str, str]]
+
+    def __init__(self, roots: Iterable[JsonSchema]) -> None:
+        self.schemas = {}
+        self._counts = {}
+        self._refs = {}
+        for root in roots:
+            self._count(root)
+
+    def _count(self, schema: JsonSchema) -> None:
+        # a reference takes as much room as a scalar schema
+        if not isinstance(schema, (JsonObject, JsonArray)):
+            return
+        seen = self._counts.get(id(schema), 0)
+        self._counts[id(schema)] = seen + 1
+        # what a shared schema holds is counted once, with the schema
+        if seen:
+            return
+        if isinstance(schema, JsonObject):
+            for prop in schema.properties.values():
+                self._count(prop)
+        elif isinstance(schema, JsonArray):
+            self._count(schema.items)
+
+    def dump(self, schema: JsonSchema) -> dict[str, Any]:
+        """
+        the dump of `schema`, one of the roots or a part of them
+        """
+        if self._counts.get(id(schema), 0) < 2:
+            return self._dump(schema)
+        ref = self._refs.get(id(schema))
+        if ref is None:
+            data = self._dump(schema)
+            key = hashlib.sha256(json.dumps(
+                data, sort_keys=True, separators=(',', ':')).encode()
+            ).hexdigest()
+            self.schemas[key] = data
+            ref = self._refs[id(schema)] = {"$ref": key}
+        return ref
+
+    def _dump(self, schema: JsonSchema) -> dict[str, Any]:
+        if isinstance(schema, JsonObject):
+            return _dump_fields(schema, {
+                "properties": {
+                    name: self.dump(prop)
+                    for name, prop in schema.properties.items()},
+                "required": schema.required,
+            })
+        if isinstance(schema, JsonArray):
+            return _dump_fields(schema, {"items": self.dump(schema.items)})
+        return _dump_fields(schema, {})
+
+
+def json_schema_from_dict(
+        data: dict[str, Any],
+        shared: dict[str, dict[str, Any]] | None = None,
+        built: dict[str, JsonSchema] | None = None) -> JsonSchema:
+    """
+    rebuild a json schema from its `model_dump`, trusting the input instead
+    of validating it again. References to the `shared` schemas of
+    `SharedSchemas` are rebuilt once into `built` and shared again.
+    """
+    ref = data.get("$ref")
+    if ref is not None:
+        if shared is None:
+            raise ValueError(f"unknown shared json schema {ref}")
+        if built is None:
+            built = {}
+        schema = built.get(ref)
+        if schema is None:
+            schema = built[ref] = json_schema_from_dict(
+                shared[ref], shared, built)
+        return schema
+
+    match data.get("type"):
+        case "object":
+            return JsonObject.model_construct(
+                description=data.get("description"),
+                properties={
+                    name: json_schema_from_dict(prop, shared, built)
+                    for name, prop in data.get("properties", {}).items()},
+                required=data.get("required", []))
+        case "array":
+            return JsonArray.model_construct(
+                description=data.get("description"),
+                items=json_schema_from_dict(data["items"], shared, built))
+        case "number":
+            return JsonNumber.model_construct(
+                description=data.get("description"))
+        case "string":
+            return JsonString.model_construct(
+                description=data.get("description"))
+        case "boolean":
+            return JsonBoolean.model_construct(
+                description=data.get("description"))
+        case "null":
+            return JsonNull.model_construct(
+                description=data.get("description"))
+        case other:
+            raise ValueError(f"unexpected json schema type {other}")
@@ -1,6 +1,6 @@
 from enum import StrEnum
-from typing import Literal, Union
-from pydantic import BaseModel, Field
+from typing import Any, Literal, Union
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class Server(BaseModel):
@@ -60,12 +60,68 @@ class RequestBody(BaseModel):
     required: bool = False
 
 
+class OutputShape(BaseModel):
+    """how the result of an operation is cut down before reaching the model,
+    the steps apply in the order of the fields"""
+    select: str | None = None
+    """JSONPath of the part of the response to keep, e.g. `$.records`"""
+    fields: list[str] | None = None
+    """fields kept in each record"""
+    exclude: list[str] | None = None
+    """fields dropped from each record"""
+    max_records: int | None = Field(default=None, alias="maxRecords")
+    """records kept, the rest of the page is dropped but the pagination
+    cursor is kept"""
+    max_bytes: int | None = Field(default=None, alias="maxBytes")
+    """bytes of the response body read at most, records past the budget
+    are never decoded"""
+    records_key: str = Field(default="records", alias="recordsKey")
+    """member holding the records when the response is an object"""
+
+
+class UpstreamPolicy(BaseModel):
+    """how the calls of an operation share the capacity of their host"""
+    max_concurrency: int | None = Field(default=None, alias="maxConcurrency")
+    """calls of the operation in flight at once, within the adaptive limit
+    of the host"""
+    adaptive: bool = True
+    """whether the calls count against the adaptive limit of the host"""
+    circuit_breaker: bool = Field(default=True, alias="circuitBreaker")
+    """whether the calls fail fast while the circuit of the host is open,
+    they feed it either way"""
+
+
+class RetryPolicy(BaseModel):
+    """how the calls of a GET operation are retried and hedged against a
+    slow or failing host"""
+    max_attempts: int = Field(default=1, alias="maxAttempts")
+    """attempts at a call failing with a timeout, a connection error or a
+    429, 502, 503 or 504, the first included"""
+    backoff: float = 0.2
+    """seconds of the first backoff, doubling with each attempt and drawn
+    at random up to that"""
+    max_backoff: float = Field(default=5.0, alias="maxBackoff")
+    timeout: float | None = None
+    """seconds an attempt may take before it is given up on and retried"""
+    hedge: bool = False
+    """whether a second request goes out when the first one takes longer
+    than the observed p95 latency of the operation, the first answer wins"""
+    hedge_after: float | None = Field(default=None, alias="hedgeAfter")
+    """seconds before hedging until enough latencies are observed"""
+
+
 class Operation(BaseModel):
     summary: str | None = None
     operation_id: str | None = Field(alias="operationId")
     parameters: list[Union[Parameter, Reference]] | None = None
     request_body: RequestBody | Reference | None = Field(
         default=None, alias="requestBody")
+    cache_ttl: float | None = Field(default=None, alias="x-sassy-cache-ttl")
+    """seconds a GET result may be served from the response cache"""
+    output: OutputShape | None = Field(default=None, alias="x-sassy-output")
+    upstream: UpstreamPolicy | None = Field(
+        default=None, alias="x-sassy-upstream")
+    retry: RetryPolicy | None = Field(default=None, alias="x-sassy-retry")
 
 
 class PathItem(BaseModel):
@@ -90,3 +146,7 @@ class OpenAPI(BaseModel):
     servers: list[Server]
     paths: Paths
     components: Components
+
+    _ref_index: Any = PrivateAttr(default=None)
+    """`oasx.ReferenceIndex` of the components, see
+    `oasx.reference_index`"""
@@ -1,80 +1,507 @@
 from abc import ABC, abstractmethod
-from typing import Any, Literal, Union
+import asyncio
+import contextlib
+import copy
+import hashlib
+import json
+from typing import Any, AsyncContextManager, ContextManager, Literal, Union
 
+import httpx
 from pydantic import BaseModel
-import requests
 
-from .oasx import as_json_schema, resolve_reference_parameter, \
-        resolve_reference_requestbody, resolve_reference_schema
-from .data_model.jsons import JsonObject, JsonSchema
-from .data_model.oas import OpenAPI, Operation, Parameter, \
-    ParameterLocation, Reference, RequestBody, Schema
+from .auth import Token, TokenProvider, as_token_provider
+from .cache import ResponseCache, SingleFlight
+from .composite import COMPOSITE_LIMIT, COMPOSITE_QUERY_LIMIT, \
+    composite_url, counts_as_query, send_composite, subrequest_url
+from .oasx import as_json_schema, reference_index, \
+        resolve_reference_parameter, resolve_reference_requestbody
+from .data_model.jsons import JsonObject, JsonSchema, SharedSchemas, \
+        json_schema_from_dict
+from .data_model.oas import OpenAPI, Operation, OutputShape, Parameter, \
+    ParameterLocation, PathItem, Reference, RequestBody, RetryPolicy, \
+    Schema, UpstreamPolicy
+from .metrics import ToolCallObservation
+from .output import aread_limited, decode_body, read_limited, shape_output
+from .plan import InvalidArguments, InvocationPlan
+from .retry import LatencyWindow, retrying
+from .spec_loader import LazySpec
+from .transport import HTTPTransport
+from .upstream import CircuitOpen, Outcome
 
 
 class FunctionInvoker(ABC):
 
     @abstractmethod
-    def invoke(self, bearer: str | None, **kwargs) -> str:
+    def invoke(self, bearer: str | None, **kwargs) -> Any:
         pass
 
+    @property
+    def idempotent(self) -> bool:
+        """
+        whether identical invocations may share a single upstream call
+        """
+        return False
+
+    def dump_snapshot(self) -> dict[str, Any]:
+        """
+        export everything needed to rebuild this invoker as a json object,
+        except secrets and shared resources
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support snapshots")
+
+    async def ainvoke(self, bearer: str | None, **kwargs) -> Any:
+        """
+        async counterpart of `invoke`, invokers without a native async
+        implementation are run in a worker thread
+        """
+        return await asyncio.to_thread(self.invoke, bearer, **kwargs)
+
 
 Method = Literal["get", "post", "put", "delete", "patch"]
 
+TRANSIENT_STATUSES = frozenset({429, 502, 503, 504})
+
+
+def _transient(attempt: tuple[httpx.Response, Any] | BaseException) -> bool:
+    """
+    whether a failed attempt may well succeed when made again
+    """
+    if isinstance(attempt, BaseException):
+        return isinstance(attempt, (httpx.TransportError, TimeoutError))
+    resp, _ = attempt
+    return resp.status_code in TRANSIENT_STATUSES
+
 
 class RESTFunctionInvoker(FunctionInvoker):
     endpoint: str
     method: Method
     params_in: dict[str, ParameterLocation]
-    # bearer token, later proabably need to implement some kind of
-    # token/security providers, this is the fallback option if the token is not
-    # provided by request
-    security: str | None
+    security: TokenProvider | None
+    """where the bearer token comes from when the call does not bring its
+    own"""
+    transport: HTTPTransport
+    cache: ResponseCache | None
+    cache_ttl: float | None
+    """seconds a successful GET result is served from `cache`, caching is
+    off for the operation when unset"""
+    operation_id: str | None
+    """the operation invoked, labels the tool call metrics"""
+    output: OutputShape | None
+    """how the result is cut down before it is returned"""
+    plan: InvocationPlan
+    """the request of a call, compiled from the endpoint and parameters"""
+    upstream: UpstreamPolicy | None
+    """how the calls share the capacity of the host"""
+    _semaphore: asyncio.Semaphore | None
+    """bounds the calls in flight when the policy says so"""
+    retry: RetryPolicy | None
+    """how failing or slow calls are retried and hedged, GET only"""
+    latencies: LatencyWindow
+    """of the last calls, when to hedge"""
+    server_url: str | None
+    """the server `endpoint` starts with, what a tenant replaces"""
 
     def __init__(
             self,
             endpoint: str,
             method: Method,
             params_in: dict[str, ParameterLocation],
-            security: str | None) -> None:
+            security: Token,
+            transport: HTTPTransport,
+            cache: ResponseCache | None = None,
+            cache_ttl: float | None = None,
+            operation_id: str | None = None,
+            output: OutputShape | None = None,
+            parameters: JsonSchema | None = None,
+            upstream: UpstreamPolicy | None = None,
+            retry: RetryPolicy | None = None,
+            server_url: str | None = None) -> None:
         self.endpoint = endpoint
         self.method = method
         self.params_in = params_in
-        self.security = security
-
-    def _prep_request(self, bearer: str | None, **kwargs):
-        params = {}
-        request_body = {}
-        headers = {}
-        url = self.endpoint
-        for k, v in kwargs.items():
-            match self.params_in.get(k, None):
-                case ParameterLocation.QUERY:
-                    params[k] = v
-                case ParameterLocation.PATH:
-                    url = url.format(k=v)
-                case ParameterLocation.HEADER | ParameterLocation.COOKIE:
-                    raise NotImplementedError("Invalid parameter")
-                case _:
-                    request_body[k] = v
+        self.security = as_token_provider(security)
+        self.transport = transport
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.operation_id = operation_id
+        self.output = output
+        self.plan = InvocationPlan(endpoint, params_in, parameters)
+        self.upstream = upstream
+        self._semaphore = asyncio.Semaphore(upstream.max_concurrency) \
+            if upstream and upstream.max_concurrency else None
+        self.retry = retry
+        self.latencies = LatencyWindow()
+        self.server_url = server_url
+
+    @property
+    def idempotent(self) -> bool:
+        return self.method == "get"
+
+    def _request_args(self, **kwargs) -> dict[str, Any]:
+        url, params, body, headers = self.plan.request(kwargs)
+        args: dict[str, Any] = {
+            "method": self.method.upper(),
+            "url": url,
+            "params": params,
+            "headers": headers,
+        }
+        if self.method != "get":
+            args["json"] = body
+        return args
+
+    def _observed_args(
+            self,
+            call: ToolCallObservation,
+            kwargs: dict[str, Any]) -> dict[str, Any]:
+        try:
+            return self._request_args(**kwargs)
+        except InvalidArguments:
+            call.status = "invalid"
+            raise
+
+    @staticmethod
+    def _auth_headers(token: str | None) -> dict[str, str]:
+        return {"Authorization": f"Bearer {token}"} if token else {}
 
+    def _authorized(
+            self, args: dict[str, Any], token: str | None) -> dict[str, Any]:
+        return {**args, "headers": {
+            **args["headers"], **self._auth_headers(token)}}
+
+    async def _token(self, bearer: str | None) -> str | None:
+        if bearer:
+            return bearer
+        return await self.security.token() if self.security else None
+
+    def _identity(self, bearer: str | None) -> str | None:
         if bearer:
-            headers = {"Authorization": f"Bearer {bearer}"}
-        elif self.security:
-            headers = {"Authorization": f"Bearer {self.security}"}
-        return params, request_body, url, headers
-
-    def invoke(self, bearer: str | None, **kwargs) -> str:
-        match self.method:
-            case "get":
-                params, _, url, headers = self._prep_request(bearer, **kwargs)
-                return requests.get(url, params=params, headers=headers).json()
-            case "post":
-                params, body, url, headers = self._prep_request(
-                        bearer, **kwargs)
-                return requests.post(
-                        url, params=params, json=body, headers=headers).json()
-
-        raise NotImplementedError("not all methods are implemented yet")
+            return bearer
+        return self.security.identity if self.security else None
+
+    def _retry_token(self, bearer: str | None, token: str | None) -> bool:
+        """
+        whether a call turned down with `token` is worth another try
+        """
+        if bearer or self.security is None or token is None:
+            return False
+        self.security.invalidate(token)
+        return True
+
+    def _cache_key(
+            self, bearer: str | None, args: dict[str, Any]) -> str | None:
+        if self.cache is None or not self.cache_ttl or self.method != "get":
+            return None
+        return ResponseCache.key(
+            self.method, args["url"], args["params"], self._identity(bearer))
+
+    def _cache_lookup(self, key: str | None) -> tuple[bool, Any]:
+        if key is None or self.cache is None:
+            return False, None
+        return self.cache.lookup(key)
+
+    def _cache_store(
+            self, key: str | None, success: bool, result: Any) -> None:
+        if key is None or self.cache is None or not self.cache_ttl:
+            return
+        if success:
+            self.cache.put(key, result, self.cache_ttl)
+
+    def invoke(self, bearer: str | None, **kwargs) -> Any:
+        with self.transport.observe(self.operation_id) as call:
+            args = self._observed_args(call, kwargs)
+            key = self._cache_key(bearer, args)
+            hit, result = self._cache_lookup(key)
+            if hit:
+                call.status = "cached"
+                return result
+
+            try:
+                with self._slot_sync() as outcome:
+                    resp, result = self._send_authorized(args, bearer, call)
+                    outcome.observe(resp.status_code, result)
+            except CircuitOpen:
+                call.status = "circuit_open"
+                raise
+            self._cache_store(key, resp.is_success, result)
+            return result
+
+    async def ainvoke(self, bearer: str | None, **kwargs) -> Any:
+        with self.transport.observe(self.operation_id) as call:
+            args = self._observed_args(call, kwargs)
+            key = self._cache_key(bearer, args)
+            hit, result = self._cache_lookup(key)
+            if hit:
+                call.status = "cached"
+                return result
+
+            try:
+                resp, result = await self._aretrying(args, bearer, call)
+            except CircuitOpen:
+                call.status = "circuit_open"
+                raise
+            self._cache_store(key, resp.is_success, result)
+            return result
+
+    async def _attempt(
+            self,
+            args: dict[str, Any],
+            bearer: str | None,
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        async with self._slot() as outcome:
+            resp, result = await self._asend_authorized(args, bearer, call)
+            outcome.observe(resp.status_code, result)
+        return resp, result
+
+    async def _aretrying(
+            self,
+            args: dict[str, Any],
+            bearer: str | None,
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        """
+        the attempts at a call following the retry policy, the blocking
+        path makes a single attempt
+        """
+        if self.retry is None or not self.idempotent:
+            return await self._attempt(args, bearer, call)
+        guard = self.transport.guard(self.endpoint)
+        return await retrying(
+            lambda: self._attempt(args, bearer, call),
+            self.retry,
+            self.latencies,
+            guard.budget if guard else None,
+            _transient)
+
+    def _slot(self) -> AsyncContextManager[Outcome]:
+        guard = self.transport.guard(self.endpoint)
+        if guard is None:
+            return contextlib.nullcontext(Outcome())
+        return guard.slot(self.upstream, self._semaphore)
+
+    def _slot_sync(self) -> ContextManager[Outcome]:
+        guard = self.transport.guard(self.endpoint)
+        if guard is None:
+            return contextlib.nullcontext(Outcome())
+        return guard.slot_sync(self.upstream)
+
+    def _send_authorized(
+            self,
+            args: dict[str, Any],
+            bearer: str | None,
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        token = bearer if bearer else \
+            self.security.token_sync() if self.security else None
+        resp, result = self._send(self._authorized(args, token), call)
+        if resp.status_code == 401 and self._retry_token(bearer, token):
+            assert self.security is not None
+            token = self.security.token_sync()
+            resp, result = self._send(self._authorized(args, token), call)
+        return resp, result
+
+    async def _asend_authorized(
+            self,
+            args: dict[str, Any],
+            bearer: str | None,
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        token = await self._token(bearer)
+        resp, result = await self._asend(self._authorized(args, token), call)
+        if resp.status_code == 401 and self._retry_token(bearer, token):
+            assert self.security is not None
+            token = await self.security.token()
+            resp, result = await self._asend(
+                self._authorized(args, token), call)
+        return resp, result
+
+    def _shape(
+            self, result: Any, truncated: bool, success: bool = True) -> Any:
+        # error bodies reach the model as they are
+        if self.output is None or not success:
+            return result
+        return shape_output(result, self.output, truncated)
+
+    def _send(
+            self,
+            args: dict[str, Any],
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        client = self.transport.client(args["url"])
+        if self.output is None or self.output.max_bytes is None:
+            resp = client.request(**args)
+            call.status = str(resp.status_code)
+            return resp, self._shape(resp.json(), False, resp.is_success)
+
+        # past the byte budget the rest of the body is never read
+        with client.stream(**args) as resp:
+            call.status = str(resp.status_code)
+            body, complete = read_limited(
+                resp.iter_bytes(), self.output.max_bytes)
+        return resp, self._shape(
+            *decode_body(body, complete), resp.is_success)
+
+    async def _asend(
+            self,
+            args: dict[str, Any],
+            call: ToolCallObservation) -> tuple[httpx.Response, Any]:
+        client = self.transport.async_client(args["url"])
+        if self.output is None or self.output.max_bytes is None:
+            resp = await client.request(**args)
+            call.status = str(resp.status_code)
+            return resp, self._shape(resp.json(), False, resp.is_success)
+
+        async with client.stream(**args) as resp:
+            call.status = str(resp.status_code)
+            body, complete = await aread_limited(
+                resp.aiter_bytes(), self.output.max_bytes)
+        return resp, self._shape(
+            *decode_body(body, complete), resp.is_success)
+
+    def composite_key(self, bearer: str | None) -> tuple[str, str] | None:
+        """
+        (composite url, token identity) shared by the calls that may go out
+        as one composite request, None when this operation cannot be a
+        subrequest or relies on what only a request of its own provides:
+        coalescing of identical calls, retries, a byte budget on the
+        response read or an upstream policy of its own
+        """
+        if self.idempotent or self.retry is not None \
+                or self.upstream is not None \
+                or (self.output is not None
+                    and self.output.max_bytes is not None):
+            return None
+        url = composite_url(self.endpoint)
+        if url is None:
+            return None
+        return url, self._identity(bearer) or ""
+
+    def _composite_result(self, sub: dict[str, Any]) -> Any:
+        return self._shape(
+            sub.get("body"), False, 200 <= sub["httpStatusCode"] < 300)
+
+    async def _send_composite(
+            self,
+            bearer: str | None,
+            subrequests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        async with self._slot() as outcome:
+            try:
+                subresponses = await self._send_composite_authorized(
+                    bearer, subrequests)
+            except httpx.HTTPStatusError as e:
+                outcome.observe(e.response.status_code)
+                raise
+            # the first failed subresponse tells how the host is doing
+            for sub in subresponses:
+                outcome.observe(sub["httpStatusCode"], sub.get("body"))
+                if outcome.failed:
+                    break
+            else:
+                outcome.observe(200)
+            return subresponses
+
+    async def _send_composite_authorized(
+            self,
+            bearer: str | None,
+            subrequests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        url = composite_url(self.endpoint)
+        assert url is not None
+        client = self.transport.async_client(url)
+        token = await self._token(bearer)
+        try:
+            return await send_composite(
+                client, url, self._auth_headers(token), subrequests)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401 \
+                    or not self._retry_token(bearer, token):
+                raise
+
+        token = await self._token(bearer)
+        return await send_composite(
+            client, url, self._auth_headers(token), subrequests)
+
+    @staticmethod
+    async def ainvoke_composite(
+            calls: list[tuple['RESTFunctionInvoker', str | None,
+                              dict[str, Any]]]) -> list[Any]:
+        """
+        invoke operations of the same `composite_key` as one composite
+        request, returns the result of each call or the exception it failed
+        with. Cached results are served without a subrequest, when the
+        composite request itself fails each call goes out on its own.
+        """
+        results: list[Any] = [None] * len(calls)
+        pending: list[tuple[int, dict[str, Any], str | None,
+                            ToolCallObservation]] = []
+        subrequests: list[dict[str, Any]] = []
+        with contextlib.ExitStack() as stack:
+            for i, (invoker, bearer, kwargs) in enumerate(calls):
+                call = stack.enter_context(
+                    invoker.transport.observe(invoker.operation_id))
+                try:
+                    args = invoker._observed_args(call, kwargs)
+                except Exception as e:
+                    results[i] = e
+                    continue
+                key = invoker._cache_key(bearer, args)
+                hit, result = invoker._cache_lookup(key)
+                if hit:
+                    call.status = "cached"
+                    results[i] = result
+                    continue
+
+                sub = {
+                    "method": args["method"],
+                    "url": subrequest_url(args["url"], args["params"]),
+                    "referenceId": f"call{i}",
+                }
+                if "json" in args:
+                    sub["body"] = args["json"]
+                pending.append((i, args, key, call))
+                subrequests.append(sub)
+
+            if not subrequests:
+                return results
+
+            first, bearer, _ = calls[0]
+            try:
+                subresponses = await first._send_composite(
+                    bearer, subrequests)
+            except CircuitOpen as e:
+                for i, _, _, call in pending:
+                    call.status = "circuit_open"
+                    results[i] = e
+                return results
+            except Exception:
+                await asyncio.gather(*(
+                    RESTFunctionInvoker._ainvoke_pending(calls, results, p)
+                    for p in pending))
+                return results
+
+            for (i, _, key, call), sub in zip(pending, subresponses):
+                invoker = calls[i][0]
+                status = sub["httpStatusCode"]
+                call.status = str(status)
+                results[i] = invoker._composite_result(sub)
+                invoker._cache_store(key, 200 <= status < 300, results[i])
+        return results
+
+    @staticmethod
+    async def _ainvoke_pending(
+            calls: list[tuple['RESTFunctionInvoker', str | None,
+                              dict[str, Any]]],
+            results: list[Any],
+            pending: tuple[int, dict[str, Any], str | None,
+                           ToolCallObservation]) -> None:
+        # a call of a failed composite request, sent on its own under the
+        # observation it already has
+        i, args, key, call = pending
+        invoker, bearer, _ = calls[i]
+        try:
+            resp, results[i] = await invoker._aretrying(args, bearer, call)
+        except CircuitOpen as e:
+            call.status = "circuit_open"
+            results[i] = e
+        except Exception as e:
+            results[i] = e
+        else:
+            invoker._cache_store(key, resp.is_success, results[i])
 
     @classmethod
     def from_operation(
@@ -83,7 +510,10 @@ class RESTFunctionInvoker(FunctionInvoker):
             path: str,
             method: Method,
             op: Operation,
-            token: str | None) -> 'RESTFunctionInvoker':
+            token: Token,
+            transport: HTTPTransport,
+            cache: ResponseCache | None = None,
+            parameters: JsonSchema | None = None) -> 'RESTFunctionInvoker':
         endpoint = f"{spec.servers[0].url}{path}"
         params_in = {}
         if op.parameters:
@@ -91,7 +521,77 @@ class RESTFunctionInvoker(FunctionInvoker):
                 if isinstance(p, Reference):
                     p = resolve_reference_parameter(spec, p)
                 params_in[p.name] = p.in_
-        return cls(endpoint, method, params_in, token)
+        return cls(
+            endpoint, method, params_in, token, transport,
+            cache, op.cache_ttl, op.operation_id, op.output, parameters,
+            op.upstream, op.retry, spec.servers[0].url)
+
+    def rebased(
+            self,
+            server_url: str | None,
+            token: Token) -> 'RESTFunctionInvoker':
+        """
+        the same operation called on `server_url`, the server of the spec
+        when None, with `token`. The compiled request plan is shared.
+        """
+        endpoint = self.endpoint
+        if server_url is not None:
+            if self.server_url is None \
+                    or not endpoint.startswith(self.server_url):
+                raise ValueError(
+                    f'the server of {self.operation_id} is not known')
+            endpoint = server_url.rstrip('/') \
+                + endpoint[len(self.server_url):]
+        invoker = copy.copy(self)
+        invoker.endpoint = endpoint
+        invoker.security = as_token_provider(token)
+        invoker.plan = self.plan.rebased(endpoint)
+        invoker.latencies = LatencyWindow()
+        invoker._semaphore = asyncio.Semaphore(self.upstream.max_concurrency) \
+            if self.upstream and self.upstream.max_concurrency else None
+        invoker.server_url = server_url or self.server_url
+        return invoker
+
+    def dump_snapshot(self) -> dict[str, Any]:
+        return {
+            "kind": "rest",
+            "endpoint": self.endpoint,
+            "method": self.method,
+            "params_in": {k: str(v) for k, v in self.params_in.items()},
+            "cache_ttl": self.cache_ttl,
+            "operation_id": self.operation_id,
+            "output": self.output.model_dump(by_alias=True, exclude_none=True)
+            if self.output else None,
+            "upstream": self.upstream.model_dump(by_alias=True)
+            if self.upstream else None,
+            "retry": self.retry.model_dump(by_alias=True)
+            if self.retry else None,
+            "server_url": self.server_url,
+        }
+
+    @classmethod
+    def from_snapshot(
+            cls,
+            data: dict[str, Any],
+            token: Token,
+            transport: HTTPTransport,
+            cache: ResponseCache | None = None,
+            parameters: JsonSchema | None = None) -> 'RESTFunctionInvoker':
+        return cls(
+            data["endpoint"],
+            data["method"],
+            {k: ParameterLocation(v) for k, v in data["params_in"].items()},
+            token,
+            transport,
+            cache,
+            data.get("cache_ttl"),
+            data["operation_id"],
+            OutputShape(**data["output"]) if data["output"] else None,
+            parameters,
+            UpstreamPolicy(**data["upstream"]) if data["upstream"]
+            else None,
+            RetryPolicy(**data["retry"]) if data["retry"] else None,
+            data["server_url"])
 
 
 class FunctionMeta(BaseModel):
@@ -111,9 +611,24 @@ class Function:
                 name=ident, description=description, parameters=parameters)
         self.fn_invoker = invoker
 
-    def invoke(self, bearer: str | None, **kwargs) -> str:
+    @property
+    def idempotent(self) -> bool:
+        return self.fn_invoker.idempotent
+
+    def with_invoker(self, invoker: FunctionInvoker) -> 'Function':
+        """
+        the same function, sharing its meta, called through `invoker`
+        """
+        fn = copy.copy(self)
+        fn.fn_invoker = invoker
+        return fn
+
+    def invoke(self, bearer: str | None, **kwargs) -> Any:
         return self.fn_invoker.invoke(bearer, **kwargs)
 
+    async def ainvoke(self, bearer: str | None, **kwargs) -> Any:
+        return await self.fn_invoker.ainvoke(bearer, **kwargs)
+
     def dump_tool_json(self) -> Any:
         return {
             "type": "function",
@@ -125,6 +640,45 @@ class Function:
             }
         }
 
+    def dump_snapshot(
+            self, shared: SharedSchemas | None = None) -> dict[str, Any]:
+        """
+        the tool and invoker of the function, the parameter schemas held by
+        `shared` as references to it
+        """
+        tool = self.dump_tool_json()
+        if shared is not None:
+            tool["function"]["parameters"] = shared.dump(
+                self.fn_meta.parameters)
+        return {
+            "tool": tool,
+            "invoker": self.fn_invoker.dump_snapshot(),
+        }
+
+    @classmethod
+    def from_snapshot(
+            cls,
+            data: dict[str, Any],
+            token: Token,
+            transport: HTTPTransport,
+            cache: ResponseCache | None = None,
+            shared: dict[str, dict[str, Any]] | None = None,
+            built: dict[str, JsonSchema] | None = None) -> 'Function':
+        tool = data["tool"]["function"]
+        parameters = json_schema_from_dict(tool["parameters"], shared, built)
+        match data["invoker"]["kind"]:
+            case "rest":
+                invoker = RESTFunctionInvoker.from_snapshot(
+                    data["invoker"], token, transport, cache, parameters)
+            case kind:
+                raise NotImplementedError(f"unknown invoker kind {kind}")
+
+        return cls(
+            ident=tool["name"],
+            description=tool["description"],
+            parameters=parameters,
+            invoker=invoker)
+
     @staticmethod
     def _resolve_operation_params(
             spec: OpenAPI,
@@ -156,7 +710,9 @@ class Function:
                 case Schema() as s:
                     sch = s
                 case Reference() as ref:
-                    sch = resolve_reference_schema(spec, ref)
+                    # converted through its reference, so the schema is
+                    # shared with the other operations using it
+                    sch = ref
                 case None:
                     raise Exception("Unexpected null value for "
                                     "'application/json' content")
@@ -173,7 +729,9 @@ class Function:
             path: str,
             method: Method,
             op: Operation,
-            token: str | None) -> 'Function':
+            token: Token,
+            transport: HTTPTransport,
+            cache: ResponseCache | None = None) -> 'Function':
 
         params: list[JsonSchema] = []
         if op.parameters:
@@ -193,7 +751,7 @@ class Function:
         description = op.summary if op.summary else ""
 
         invoker = RESTFunctionInvoker.from_operation(
-                spec, path, method, op, token)
+                spec, path, method, op, token, transport, cache, fnps)
 
         return Function(
             ident=name,
@@ -203,29 +761,212 @@ class Function:
         )
 
 
+class FunctionPool:
+    """
+    Content-addressed store of `FunctionMeta`: the functions of registries
+    built from similar specs, or from successive versions of a spec, share
+    one copy of every identical name, description and parameter schema.
+    """
+    _metas: dict[str, FunctionMeta]
+
+    def __init__(self) -> None:
+        self._metas = {}
+
+    def __len__(self) -> int:
+        return len(self._metas)
+
+    @staticmethod
+    def digest(fn: Function) -> str:
+        return hashlib.sha256(json.dumps(
+            fn.dump_tool_json(), sort_keys=True,
+            separators=(',', ':')).encode()).hexdigest()
+
+    def intern(self, fn: Function) -> Function:
+        """
+        `fn` with the stored copy of its meta, which it becomes the stored
+        copy of when it is new
+        """
+        fn.fn_meta = self._metas.setdefault(self.digest(fn), fn.fn_meta)
+        return fn
+
+
+class RegistryDiff(BaseModel):
+    """operations of a reloaded registry compared to the previous one"""
+    added: list[str] = []
+    changed: list[str] = []
+    removed: list[str] = []
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
 class FunctionRegistry:
-    _registry: dict[str, Function] = {}
+    _registry: dict[str, Function]
+    _paths: dict[str, tuple[str, list[str]]]
+    """path -> (content hash, operation ids), known when the spec was
+    imported from text, lets a reload skip the unchanged paths"""
+    transport: HTTPTransport
+    """HTTP transport shared by all the invokers of this registry"""
+    cache: ResponseCache | None
+    """result cache for the GET operations opting in with
+    `x-sassy-cache-ttl`, no result is cached when unset"""
+    flights: SingleFlight
+    """in-flight idempotent invocations, shared by identical calls"""
+    pool: FunctionPool | None
+    """where the metas of the functions are interned, if anywhere"""
+
+    def __init__(
+            self,
+            transport: HTTPTransport | None = None,
+            cache: ResponseCache | None = None,
+            pool: FunctionPool | None = None) -> None:
+        self._registry = {}
+        self._paths = {}
+        self.transport = transport if transport else HTTPTransport()
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.pool = pool
+
+    def _add(self, fn: Function) -> str:
+        ident = fn.fn_meta.name
+        assert ident not in self._registry
+        self._registry[ident] = self.pool.intern(fn) \
+            if self.pool is not None else fn
+        return ident
+
+    def function(self, ident: str) -> Function:
+        """
+        the function of an operation, raises KeyError when there is none
+        """
+        return self._registry[ident]
 
     def import_openapi_spec(
             self,
             spec_json: Any,
-            token: str | None = None) -> None:
+            token: Token = None) -> None:
+        """
+        register the operations of a spec, given either as parsed json or
+        as json text. Text is loaded lazily: path items are parsed one at a
+        time and only the components they reference are materialized.
+        """
+        if isinstance(spec_json, str):
+            lazy = LazySpec(spec_json)
+            for path, digest in lazy.path_digests().items():
+                self._paths[path] = (digest, self.register_path(
+                    lazy.spec, path, lazy.path_item(path), token))
+            return
+
         spec = OpenAPI(**spec_json)
+        reference_index(spec)
         for path, path_item in spec.paths.items():
-            if path_item.get:
-                self.register_operation(
-                        spec, path, "get", path_item.get, token)
-            if path_item.post:
-                self.register_operation(
-                        spec, path, "post", path_item.post, token)
+            self.register_path(spec, path, path_item, token)
+
+    def register_path(
+            self, spec: OpenAPI, path: str, path_item: PathItem,
+            token: Token) -> list[str]:
+        """
+        register the operations of a path item, returns their ids
+        """
+        idents = []
+        if path_item.get:
+            idents.append(self.register_operation(
+                    spec, path, "get", path_item.get, token))
+        if path_item.post:
+            idents.append(self.register_operation(
+                    spec, path, "post", path_item.post, token))
+        return idents
+
+    def reload_openapi_spec(
+            self,
+            spec_text: str,
+            token: Token = None) -> tuple['FunctionRegistry',
+                                          RegistryDiff]:
+        """
+        a registry of a new version of the spec sharing the transport, the
+        cache and the in-flight calls of this one. Only the paths whose
+        content hash changed are built again, the functions of the others
+        are carried over as they are. This registry is left untouched.
+        """
+        lazy = LazySpec(spec_text)
+        r = type(self)(self.transport, self.cache, self.pool)
+        r.flights = self.flights
+        rebuilt: list[str] = []
+
+        for path, digest in lazy.path_digests().items():
+            known = self._paths.get(path)
+            if known is not None and known[0] == digest:
+                for ident in known[1]:
+                    assert ident not in r._registry
+                    r._registry[ident] = self._registry[ident]
+                r._paths[path] = known
+                continue
+
+            idents = r.register_path(
+                lazy.spec, path, lazy.path_item(path), token)
+            r._paths[path] = (digest, idents)
+            rebuilt.extend(idents)
+
+        diff = RegistryDiff(
+            added=[i for i in rebuilt if i not in self._registry],
+            changed=[
+                i for i in rebuilt if i in self._registry
+                and self._registry[i].dump_snapshot()
+                != r._registry[i].dump_snapshot()],
+            removed=[i for i in self._registry if i not in r._registry])
+        return r, diff
 
     @classmethod
     def from_openapi_spec(
-            cls, spec_json: Any, token: str | None) -> 'FunctionRegistry':
-        r = cls()
+            cls,
+            spec_json: Any,
+            token: Token,
+            transport: HTTPTransport | None = None,
+            cache: ResponseCache | None = None,
+            pool: FunctionPool | None = None) -> 'FunctionRegistry':
+        r = cls(transport, cache, pool)
         r.import_openapi_spec(spec_json, token)
         return r
 
+    @classmethod
+    def from_snapshot(
+            cls,
+            snapshot: dict[str, Any],
+            token: Token,
+            transport: HTTPTransport | None = None,
+            cache: ResponseCache | None = None,
+            pool: FunctionPool | None = None) -> 'FunctionRegistry':
+        """
+        rebuild a registry from `dump_snapshot` without parsing the spec
+        """
+        r = cls(transport, cache, pool)
+        # the schemas the functions share are rebuilt once, and shared again
+        built: dict[str, JsonSchema] = {}
+        for data in snapshot["functions"]:
+            r._add(Function.from_snapshot(
+                data, token, r.transport, r.cache, snapshot["schemas"],
+                built))
+        for path, known in snapshot["paths"].items():
+            r._paths[path] = (known["digest"], known["operations"])
+        return r
+
+    def dump_snapshot(self) -> dict[str, Any]:
+        """
+        export the compiled functions as a json object, each parameter
+        schema shared by several functions is written once
+        """
+        shared = SharedSchemas(
+            fn.fn_meta.parameters for fn in self._registry.values())
+        functions = [
+            fn.dump_snapshot(shared) for fn in self._registry.values()]
+        return {
+            "functions": functions,
+            "schemas": shared.schemas,
+            "paths": {
+                path: {"digest": digest, "operations": idents}
+                for path, (digest, idents) in self._paths.items()},
+        }
+
     def dump_assistant_tools(self) -> Any:
         """
         export assistant tools definition as a json object
@@ -235,17 +976,82 @@ class FunctionRegistry:
 
     def register_operation(
             self, spec: OpenAPI, path: str, method: Method, op: Operation,
-            token: str | None) -> None:
+            token: Token) -> str:
         ident = op.operation_id if op.operation_id else ""
         assert ident not in self._registry
 
-        fn = Function.from_operation(spec, path, method, op, token)
-        self._registry[ident] = fn
+        return self._add(Function.from_operation(
+            spec, path, method, op, token, self.transport, self.cache))
 
-    def invoke(self, ident: str, bearer: str | None, **kwargs) -> str:
+    def invoke(self, ident: str, bearer: str | None, **kwargs) -> Any:
         """
-        Invoke a function by it's identifier
+        Invoke a function by it's identifier, identical concurrent calls to
+        an idempotent function share a single upstream request
         """
 
-        fn = self._registry[ident]
-        return fn.invoke(bearer, **kwargs)
+        fn = self.function(ident)
+        if not fn.idempotent:
+            return fn.invoke(bearer, **kwargs)
+        return self.flights.do_sync(
+            SingleFlight.key(ident, bearer, kwargs),
+            lambda: fn.invoke(bearer, **kwargs))
+
+    async def ainvoke(self, ident: str, bearer: str | None, **kwargs) -> Any:
+        """
+        Invoke a function by it's identifier without blocking the event loop
+        """
+
+        fn = self.function(ident)
+        if not fn.idempotent:
+            return await fn.ainvoke(bearer, **kwargs)
+        return await self.flights.do(
+            SingleFlight.key(ident, bearer, kwargs),
+            lambda: fn.ainvoke(bearer, **kwargs))
+
+    def composite_groups(
+            self, calls: list[tuple[str, str | None]]) -> list[list[int]]:
+        """
+        partition calls, given as (ident, bearer), into groups of indices:
+        the calls of a group of more than one can be sent together with
+        `ainvoke_composite`, the others go out on their own
+        """
+        groups: list[list[int]] = []
+        shared: dict[tuple[str, str], list[int]] = {}
+        queries: dict[tuple[str, str], int] = {}
+        for i, (ident, bearer) in enumerate(calls):
+            key = None
+            try:
+                invoker = self.function(ident).fn_invoker
+            except KeyError:
+                invoker = None
+            if isinstance(invoker, RESTFunctionInvoker):
+                key = invoker.composite_key(bearer)
+            if not isinstance(invoker, RESTFunctionInvoker) or key is None:
+                groups.append([i])
+                continue
+
+            query = counts_as_query(invoker.endpoint)
+            group = shared.get(key)
+            if group is None or len(group) == COMPOSITE_LIMIT \
+                    or (query and queries[key] == COMPOSITE_QUERY_LIMIT):
+                group = shared[key] = []
+                queries[key] = 0
+                groups.append(group)
+            group.append(i)
+            queries[key] += query
+        return groups
+
+    async def ainvoke_composite(
+            self,
+            calls: list[tuple[str, str | None, dict[str, Any]]]) -> list[Any]:
+        """
+        Invoke calls of a group from `composite_groups` as one composite
+        request, returns the result of each call or the exception it
+        failed with
+        """
+        invokers = []
+        for ident, bearer, kwargs in calls:
+            invoker = self.function(ident).fn_invoker
+            assert isinstance(invoker, RESTFunctionInvoker)
+            invokers.append((invoker, bearer, kwargs))
+        return await RESTFunctionInvoker.ainvoke_composite(invokers)
@@ -0,0 +1,231 @@
+"""
+Logging off the request path: the records of the sassy loggers are put on a
+queue and written as JSON lines by a background thread. Payloads are logged
+as structured events, sampled and capped before they are queued, so a chat
+costs the same to log whatever the size of its tool calls and outputs.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import random
+import re
+import reprlib
+import sys
+from typing import Any, TextIO
+
+
+DEFAULT_FIELD_LIMIT = 1024
+"""characters of a payload field kept in a record"""
+DEFAULT_SAMPLE_RATES = {
+    "tool_call": 1.0,
+    "tool_output": 0.1,
+    "tools.selected": 0.1,
+}
+"""share of the high volume events logged, the others are all logged"""
+
+REDACTED = '[redacted]'
+_SECRET_KEYS = re.compile(
+    r'authorization|token|secret|password|security|assertion', re.I)
+_SECRETS = re.compile(
+    r'(bearer\s+)[\w.~+/=!-]+'
+    # Salesforce session ids, what the access tokens of an org look like
+    r'|()\b00D\w{12,15}![\w.]+', re.I)
+
+_repr = reprlib.Repr()
+_repr.maxstring = _repr.maxother = DEFAULT_FIELD_LIMIT
+
+
+def redact(text: str) -> str:
+    """
+    `text` with the bearer tokens and session ids it holds blanked out
+    """
+    return _SECRETS.sub(lambda m: f'{m[1] or m[2]}{REDACTED}', text)
+
+
+def _cap(value: Any, budget: list[int]) -> Any:
+    match value:
+        case str():
+            budget[0] -= len(value)
+            if budget[0] >= 0:
+                return redact(value)
+            kept = max(0, len(value) + budget[0])
+            return redact(value[:kept]) + f'...(+{len(value) - kept} chars)'
+        case bool() | int() | float() | None:
+            budget[0] -= 8
+            return value
+        case dict():
+            capped: dict[str, Any] = {}
+            for i, (key, item) in enumerate(value.items()):
+                if budget[0] <= 0:
+                    capped['...'] = f'+{len(value) - i} more'
+                    break
+                key = str(key)
+                budget[0] -= len(key)
+                capped[key] = REDACTED if _SECRET_KEYS.search(key) \
+                    else _cap(item, budget)
+            return capped
+        case list() | tuple():
+            items = []
+            for i, item in enumerate(value):
+                if budget[0] <= 0:
+                    items.append(f'...(+{len(value) - i} more)')
+                    break
+                items.append(_cap(item, budget))
+            return items
+        case _:
+            # bounded, unlike str() of a large object
+            return _cap(_repr.repr(value), budget)
+
+
+def cap(value: Any, limit: int = DEFAULT_FIELD_LIMIT) -> Any:
+    """
+    a JSON-friendly copy of `value` holding about `limit` characters of it
+    at most, redacted, in time bounded by `limit` rather than the size of
+    `value`. What is left out is counted.
+    """
+    return _cap(value, [limit])
+
+
+class EventLog:
+    """
+    Structured events of a logger: a name and fields, capped at
+    `field_limit` characters each. The events named in `sample_rates` are
+    logged at that rate.
+    """
+    logger: logging.Logger
+    field_limit: int
+    sample_rates: dict[str, float]
+
+    def __init__(
+            self,
+            logger: logging.Logger,
+            field_limit: int = DEFAULT_FIELD_LIMIT,
+            sample_rates: dict[str, float] | None = None) -> None:
+        self.logger = logger
+        self.field_limit = field_limit
+        self.sample_rates = DEFAULT_SAMPLE_RATES if sample_rates is None \
+            else sample_rates
+
+    def event(
+            self, name: str, level: int = logging.INFO,
+            **fields: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = self.sample_rates.get(name, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        self.logger.log(level, name, extra={"fields": {
+            key: cap(value, self.field_limit)
+            for key, value in fields.items()}})
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    a record as a JSON object: time, level, logger, message and the fields
+    of its event
+    """
+    field_limit: int
+
+    def __init__(self, field_limit: int = DEFAULT_FIELD_LIMIT) -> None:
+        super().__init__()
+        self.field_limit = field_limit
+
+    def format(self, record: logging.LogRecord) -> str:
+        line: dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": cap(record.getMessage(), self.field_limit),
+        }
+        line.update(getattr(record, "fields", {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            # not capped, a traceback is of no use cut short
+            line["exception"] = record.exc_text
+        return json.dumps(line, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    queues the records with their message merged, but leaves formatting
+    and writing them to the thread of the listener. Only a traceback is
+    rendered here, its frames would be gone by then.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: QueueListener | None = None
+_handler: QueueHandler | None = None
+
+
+def configure_logging(
+        level: int | str = logging.INFO,
+        stream: TextIO | None = None,
+        field_limit: int = DEFAULT_FIELD_LIMIT,
+        logger: str = 'sassy') -> QueueListener:
+    """
+    route the records of `logger` and its children through a queue to a
+    thread writing them to `stream`, stderr by default. The thread is
+    started again in forked workers and drained at exit.
+    """
+    global _listener, _handler
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter(field_limit))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger(logger)
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = _QueueHandler(records)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """
+    write out the records still queued and stop the thread, the records
+    logged afterwards stay queued
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_in_child() -> None:
+    # the thread of the parent is gone and its queue may be mid-write
+    global _listener
+    if _listener is None or _handler is None:
+        return
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _handler.queue = records
+    _listener = QueueListener(
+        records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
@@ -1,22 +1,30 @@
 import argparse
-import json
 import logging
 from jinja2 import Environment, FileSystemLoader
-from openai import OpenAI
+from openai import AsyncOpenAI
 
+from .admission import DEFAULT_MAX_CONCURRENT_CHATS, \
+        DEFAULT_MAX_QUEUED_CHATS
+from .auth import Token, token_from_settings
+from .cache import ResponseCache
 from .config import Config
+from .functions import FunctionPool, FunctionRegistry
+from .logs import DEFAULT_FIELD_LIMIT, DEFAULT_SAMPLE_RATES, EventLog, \
+        configure_logging
+from .metrics import Metrics
+from .snapshot import DEFAULT_SNAPSHOT_FILE, read_snapshot, spec_hash, \
+        write_snapshot
+from .tenants import read_tenants, tenant_registries
+from .transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, \
+        DEFAULT_MAX_CONNECTIONS_PER_HOST, HTTPTransport
+from .upstream import DEFAULT_COOLDOWN, DEFAULT_FAILURE_THRESHOLD, \
+        UpstreamGuards
 
 logger = logging.getLogger(__name__)
-handler = logging.StreamHandler()
-formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.DEBUG)
 
 
 config = Config.from_env()
-openai = OpenAI(api_key=config.OPENAI_API_KEY)
+openai = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
 
 
 def render_openapi() -> str:
@@ -32,36 +40,179 @@ def spec_from_args(args: argparse.Namespace) -> str:
     return render_openapi()
 
 
+def token_from_config(transport: HTTPTransport | None = None) -> Token:
+    """
+    an OAuth token provider when a connected app is configured, the static
+    `DEFAULT_ACCESS_TOKEN` otherwise
+    """
+    return token_from_settings(
+        config.DEFAULT_ACCESS_TOKEN, config.SF_CLIENT_ID,
+        config.SF_CLIENT_SECRET, config.SF_USERNAME,
+        config.SF_PRIVATE_KEY_FILE, config.SF_LOGIN_URL, transport)
+
+
+def registry_from_args(
+        args: argparse.Namespace,
+        token: Token,
+        transport: HTTPTransport | None = None,
+        cache: ResponseCache | None = None,
+        pool: FunctionPool | None = None) -> FunctionRegistry:
+    """
+    the function registry of the spec, loaded from the compiled snapshot
+    when it matches the spec and compiled from the spec otherwise
+    """
+    spec = spec_from_args(args)
+    digest = spec_hash(spec)
+
+    snapshot = read_snapshot(args.snapshot, digest)
+    if snapshot is not None:
+        logger.info(f'Loaded function registry snapshot {args.snapshot}')
+        return FunctionRegistry.from_snapshot(
+            snapshot, token, transport, cache, pool)
+
+    return FunctionRegistry.from_openapi_spec(
+        spec, token, transport, cache, pool)
+
+
+def sample_rate(value: str) -> tuple[str, float]:
+    event, _, rate = value.partition('=')
+    try:
+        return event, float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected EVENT=RATE: {value}')
+
+
 def run():
     parser = argparse.ArgumentParser(
             prog='sassy', description='serve the APIs')
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument(
+        '--log-field-limit', type=int, default=DEFAULT_FIELD_LIMIT,
+        help='characters of a logged payload kept, such as tool arguments '
+        'and outputs')
+    parser.add_argument(
+        '--log-sample', type=sample_rate, action='append', default=[],
+        metavar='EVENT=RATE',
+        help='share of an event logged, such as tool_output=0.1, repeated '
+        'for several events')
 
     subparsers = parser.add_subparsers(help='sub-command help', dest='command')
 
     _ = subparsers.add_parser('openapi')
 
+    compile_parser = subparsers.add_parser('compile-spec')
+    compile_parser.add_argument('--spec')
+    compile_parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT_FILE)
+
     serve_parser = subparsers.add_parser('serve')
     serve_parser.add_argument('--spec')
+    serve_parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT_FILE)
     serve_parser.add_argument('--port', type=int, default=8080)
     serve_parser.add_argument('--host', default='0.0.0.0')
     serve_parser.add_argument('--assistant-id', default=None)
+    serve_parser.add_argument(
+        '--workers', type=int, default=None,
+        help='serve from this many processes with hypercorn instead of the '
+             'development server')
+    serve_parser.add_argument('--tool-concurrency', type=int, default=8)
+    serve_parser.add_argument(
+        '--poll-qps', type=float, default=20.0,
+        help='upper bound of run status polls per second, all chats')
+    serve_parser.add_argument(
+        '--max-concurrent-chats', type=int,
+        default=DEFAULT_MAX_CONCURRENT_CHATS)
+    serve_parser.add_argument(
+        '--max-queued-chats', type=int, default=DEFAULT_MAX_QUEUED_CHATS,
+        help='chats waiting for a slot before answering 429')
+    serve_parser.add_argument(
+        '--tool-top-k', type=int, default=None,
+        help='only attach the k most relevant function tools to each run')
+    serve_parser.add_argument(
+        '--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT)
+    serve_parser.add_argument(
+        '--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT)
+    serve_parser.add_argument(
+        '--max-connections-per-host', type=int,
+        default=DEFAULT_MAX_CONNECTIONS_PER_HOST)
+    serve_parser.add_argument('--http2', action='store_true')
+    serve_parser.add_argument(
+        '--breaker-threshold', type=int, default=DEFAULT_FAILURE_THRESHOLD,
+        help='consecutive failed calls to a host before failing fast')
+    serve_parser.add_argument(
+        '--breaker-cooldown', type=float, default=DEFAULT_COOLDOWN,
+        help='seconds calls to a failing host fail fast')
+    serve_parser.add_argument(
+        '--no-composite', dest='composite', action='store_false',
+        help='send every tool call on its own instead of grouping the '
+        'calls of a step to the same org into one composite request')
+    serve_parser.add_argument(
+        '--tenants', default=None,
+        help='JSON file listing the orgs served besides the one of the spec, '
+        'each with its server, token and operations, picked by the tenant '
+        'of a chat')
+    serve_parser.add_argument(
+        '--cache-size', type=int, default=0,
+        help='max cached GET results, 0 disables the cache')
 
     args = parser.parse_args()
+    configure_logging(args.log_level, field_limit=args.log_field_limit)
 
     if args.command == 'openapi':
         print(render_openapi())
 
+    elif args.command == 'compile-spec':
+        spec = spec_from_args(args)
+        registry = FunctionRegistry.from_openapi_spec(spec, None)
+        write_snapshot(args.snapshot, spec_hash(spec), registry)
+        logger.info(f'Compiled function registry snapshot {args.snapshot}')
+
     elif args.command == 'serve':
         from .server import app, Server
 
+        metrics = Metrics()
+        transport = HTTPTransport(
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            max_connections_per_host=args.max_connections_per_host,
+            http2=args.http2,
+            metrics=metrics,
+            guards=UpstreamGuards(
+                max_limit=args.max_connections_per_host,
+                failure_threshold=args.breaker_threshold,
+                cooldown=args.breaker_cooldown))
+        token = token_from_config(transport)
+        registry = registry_from_args(
+            args, token, transport,
+            cache=ResponseCache(args.cache_size) if args.cache_size else None,
+            pool=FunctionPool())
+        tenants = tenant_registries(
+            read_tenants(args.tenants), registry) if args.tenants else None
+
         server = Server(
             openai,
             app.logger,
-            json.loads(spec_from_args(args)),
-            config.DEFAULT_ACCESS_TOKEN)
+            registry,
+            tool_concurrency=args.tool_concurrency,
+            tool_top_k=args.tool_top_k,
+            metrics=metrics,
+            poll_qps=args.poll_qps,
+            max_concurrent_chats=args.max_concurrent_chats,
+            max_queued_chats=args.max_queued_chats,
+            spec_source=lambda: spec_from_args(args),
+            spec_token=token,
+            composite=args.composite,
+            events=EventLog(
+                app.logger, args.log_field_limit,
+                {**DEFAULT_SAMPLE_RATES, **dict(args.log_sample)}),
+            tenants=tenants)
 
         app.config["SERVER"] = server
-        app.run(host=args.host, port=args.port)
+        app.config["ADMIN_TOKEN"] = config.ADMIN_TOKEN
+        if args.workers:
+            from .workers import serve_workers
+            serve_workers(app, args.host, args.port, args.workers, logger)
+        else:
+            app.run(host=args.host, port=args.port)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,217 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+from typing import Any, Iterator
+
+from .tracing import Tracer, default_tracer
+
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0)
+"""seconds, up to the minute a slow run can take"""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() \
+        else str(int(value))
+
+
+class Metric:
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+    kind: str
+    _lock: threading.Lock
+
+    def __init__(
+            self, name: str, help: str,
+            label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        assert set(labels) == set(self.label_names), \
+            f"{self.name} expects labels {self.label_names}"
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+    _values: dict[tuple[str, ...], float]
+
+    def __init__(
+            self, name: str, help: str,
+            label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, label_names)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield (f'{self.name}{_labels(self.label_names, key)} '
+                   f'{_number(value)}')
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    buckets: tuple[float, ...]
+    _series: dict[tuple[str, ...], tuple[list[int], list[float]]]
+    """labels -> (count per bucket, [sum])"""
+
+    def __init__(
+            self, name: str, help: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * len(self.buckets), [0.0])
+                self._series[key] = series
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1][0] += value
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._series.items())
+        names = self.label_names + ('le',)
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket'
+                       f'{_labels(names, key + (_number(bound),))} '
+                       f'{cumulative}')
+            labels = _labels(self.label_names, key)
+            yield f'{self.name}_sum{labels} {_number(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class ToolCallObservation:
+    """
+    outcome of a tool call being measured, `status` is the HTTP status of
+    the upstream response, `cached` when served from the result cache,
+    `invalid` when the arguments were rejected before any request,
+    `circuit_open` when the host was failing and the call was not sent and
+    `error` when no response came back
+    """
+    status: str
+
+    def __init__(self) -> None:
+        self.status = 'error'
+
+
+class Metrics:
+    """
+    Latency histograms and counters of the chat stages and of the tool
+    calls, rendered in the Prometheus text format.
+    """
+    stage_seconds: Histogram
+    tool_call_seconds: Histogram
+    chats: Counter
+    tracer: Tracer
+
+    def __init__(self, tracer: Tracer | None = None) -> None:
+        self.stage_seconds = Histogram(
+            'sassy_chat_stage_seconds',
+            'Latency of each stage of a chat request.',
+            ('stage',))
+        self.tool_call_seconds = Histogram(
+            'sassy_tool_call_seconds',
+            'Latency of the tool calls by operation and HTTP status.',
+            ('operation', 'status'))
+        self.chats = Counter(
+            'sassy_chat_requests_total',
+            'Chat requests by route and outcome.',
+            ('route', 'outcome'))
+        self.tracer = tracer if tracer is not None else default_tracer()
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, **attributes: Any) -> Iterator[None]:
+        """
+        time a stage of a chat request, in its own span
+        """
+        with self.tracer.span(stage, **attributes), \
+                self.stage_seconds.time(stage=stage):
+            yield
+
+    @contextlib.contextmanager
+    def tool_call(self, operation: str | None) \
+            -> Iterator[ToolCallObservation]:
+        """
+        time a tool call, labelled with the status set on the observation
+        """
+        observation = ToolCallObservation()
+        started = time.perf_counter()
+        try:
+            yield observation
+        finally:
+            self.tool_call_seconds.observe(
+                time.perf_counter() - started,
+                operation=operation or '', status=observation.status)
+
+    def render(self) -> str:
+        metrics: list[Metric] = [
+            self.chats, self.stage_seconds, self.tool_call_seconds]
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
@@ -1,64 +1,178 @@
+from typing import Any, Callable, Generic, TypeVar
+
 from .data_model.jsons import JsonArray, JsonBoolean, JsonNull, JsonNumber, \
         JsonObject, JsonSchema, JsonString
-from .data_model.oas import OpenAPI, Parameter, Reference, RequestBody, Schema
+from .data_model.oas import Components, OpenAPI, Parameter, Reference, \
+        RequestBody, Schema
 
+T = TypeVar('T')
 
-# TODO consolidate all those 'resolve' functions
-def resolve_reference_schema(spec: OpenAPI, ref: Reference) -> Schema:
-    segs = ref.ref.split('/')
-    match segs:
-        case ['#', 'components', 'schemas', *others]:
-            schemas = spec.components.schemas
-            assert schemas is not None
-            match schemas['/'.join(others)]:
-                case Schema() as sch:
-                    return sch
-                case Reference() as nref:
-                    return resolve_reference_schema(spec, nref)
-        case _:
+
+class ComponentTable(Generic[T]):
+    """
+    `$ref` -> component lookup for one kind of components.
+
+    Entries are loaded into components on first lookup, with their
+    reference chains followed, and kept from then on.
+    """
+    prefix: str
+    _entries: dict[str, Any]
+    _load: Callable[[Any], T | Reference]
+    _resolved: dict[str, T]
+
+    def __init__(
+            self,
+            prefix: str,
+            entries: dict[str, Any] | None,
+            load: Callable[[Any], T | Reference]) -> None:
+        self.prefix = prefix
+        self._entries = entries if entries else {}
+        self._load = load
+        self._resolved = {}
+
+    def resolve(self, ref: str) -> T | None:
+        """
+        the component `ref` points to, None if it points to nothing
+        """
+        resolved = self._resolved.get(ref)
+        if resolved is not None:
+            return resolved
+
+        seen: list[str] = []
+        while True:
+            if ref in seen:
+                raise ValueError(
+                    f"circular reference {' -> '.join(seen + [ref])}")
+            if not ref.startswith(self.prefix) \
+                    or ref[len(self.prefix):] not in self._entries:
+                return None
+            seen.append(ref)
+            entry = self._load(self._entries[ref[len(self.prefix):]])
+            if not isinstance(entry, Reference):
+                break
+            ref = entry.ref
+
+        for r in seen:
+            self._resolved[r] = entry
+        return entry
+
+    def resolve_all(self) -> None:
+        for name in self._entries:
+            if self.resolve(f'{self.prefix}{name}') is None:
+                raise NotImplementedError(
+                        f"unsupported reference in {self.prefix}{name}")
+
+
+class ReferenceIndex:
+    """
+    `$ref` -> component lookup table of a spec.
+
+    Lookups are a single dict access once a reference has been resolved,
+    reference chains included. It also memoizes the json schemas converted
+    from the component schemas so a subtree referenced many times is only
+    converted once.
+    """
+    schemas: ComponentTable[Schema]
+    request_bodies: ComponentTable[RequestBody]
+    parameters: ComponentTable[Parameter]
+    json_schemas: dict[str, JsonSchema]
+    """`$ref` of a component schema -> its json schema. Inline schemas are
+    not memoized: a lazily loaded spec drops them once their path item is
+    registered, so they could not be told apart by identity."""
+
+    def __init__(
+            self,
+            schemas: ComponentTable[Schema],
+            request_bodies: ComponentTable[RequestBody],
+            parameters: ComponentTable[Parameter]) -> None:
+        self.schemas = schemas
+        self.request_bodies = request_bodies
+        self.parameters = parameters
+        self.json_schemas = {}
+
+    @classmethod
+    def from_components(cls, components: Components) -> 'ReferenceIndex':
+        """
+        index parsed components, resolving every entry up front
+        """
+        index = cls(
+            ComponentTable(
+                '#/components/schemas/', components.schemas, _parsed),
+            ComponentTable(
+                '#/components/requestBodies/', components.request_bodies,
+                _parsed),
+            ComponentTable(
+                '#/components/parameters/', components.parameters, _parsed))
+        index.schemas.resolve_all()
+        index.request_bodies.resolve_all()
+        index.parameters.resolve_all()
+        return index
+
+    @staticmethod
+    def _lookup(table: ComponentTable[T], ref: Reference, kind: str) -> T:
+        resolved = table.resolve(ref.ref)
+        if resolved is None:
             raise NotImplementedError(
-                    f"unsupported schema reference f{ref.ref}")
+                    f"unsupported {kind} reference {ref.ref}")
+        return resolved
+
+    def schema(self, ref: Reference) -> Schema:
+        return self._lookup(self.schemas, ref, "schema")
+
+    def request_body(self, ref: Reference) -> RequestBody:
+        return self._lookup(self.request_bodies, ref, "request body")
+
+    def parameter(self, ref: Reference) -> Parameter:
+        return self._lookup(self.parameters, ref, "parameter")
+
+
+def _parsed(entry: Any) -> Any:
+    return entry
+
+
+def reference_index(spec: OpenAPI) -> ReferenceIndex:
+    """
+    the reference index of the spec, built on first use
+    """
+    if spec._ref_index is None:
+        spec._ref_index = ReferenceIndex.from_components(spec.components)
+    return spec._ref_index
+
+
+def resolve_reference_schema(spec: OpenAPI, ref: Reference) -> Schema:
+    return reference_index(spec).schema(ref)
 
 
 def resolve_reference_requestbody(
         spec: OpenAPI, ref: Reference) -> RequestBody:
-    segs = ref.ref.split('/')
-    match segs:
-        case ['#', 'components', 'requestBodies', *others]:
-            requestBodies = spec.components.request_bodies
-            assert requestBodies is not None
-            match requestBodies['/'.join(others)]:
-                case RequestBody() as rb:
-                    return rb
-                case Reference() as nref:
-                    return resolve_reference_requestbody(spec, nref)
-        case _:
-            raise NotImplementedError(
-                    f"unsupported request body reference f{ref.ref}")
+    return reference_index(spec).request_body(ref)
 
 
 def resolve_reference_parameter(spec: OpenAPI, ref: Reference) -> Parameter:
-    segs = ref.ref.split('/')
-    match segs:
-        case ['#', 'components', 'parameters', *others]:
-            parameters = spec.components.parameters
-            assert parameters is not None
-            match parameters['/'.join(others)]:
-                case Parameter() as p:
-                    return p
-                case Reference() as nref:
-                    return resolve_reference_parameter(spec, nref)
-        case _:
-            raise NotImplementedError(
-                    f"unsupported parameter reference f{ref.ref}")
+    return reference_index(spec).parameter(ref)
 
 
 def as_json_schema(
         spec: OpenAPI,
         spec_sch: Schema | Reference,
         desc: str | None) -> JsonSchema:
+    return _as_json_schema(reference_index(spec), spec_sch, desc, set())
+
+
+def _as_json_schema(
+        index: ReferenceIndex,
+        spec_sch: Schema | Reference,
+        desc: str | None,
+        visiting: set[str]) -> JsonSchema:
+    """
+    `visiting` holds the references being converted up the stack, meeting
+    one of them again means the schema is recursive, that branch is cut off
+    as an object without properties
+    """
+    ref = None
     if isinstance(spec_sch, Reference):
-        spec_sch = resolve_reference_schema(spec, spec_sch)
+        ref = spec_sch.ref
+        spec_sch = index.schema(spec_sch)
 
     if desc and spec_sch.description:
         d = f'{desc}\n{spec_sch.description}'
@@ -67,14 +181,39 @@ def as_json_schema(
     else:
         d = spec_sch.description
 
+    if ref is None:
+        json_sch = _convert(index, spec_sch, visiting)
+    else:
+        json_sch = index.json_schemas.get(ref)
+        if json_sch is None:
+            if ref in visiting:
+                return JsonObject(properties={}, description=d)
+
+            visiting.add(ref)
+            try:
+                json_sch = _convert(index, spec_sch, visiting)
+            finally:
+                visiting.remove(ref)
+            index.json_schemas[ref] = json_sch
+
+    if d != json_sch.description:
+        # memoized subtrees are shared, only the root is copied
+        json_sch = json_sch.model_copy(update={"description": d})
+    return json_sch
+
+
+def _convert(
+        index: ReferenceIndex,
+        spec_sch: Schema,
+        visiting: set[str]) -> JsonSchema:
+    d = spec_sch.description
     match spec_sch.type:
         case "array":
             items = spec_sch.items
             assert items is not None
-            if isinstance(items, Reference):
-                items = resolve_reference_schema(spec, items)
             return JsonArray(
-                items=as_json_schema(spec, items, None), description=d)
+                items=_as_json_schema(index, items, None, visiting),
+                description=d)
         case "number":
             return JsonNumber(description=d)
         case "string":
@@ -87,6 +226,6 @@ def as_json_schema(
             props: dict[str, JsonSchema] = {}
             assert spec_sch.properties is not None
             for name, prop in spec_sch.properties.items():
-                props[name] = as_json_schema(spec, prop, None)
+                props[name] = _as_json_schema(index, prop, None, visiting)
             rqs = spec_sch.required if spec_sch.required is not None else []
             return JsonObject(properties=props, required=rqs, description=d)
@@ -0,0 +1,225 @@
+"""
+Shaping of the operation results before they reach the model, see
+`OutputShape`.
+"""
+import json
+import re
+from typing import Any, AsyncIterator, Iterator
+
+from .data_model.oas import OutputShape
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSONPATH_STEP = re.compile(
+    r"\.([A-Za-z_$][\w$-]*)|\['([^']*)'\]|\[(\d+)\]|(\[\*\]|\.\*)")
+
+
+class _Incomplete(Exception):
+    pass
+
+
+def _skip_ws(text: str, idx: int) -> int:
+    m = _WHITESPACE.match(text, idx)
+    assert m is not None
+    return m.end()
+
+
+def _prefix(text: str, idx: int) -> tuple[Any, int, bool]:
+    """
+    (value, end, complete) of the value starting at `idx`, containers cut
+    short by the end of `text` keep their complete items
+    """
+    idx = _skip_ws(text, idx)
+    if idx >= len(text):
+        raise _Incomplete()
+
+    try:
+        value, end = _decoder.raw_decode(text, idx)
+        # a number running into the end of the text may be cut short
+        if end < len(text) or text[idx] in '{["tfn':
+            return value, end, True
+    except json.JSONDecodeError:
+        pass
+
+    match text[idx]:
+        case '[':
+            return _array_prefix(text, idx + 1)
+        case '{':
+            return _object_prefix(text, idx + 1)
+        case _:
+            raise _Incomplete()
+
+
+def _array_prefix(text: str, idx: int) -> tuple[list, int, bool]:
+    items: list = []
+    while True:
+        idx = _skip_ws(text, idx)
+        if idx < len(text) and text[idx] == ']':
+            return items, idx + 1, True
+        try:
+            value, idx, complete = _prefix(text, idx)
+        except _Incomplete:
+            return items, len(text), False
+        if not complete:
+            # a record cut short would be misleading, drop it
+            return items, len(text), False
+        items.append(value)
+        idx = _skip_ws(text, idx)
+        if idx < len(text) and text[idx] == ',':
+            idx += 1
+
+
+def _object_prefix(text: str, idx: int) -> tuple[dict, int, bool]:
+    members: dict = {}
+    while True:
+        idx = _skip_ws(text, idx)
+        if idx < len(text) and text[idx] == '}':
+            return members, idx + 1, True
+        try:
+            key, idx = _decoder.raw_decode(text, idx)
+            idx = _skip_ws(text, idx)
+            if idx >= len(text) or text[idx] != ':':
+                raise _Incomplete()
+            value, idx, complete = _prefix(text, idx + 1)
+        except (_Incomplete, json.JSONDecodeError):
+            return members, len(text), False
+        if not complete:
+            # keep what fits of a list of records, not of a scalar
+            if isinstance(value, (list, dict)) and value:
+                members[key] = value
+            return members, len(text), False
+        members[key] = value
+        idx = _skip_ws(text, idx)
+        if idx < len(text) and text[idx] == ',':
+            idx += 1
+
+
+def decode_prefix(text: str) -> tuple[Any, bool]:
+    """
+    decode as much as possible of a json document cut short: the complete
+    items of its arrays and members of its objects. Returns the value and
+    whether the document was complete.
+    """
+    try:
+        value, _, complete = _prefix(text, 0)
+    except _Incomplete:
+        return None, False
+    return value, complete
+
+
+def read_limited(
+        chunks: Iterator[bytes], max_bytes: int) -> tuple[bytes, bool]:
+    """
+    read at most `max_bytes` of a body, returns it with whether it is
+    complete
+    """
+    body = bytearray()
+    for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), False
+    return bytes(body), True
+
+
+async def aread_limited(
+        chunks: AsyncIterator[bytes], max_bytes: int) -> tuple[bytes, bool]:
+    body = bytearray()
+    async for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), False
+    return bytes(body), True
+
+
+def decode_body(body: bytes, complete: bool) -> tuple[Any, bool]:
+    """
+    the json value of a body read in full or up to its byte budget, along
+    with whether it had to be truncated
+    """
+    if complete:
+        return json.loads(body), False
+    # the budget may split a multi-byte character
+    value, whole = decode_prefix(body.decode('utf-8', errors='ignore'))
+    return value, not whole
+
+
+def select(value: Any, path: str) -> Any:
+    """
+    the part of `value` at a JSONPath made of member names, indices and
+    wildcards, e.g. `$.records[*].Name`. Wildcards yield a list.
+    """
+    if not path.startswith('$'):
+        raise ValueError(f"JSONPath must start with '$': {path}")
+
+    nodes = [value]
+    many = False
+    idx = 1
+    while idx < len(path):
+        m = _JSONPATH_STEP.match(path, idx)
+        if m is None:
+            raise ValueError(f"unsupported JSONPath {path} at {idx}")
+        idx = m.end()
+        name, quoted, index, wildcard = m.groups()
+        if wildcard:
+            many = True
+            nodes = [
+                child for node in nodes
+                for child in (
+                    node if isinstance(node, list)
+                    else node.values() if isinstance(node, dict) else [])]
+        elif index is not None:
+            nodes = [
+                node[int(index)] for node in nodes
+                if isinstance(node, list) and int(index) < len(node)]
+        else:
+            key = name if name is not None else quoted
+            nodes = [
+                node[key] for node in nodes
+                if isinstance(node, dict) and key in node]
+
+    if many:
+        return nodes
+    return nodes[0] if nodes else None
+
+
+def _shape_record(record: Any, shape: OutputShape) -> Any:
+    if not isinstance(record, dict):
+        return record
+    if shape.fields is not None:
+        record = {k: record[k] for k in shape.fields if k in record}
+    if shape.exclude:
+        record = {
+            k: v for k, v in record.items() if k not in shape.exclude}
+    return record
+
+
+def shape_output(
+        value: Any, shape: OutputShape, truncated: bool = False) -> Any:
+    """
+    apply `shape` to a decoded result, `truncated` when the body was cut
+    at the byte budget. Objects holding records are marked `truncated`
+    when records were left out, their other members, such as the
+    `nextRecordsUrl` cursor, are kept.
+    """
+    if shape.select is not None:
+        value = select(value, shape.select)
+
+    records = value
+    if isinstance(value, dict) \
+            and isinstance(value.get(shape.records_key), list):
+        records = value[shape.records_key]
+    elif not isinstance(value, list):
+        return _shape_record(value, shape)
+
+    if shape.max_records is not None \
+            and len(records) > shape.max_records:
+        records = records[:shape.max_records]
+        truncated = True
+    records = [_shape_record(record, shape) for record in records]
+
+    if not isinstance(value, dict):
+        return records
+    value = {**value, shape.records_key: records}
+    if truncated:
+        value["truncated"] = True
+    return value
@@ -0,0 +1,213 @@
+"""
+Invocation plans, what a tool call of an operation turns into, compiled once
+per operation so a call only checks and fills in its arguments.
+"""
+import re
+from typing import Any, Callable
+from urllib.parse import quote
+
+from .data_model.jsons import JsonArray, JsonObject, JsonSchema
+from .data_model.oas import ParameterLocation
+
+
+MAX_ARGUMENT_ERRORS = 10
+"""errors reported for one call, the rest would not help the model more"""
+
+_PATH_PARAM = re.compile(r'\{([^}]+)\}')
+
+ArgumentError = dict[str, str]
+Validator = Callable[[Any, str, list[ArgumentError]], None]
+
+
+class InvalidArguments(ValueError):
+    """
+    the arguments of a call do not match the parameters of the operation,
+    `errors` lists each mismatch as {"path", "message"}
+    """
+    errors: list[ArgumentError]
+
+    def __init__(self, errors: list[ArgumentError]) -> None:
+        super().__init__('; '.join(
+            f"{error['path']}: {error['message']}" for error in errors))
+        self.errors = errors
+
+
+def _fail(errors: list[ArgumentError], path: str, message: str) -> None:
+    if len(errors) < MAX_ARGUMENT_ERRORS:
+        errors.append({"path": path, "message": message})
+
+
+def _type_check(
+        expected: str, accepts: Callable[[Any], bool]) -> Validator:
+    def validate(value: Any, path: str, errors: list[ArgumentError]) -> None:
+        if not accepts(value):
+            _fail(errors, path,
+                  f"expected {expected}, got {type(value).__name__}")
+    return validate
+
+
+def _compile_object(
+        schema: JsonObject, compiled: dict[int, Validator]) -> Validator:
+    properties = {
+        name: _compile(prop, compiled)
+        for name, prop in schema.properties.items()}
+    required = tuple(schema.required)
+
+    def validate(value: Any, path: str, errors: list[ArgumentError]) -> None:
+        if not isinstance(value, dict):
+            _fail(errors, path, f"expected object, got {type(value).__name__}")
+            return
+        for name in required:
+            if name not in value:
+                _fail(errors, f'{path}.{name}', "missing required property")
+        for name, item in value.items():
+            prop = properties.get(name)
+            if prop is not None:
+                prop(item, f'{path}.{name}', errors)
+    return validate
+
+
+def _compile_array(
+        schema: JsonArray, compiled: dict[int, Validator]) -> Validator:
+    items = _compile(schema.items, compiled)
+
+    def validate(value: Any, path: str, errors: list[ArgumentError]) -> None:
+        if not isinstance(value, list):
+            _fail(errors, path, f"expected array, got {type(value).__name__}")
+            return
+        for i, item in enumerate(value):
+            items(item, f'{path}[{i}]', errors)
+            if len(errors) >= MAX_ARGUMENT_ERRORS:
+                return
+    return validate
+
+
+def _compile(
+        schema: JsonSchema, compiled: dict[int, Validator]) -> Validator:
+    # converted schemas share their subtrees, so do the validators
+    validator = compiled.get(id(schema))
+    if validator is not None:
+        return validator
+
+    match schema.type:
+        case "object":
+            assert isinstance(schema, JsonObject)
+            validator = _compile_object(schema, compiled)
+        case "array":
+            assert isinstance(schema, JsonArray)
+            validator = _compile_array(schema, compiled)
+        case "number":
+            validator = _type_check("number", lambda v: isinstance(
+                v, (int, float)) and not isinstance(v, bool))
+        case "string":
+            validator = _type_check("string", lambda v: isinstance(v, str))
+        case "boolean":
+            validator = _type_check("boolean", lambda v: isinstance(v, bool))
+        case "null":
+            validator = _type_check("null", lambda v: v is None)
+    compiled[id(schema)] = validator
+    return validator
+
+
+def compile_validator(schema: JsonSchema) -> Validator:
+    """
+    a function checking a value against `schema`, appending what does not
+    match to the list of errors it is given. Properties the schema does not
+    know about are let through.
+    """
+    return _compile(schema, {})
+
+
+class InvocationPlan:
+    """
+    The request a tool call makes: the endpoint template split around its
+    path parameters, the location of each parameter and a validator of the
+    arguments, all worked out once per operation.
+    """
+    _segments: list[str]
+    """literal parts of the endpoint, between the path parameters"""
+    _path_params: list[str]
+    """path parameters in the order they appear in the endpoint"""
+    locations: dict[str, ParameterLocation]
+    _parameters: JsonSchema | None
+    _validate: Validator | None
+    """compiled from `_parameters` by the first call, most operations of a
+    large spec are never called"""
+
+    def __init__(
+            self,
+            endpoint: str,
+            params_in: dict[str, ParameterLocation],
+            parameters: JsonSchema | None = None) -> None:
+        self._segments = ['']
+        self._path_params = []
+        for i, part in enumerate(_PATH_PARAM.split(endpoint)):
+            if i % 2 == 0:
+                self._segments[-1] += part
+            elif params_in.get(part) == ParameterLocation.PATH:
+                self._path_params.append(part)
+                self._segments.append('')
+            else:
+                # not a parameter of the operation, such as a server
+                # variable, left as it is
+                self._segments[-1] += f'{{{part}}}'
+        self.locations = params_in
+        self._parameters = parameters
+        self._validate = None
+
+    def _validator(self) -> Validator | None:
+        if self._validate is None and self._parameters is not None:
+            self._validate = compile_validator(self._parameters)
+        return self._validate
+
+    def rebased(self, endpoint: str) -> 'InvocationPlan':
+        """
+        the plan of the same operation on another server, sharing the
+        validator
+        """
+        plan = InvocationPlan(endpoint, self.locations, self._parameters)
+        plan._validate = self._validator()
+        return plan
+
+    def validate(self, arguments: dict[str, Any]) -> None:
+        """
+        raises `InvalidArguments` unless `arguments` match the parameters
+        """
+        errors: list[ArgumentError] = []
+        validate = self._validator()
+        if validate is not None:
+            validate(arguments, '$', errors)
+        for name in self._path_params:
+            if arguments.get(name) is None and not any(
+                    error["path"] == f'$.{name}' for error in errors):
+                _fail(errors, f'$.{name}', "missing path parameter")
+        if errors:
+            raise InvalidArguments(errors)
+
+    def request(self, arguments: dict[str, Any]) -> tuple[
+            str, dict[str, Any], dict[str, Any], dict[str, str]]:
+        """
+        (url, query params, json body, headers) of a call with `arguments`,
+        once they are validated
+        """
+        self.validate(arguments)
+        params: dict[str, Any] = {}
+        body: dict[str, Any] = {}
+        headers: dict[str, str] = {}
+        for name, value in arguments.items():
+            match self.locations.get(name):
+                case ParameterLocation.QUERY:
+                    params[name] = value
+                case ParameterLocation.PATH:
+                    pass
+                case ParameterLocation.HEADER:
+                    headers[name] = str(value)
+                case ParameterLocation.COOKIE:
+                    raise NotImplementedError("Cookie parameters")
+                case _:
+                    body[name] = value
+
+        url = self._segments[0]
+        for name, segment in zip(self._path_params, self._segments[1:]):
+            url += quote(str(arguments[name]), safe='') + segment
+        return url, params, body, headers
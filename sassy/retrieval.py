@@ -0,0 +1,142 @@
+from collections import Counter
+import heapq
+import math
+import re
+from typing import Any, Collection, Container
+
+_WORDS = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+_STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with',
+])
+NAME_WEIGHT = 3
+"""how many times the words of an operation id count in its document"""
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    lowercase word terms of `text`, camelCase identifiers are split into
+    words and plurals are folded into their singular
+    """
+    terms = []
+    for word in _WORDS.findall(text):
+        word = word.lower()
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 ranking over a fixed set of tokenized documents.
+    """
+    k1: float
+    b: float
+    _postings: dict[str, list[tuple[int, int]]]
+    """term -> (document, term frequency)"""
+    _lengths: list[int]
+    _avg_length: float
+    _idf: dict[str, float]
+
+    def __init__(
+            self,
+            documents: list[list[str]],
+            k1: float = 1.5,
+            b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = [len(doc) for doc in documents]
+        self._avg_length = \
+            sum(self._lengths) / len(documents) if documents else 0.0
+
+        for i, doc in enumerate(documents):
+            for term, tf in Counter(doc).items():
+                self._postings.setdefault(term, []).append((i, tf))
+
+        n = len(documents)
+        self._idf = {
+            term: math.log(1 + (n - len(ps) + 0.5) / (len(ps) + 0.5))
+            for term, ps in self._postings.items()}
+
+    def search(
+            self, terms: list[str], k: int,
+            allowed: Container[int] | None = None) -> list[int]:
+        """
+        the indexes of the (up to) `k` best matching documents, best first,
+        documents sharing no term with the query are never returned, nor
+        are those not `allowed`
+        """
+        scores: dict[int, float] = {}
+        for term in set(terms):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self._postings[term]:
+                norm = 1 - self.b + \
+                    self.b * self._lengths[doc] / self._avg_length
+                scores[doc] = scores.get(doc, 0.0) + \
+                    idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        if allowed is not None:
+            scores = {
+                doc: score for doc, score in scores.items() if doc in allowed}
+        return heapq.nlargest(k, scores, key=lambda doc: scores[doc])
+
+
+def _schema_terms(schema: Any) -> list[str]:
+    terms = tokenize(schema.get("description") or "")
+    for name, prop in schema.get("properties", {}).items():
+        terms += tokenize(name)
+        terms += _schema_terms(prop)
+    if "items" in schema:
+        terms += _schema_terms(schema["items"])
+    return terms
+
+
+def tool_terms(tool: Any) -> list[str]:
+    """
+    the document of an assistant function tool: its name, description and
+    parameter names and descriptions
+    """
+    fn = tool["function"]
+    return tokenize(fn["name"]) * NAME_WEIGHT \
+        + tokenize(fn.get("description") or "") \
+        + _schema_terms(fn.get("parameters") or {})
+
+
+class ToolSelector:
+    """
+    Picks the assistant function tools most relevant to a message, so a
+    run only carries a handful of tool schemas however large the spec is.
+    """
+    _tools: list[Any]
+    _index: BM25Index
+    _positions: dict[str, int]
+    """tool name -> index"""
+
+    def __init__(self, tools: list[Any]) -> None:
+        self._tools = tools
+        self._index = BM25Index([tool_terms(tool) for tool in tools])
+        self._positions = {
+            tool["function"]["name"]: i for i, tool in enumerate(tools)}
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def select(
+            self, text: str, k: int,
+            names: Collection[str] | None = None) -> list[Any]:
+        """
+        the `k` tools most relevant to `text`, among those `names` when
+        given
+        """
+        allowed = None if names is None else {
+            self._positions[name] for name in names
+            if name in self._positions}
+        return [
+            self._tools[i]
+            for i in self._index.search(tokenize(text), k, allowed)]
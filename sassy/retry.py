@@ -0,0 +1,147 @@
+"""
+Retries and hedged requests of the idempotent calls, see `RetryPolicy`.
+"""
+import asyncio
+import collections
+import itertools
+import math
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from .data_model.oas import RetryPolicy
+from .upstream import CircuitOpen, RetryBudget
+
+
+T = TypeVar('T')
+
+HEDGE_QUANTILE = 0.95
+DEFAULT_LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+"""latencies observed before the quantile is trusted"""
+
+
+class LatencyWindow:
+    """
+    the latencies of the last calls of an operation
+    """
+    _samples: collections.deque[float]
+    _sorted: list[float] | None
+    """`_samples` in order, until the next sample"""
+
+    def __init__(self, size: int = DEFAULT_LATENCY_WINDOW) -> None:
+        self._samples = collections.deque(maxlen=size)
+        self._sorted = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._sorted = None
+
+    def quantile(self, q: float) -> float | None:
+        """
+        the `q` quantile of the window, None until there are enough samples
+        """
+        if len(self._samples) < MIN_LATENCY_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(
+            len(self._sorted) - 1, math.ceil(q * len(self._sorted)) - 1)]
+
+
+def backoff(policy: RetryPolicy, attempt: int) -> float:
+    """
+    seconds to wait before the attempt following `attempt`, with full
+    jitter so the calls failing together do not come back together
+    """
+    return random.uniform(
+        0, min(policy.max_backoff, policy.backoff * 2 ** (attempt - 1)))
+
+
+async def _timed(
+        attempt: Callable[[], Awaitable[T]], policy: RetryPolicy) -> T:
+    if policy.timeout is None:
+        return await attempt()
+    return await asyncio.wait_for(attempt(), policy.timeout)
+
+
+async def hedged(
+        attempt: Callable[[], Awaitable[T]],
+        policy: RetryPolicy,
+        latencies: LatencyWindow,
+        budget: RetryBudget | None = None) -> T:
+    """
+    run `attempt`, and a second one when the first is still running after
+    the p95 latency of `latencies`. The first to succeed wins and the
+    other is cancelled.
+    """
+    delay = latencies.quantile(HEDGE_QUANTILE) if policy.hedge else None
+    if delay is None and policy.hedge:
+        delay = policy.hedge_after
+
+    started = time.perf_counter()
+    first = asyncio.ensure_future(_timed(attempt, policy))
+    tasks = [first]
+    try:
+        if delay is not None:
+            await asyncio.wait(tasks, timeout=delay)
+            if not first.done() and (budget is None or budget.withdraw()):
+                tasks.append(asyncio.ensure_future(_timed(attempt, policy)))
+
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            # a failure only counts once every attempt failed
+            if not pending:
+                return done.pop().result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # the latency of the first request, or as long as it was waited
+        # on, which is past the quantile anyway
+        latencies.add(time.perf_counter() - started)
+
+
+async def retrying(
+        attempt: Callable[[], Awaitable[T]],
+        policy: RetryPolicy,
+        latencies: LatencyWindow,
+        budget: RetryBudget | None,
+        transient: Callable[[T | BaseException], bool]) -> T:
+    """
+    run `attempt` hedged, again after a jittered backoff while it fails
+    with something `transient`, up to `policy.max_attempts` times and as
+    long as the budget of the host allows. The last failure is returned, or
+    raised, as it is.
+    """
+    if budget is not None:
+        budget.deposit()
+
+    previous: T | BaseException | None = None
+    for n in itertools.count(1):
+        last = n >= policy.max_attempts
+        result: T | BaseException
+        try:
+            result = await hedged(attempt, policy, latencies, budget)
+        except CircuitOpen as e:
+            # the host went down in between, keep the failure it gave
+            result = e if previous is None else previous
+            last = True
+        except Exception as e:
+            result = e
+
+        if last or not transient(result) \
+                or not (budget is None or budget.withdraw()):
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        previous = result
+        await asyncio.sleep(backoff(policy, n))
+    raise AssertionError('unreachable')
@@ -1,29 +1,54 @@
 from abc import ABC, abstractmethod
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import heapq
+import hmac
 import os
-import time
 import json
-from typing import Any
-from openai import OpenAI
+import random
+import re
+import signal
+import time
+from typing import Any, AsyncIterator, Callable, Mapping
+from openai import AsyncOpenAI, NotFoundError, RateLimitError
 from pydantic import BaseModel
 from quart import Quart, Response, request, jsonify
-from logging import Logger
-from logging.config import dictConfig
+from logging import DEBUG, Logger
+from openai.types.beta import Assistant
+from openai.types.beta.assistant_stream_event import ErrorEvent, \
+        ThreadMessageDelta, ThreadRunCancelled, ThreadRunCompleted, \
+        ThreadRunExpired, ThreadRunFailed, ThreadRunRequiresAction
 from openai.types.beta.threads import RequiredActionFunctionToolCall, \
-        TextContentBlock
-
-from .functions import FunctionRegistry
+        Run, TextContentBlock, TextDeltaBlock
+from openai.types.beta.threads.run_submit_tool_outputs_params import \
+        ToolOutput
 
-dictConfig({
-    'version': 1,
-    'loggers': {
-        'sassy.server': {
-            'level': 'DEBUG',
-        },
-    },
-})
+from .admission import DEFAULT_MAX_CONCURRENT_CHATS, \
+        DEFAULT_MAX_QUEUED_CHATS, AdmissionControl, Overloaded, Ticket
+from .auth import Token
+from .functions import FunctionRegistry, RegistryDiff
+from .logs import EventLog
+from .metrics import CONTENT_TYPE, Metrics
+from .plan import InvalidArguments
+from .retrieval import ToolSelector
+from .tenants import TenantRegistry, UnknownTenant
+from .upstream import CircuitOpen
 
 ASSISTANT_DEF_FILE = '.assistant.json'
 ASSISTANT_LOCK_FILE = '.assistant.json.lock'
+POLL_MIN_INTERVAL = 0.2
+POLL_MAX_INTERVAL = 2.0
+POLL_BACKOFF = 1.5
+POLL_JITTER = 0.2
+DEFAULT_POLL_QPS = 20.0
+PENDING_RUN_STATUSES = ('queued', 'in_progress', 'cancelling')
+ASSISTANT_HASH_KEY = 'sassy_config_hash'
+"""assistant metadata key holding the hash of its configuration"""
+DEFAULT_TOOL_CONCURRENCY = 8
+ASSISTANT_TOOL_LIMIT = 128
+DEFAULT_TOOL_TOP_K = 16
 
 
 class ChatRequest(BaseModel):
@@ -32,81 +57,503 @@ class ChatRequest(BaseModel):
     security: dict[str, str]
     """operation_id -> bearer token, __default__ will be used if no
     operation_id matches, if no __default__ no token is used"""
+    tenant: str | None = None
+    """the org the tool calls go to, the one of the spec when unset"""
+
+
+def assistant_hash(config: dict[str, Any]) -> str:
+    """
+    a digest of the instructions, model and tools of an assistant, stable
+    across key order and formatting
+    """
+    canonical = json.dumps(
+        config, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _duration(value: str) -> float | None:
+    """
+    seconds of a rate limit reset such as `1s`, `6m0s` or `20ms`
+    """
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+def _retry_after(headers: Mapping[str, str]) -> float | None:
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+class _PolledRun:
+    future: asyncio.Future
+    interval: float
+
+
+class RunPoller:
+    """
+    Polls the status of every in-flight run from a single task.
+
+    Each run is polled on its own interval, short at first and backing off
+    with jitter while the run stays pending, and the awaiting chat is woken
+    up through a future once the run needs attention. Polls are spaced so
+    that no more than `max_qps` go out per second however many chats are
+    waiting, and polling pauses whenever the rate limit headers of OpenAI
+    say the budget is spent.
+    """
+    max_qps: float
+    min_interval: float
+    max_interval: float
+    backoff: float
+    jitter: float
+    _openai: AsyncOpenAI
+    _metrics: Metrics
+    _runs: dict[tuple[str, str], _PolledRun]
+    _due: list[tuple[float, int, tuple[str, str]]]
+    """heap of (poll at, tie breaker, (thread_id, run_id))"""
+    _seq: int
+    _next_slot: float
+    """earliest time the next poll may go out under `max_qps`"""
+    _paused_until: float
+    _wakeup: asyncio.Event
+    _task: asyncio.Task | None
+    _polls: set[asyncio.Task]
+    _clock: Callable[[], float]
+
+    def __init__(
+            self,
+            openai: AsyncOpenAI,
+            metrics: Metrics,
+            max_qps: float = DEFAULT_POLL_QPS,
+            min_interval: float = POLL_MIN_INTERVAL,
+            max_interval: float = POLL_MAX_INTERVAL,
+            backoff: float = POLL_BACKOFF,
+            jitter: float = POLL_JITTER,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        assert max_qps > 0, "polling rate must be positive"
+        self.max_qps = max_qps
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self._openai = openai
+        self._metrics = metrics
+        self._runs = {}
+        self._due = []
+        self._seq = 0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._polls = set()
+        self._clock = clock
+
+    async def wait(self, thread_id: str, run_id: str) -> Run:
+        """
+        the run once it is no longer pending, i.e. it requires action or
+        reached a terminal status
+        """
+        key = (thread_id, run_id)
+        polled = self._runs.get(key)
+        if polled is None:
+            polled = _PolledRun()
+            polled.future = asyncio.get_running_loop().create_future()
+            polled.interval = self.min_interval
+            self._runs[key] = polled
+            self._schedule(key, polled.interval)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+        return await polled.future
+
+    def _schedule(self, key: tuple[str, str], delay: float) -> None:
+        spread = 1 + random.uniform(-self.jitter, self.jitter)
+        self._seq += 1
+        heapq.heappush(
+            self._due, (self._clock() + delay * spread, self._seq, key))
+        self._wakeup.set()
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(
+            self._paused_until, self._clock() + seconds)
+
+    async def _loop(self) -> None:
+        while True:
+            if not self._due:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            at, _, key = self._due[0]
+            delay = max(at, self._next_slot, self._paused_until) \
+                - self._clock()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._due)
+            polled = self._runs.get(key)
+            if polled is None or polled.future.done():
+                # the chat went away, stop polling its run
+                self._runs.pop(key, None)
+                continue
+
+            self._next_slot = max(self._clock(), self._next_slot) \
+                + 1 / self.max_qps
+            poll = asyncio.ensure_future(self._poll(key, polled))
+            self._polls.add(poll)
+            poll.add_done_callback(self._polls.discard)
+
+    async def _poll(self, key: tuple[str, str], polled: _PolledRun) -> None:
+        thread_id, run_id = key
+        try:
+            with self._metrics.stage('runs.retrieve'):
+                raw = await self._openai.beta.threads.runs.with_raw_response \
+                    .retrieve(thread_id=thread_id, run_id=run_id)
+            run = raw.parse()
+        except RateLimitError as e:
+            self._pause(_retry_after(e.response.headers) or self.max_interval)
+            self._schedule(key, 0)
+            return
+        except Exception as e:
+            self._runs.pop(key, None)
+            if not polled.future.done():
+                polled.future.set_exception(e)
+            return
+
+        if raw.headers.get('x-ratelimit-remaining-requests') == '0':
+            self._pause(_duration(
+                raw.headers.get('x-ratelimit-reset-requests', ''))
+                or self.max_interval)
+
+        if run.status in PENDING_RUN_STATUSES:
+            polled.interval = min(
+                self.max_interval, polled.interval * self.backoff)
+            self._schedule(key, polled.interval)
+            return
+
+        self._runs.pop(key, None)
+        if not polled.future.done():
+            polled.future.set_result(run)
+
+    async def aclose(self) -> None:
+        tasks = list(self._polls)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for polled in self._runs.values():
+            polled.future.cancel()
+        self._runs = {}
+        self._due = []
+        self._task = None
 
 
 class BaseServer(ABC):
-    _openai: OpenAI
+    _openai: AsyncOpenAI
     _assistant_id: str
     _logger: Logger
+    _events: EventLog
+    """the payloads of the chats and tool calls, sampled and capped"""
+    _metrics: Metrics
+    _poller: RunPoller
+    _admission: AdmissionControl
+
+    @abstractmethod
+    async def setup(self) -> None:
+        """
+        one-off async initialization, run once the event loop is up
+        """
+        pass
+
+    @abstractmethod
+    async def teardown(self) -> None:
+        """
+        release the resources held by the server once serving stops
+        """
+        pass
+
+    @abstractmethod
+    async def reload(self) -> RegistryDiff:
+        """
+        reload the spec and start serving its operations without dropping
+        the running chats
+        """
+        pass
 
     @abstractmethod
-    def _execute_tool_calls(
+    async def _execute_tool_calls(
             self,
             thread_id: str,
             run_id: str,
             tool_calls: list[RequiredActionFunctionToolCall],
-            security: dict[str, str]):
+            security: dict[str, str],
+            tenant: str | None = None):
         pass
 
-    def post_thread(self) -> dict[str, Any]:
-        thread = self._openai.beta.threads.create()
-        self._logger.info(thread)
+    @abstractmethod
+    async def _invoke_tool_calls(
+            self,
+            tool_calls: list[RequiredActionFunctionToolCall],
+            security: dict[str, str],
+            tenant: str | None = None) -> list[ToolOutput]:
+        """
+        invoke the tool calls and return their outputs without submitting
+        them back to the run
+        """
+        pass
+
+    def _check_tenant(self, tenant: str | None) -> None:
+        """
+        raises `UnknownTenant` unless `tenant` is served
+        """
+        if tenant is not None:
+            raise UnknownTenant(tenant)
+
+    def _run_options(self, req: ChatRequest) -> dict[str, Any]:
+        """
+        extra parameters of the run created for `req`
+        """
+        return {}
+
+    async def post_thread(self) -> dict[str, Any]:
+        thread = await self._openai.beta.threads.create()
+        self._events.event('thread.created', thread_id=thread.id)
         return thread.model_dump(exclude_unset=True)
 
+    async def get_metrics(self) -> Response:
+        return Response(self._metrics.render(), content_type=CONTENT_TYPE)
+
     async def chat(self) -> Response:
-        data = await request.json
-        self._logger.info(f'received {data}')
-        req = ChatRequest(**data)
+        req = ChatRequest(**await request.json)
+        self._events.event(
+            'chat.received', thread_id=req.thread_id, tenant=req.tenant,
+            content=req.content)
+        ticket = self._admit(req, '/chat')
 
-        thread = self._openai.beta.threads.messages.create(
-                thread_id=req.thread_id, role="user", content=req.content)
+        try:
+            with self._metrics.stage('chat', thread_id=req.thread_id):
+                async with self._admitted(ticket):
+                    response = await self._chat(req)
+        except Exception:
+            self._metrics.chats.inc(route='/chat', outcome='error')
+            raise
+        self._metrics.chats.inc(route='/chat', outcome='ok')
 
-        run = self._openai.beta.threads.runs.create(
-                thread_id=thread.thread_id,
-                assistant_id=self._assistant_id)
+        self._events.event(
+            'chat.response', thread_id=req.thread_id, response=response)
+        return jsonify({"response": response})
+
+    def _admit(self, req: ChatRequest, route: str) -> Ticket:
+        self._check_tenant(req.tenant)
+        try:
+            return self._admission.admit(req.thread_id)
+        except Overloaded:
+            self._metrics.chats.inc(route=route, outcome='rejected')
+            raise
+
+    def _check_admission(self, req: ChatRequest, route: str) -> None:
+        self._check_tenant(req.tenant)
+        try:
+            self._admission.check(req.thread_id)
+        except Overloaded:
+            self._metrics.chats.inc(route=route, outcome='rejected')
+            raise
+
+    @contextlib.asynccontextmanager
+    async def _admitted(self, ticket: Ticket) -> AsyncIterator[None]:
+        """
+        wait for the turn of `ticket`, once the previous chats of its
+        thread are done and a slot is free
+        """
+        started = time.perf_counter()
+        async with ticket:
+            self._metrics.stage_seconds.observe(
+                time.perf_counter() - started, stage='queue')
+            yield
+
+    async def _chat(self, req: ChatRequest) -> str:
+        stage = self._metrics.stage
+
+        with stage('messages.create'):
+            thread = await self._openai.beta.threads.messages.create(
+                    thread_id=req.thread_id, role="user", content=req.content)
+
+        with stage('runs.create'):
+            run = await self._openai.beta.threads.runs.create(
+                    thread_id=thread.thread_id,
+                    assistant_id=self._assistant_id,
+                    **self._run_options(req))
 
         while True:
-            run_status = self._openai.beta.threads.runs.retrieve(
-                    thread_id=req.thread_id, run_id=run.id)
-            print('.', end="", flush=True)
+            with stage('runs.wait'):
+                run_status = await self._poller.wait(req.thread_id, run.id)
 
             if run_status.status == 'completed':
-                print("")
                 break
 
             elif run_status.status == 'requires_action':
                 assert run_status.required_action
-                print("")
 
                 try:
-                    self._execute_tool_calls(
-                        req.thread_id,
-                        run.id,
-                        run_status
-                        .required_action
-                        .submit_tool_outputs
-                        .tool_calls,
-                        req.security)
+                    with stage('requires_action', run_id=run.id):
+                        await self._execute_tool_calls(
+                            req.thread_id,
+                            run.id,
+                            run_status
+                            .required_action
+                            .submit_tool_outputs
+                            .tool_calls,
+                            req.security,
+                            req.tenant)
                 except Exception as e:
-                    self._openai.beta.threads.runs.cancel(
+                    await self._openai.beta.threads.runs.cancel(
                         run_id=run.id, thread_id=req.thread_id)
                     raise e
 
-                time.sleep(1)  # Wait for a second before checking again
+            else:
+                raise RuntimeError(
+                    f'run {run.id} ended with status {run_status.status}')
 
         # Retrieve and return the latest message from the assistant
-        content = self._openai.beta.threads.messages.list(
-                thread_id=req.thread_id
-            ).data[0].content[0]
+        with stage('messages.list'):
+            messages = await self._openai.beta.threads.messages.list(
+                    thread_id=req.thread_id)
+        content = messages.data[0].content[0]
 
         match content:
             case TextContentBlock():
-                response = content.text.value
+                return content.text.value
             case _:
-                response = "unhandled message content type"
+                return "unhandled message content type"
 
-        self._logger.info(f"Assistant response: {response}")
-        return jsonify({"response": response})
+    async def chat_stream(self) -> Response:
+        req = ChatRequest(**await request.json)
+        self._events.event(
+            'chat.received', thread_id=req.thread_id, tenant=req.tenant,
+            content=req.content)
+        # turned away with a 429 up front, but only queued once the body is
+        # streamed: a client gone before that would never give its place
+        # back
+        self._check_admission(req, '/chat/stream')
+
+        response = Response(
+            self._stream_chat(req),
+            headers={
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+            })
+        response.timeout = None
+        return response
+
+    async def _stream_chat(self, req: ChatRequest) -> AsyncIterator[str]:
+        try:
+            ticket = self._admit(req, '/chat/stream')
+        except Overloaded as e:
+            yield _sse('error', {
+                'message': str(e), 'retry_after': e.retry_after})
+            return
+
+        async with self._admitted(ticket):
+            with self._metrics.stage('messages.create'):
+                await self._openai.beta.threads.messages.create(
+                        thread_id=req.thread_id, role="user",
+                        content=req.content)
+
+            async for event in self._stream_run(req):
+                yield event
+
+    async def _stream_run(self, req: ChatRequest) -> AsyncIterator[str]:
+        """
+        consume the run event stream, relaying text deltas as server-sent
+        events and resolving tool calls inline as the run asks for them
+        """
+        text: list[str] = []
+        stream = self._openai.beta.threads.runs.stream(
+            thread_id=req.thread_id,
+            assistant_id=self._assistant_id,
+            **self._run_options(req))
+
+        while stream is not None:
+            async with stream as events:
+                stream = None
+                async for event in events:
+                    match event:
+                        case ThreadMessageDelta():
+                            for block in event.data.delta.content or []:
+                                if isinstance(block, TextDeltaBlock) \
+                                        and block.text \
+                                        and block.text.value:
+                                    text.append(block.text.value)
+                                    yield _sse(
+                                        'delta', {'text': block.text.value})
+
+                        case ThreadRunRequiresAction():
+                            run = event.data
+                            assert run.required_action
+                            try:
+                                with self._metrics.stage(
+                                        'requires_action', run_id=run.id):
+                                    outputs = await self._invoke_tool_calls(
+                                        run
+                                        .required_action
+                                        .submit_tool_outputs
+                                        .tool_calls,
+                                        req.security,
+                                        req.tenant)
+                            except Exception as e:
+                                self._metrics.chats.inc(
+                                    route='/chat/stream', outcome='error')
+                                await self._openai.beta.threads.runs.cancel(
+                                    run_id=run.id, thread_id=req.thread_id)
+                                raise e
+
+                            stream = self._openai.beta.threads.runs \
+                                .submit_tool_outputs_stream(
+                                    thread_id=req.thread_id,
+                                    run_id=run.id,
+                                    tool_outputs=outputs)
+                            # the run pauses on requires_action, carry on
+                            # with the stream of the resumed run
+                            break
+
+                        case ThreadRunCompleted():
+                            response = ''.join(text)
+                            self._events.event(
+                                'chat.response', thread_id=req.thread_id,
+                                response=response)
+                            self._metrics.chats.inc(
+                                route='/chat/stream', outcome='ok')
+                            yield _sse('done', {'response': response})
+
+                        case ThreadRunFailed() | ThreadRunCancelled() \
+                                | ThreadRunExpired():
+                            self._metrics.chats.inc(
+                                route='/chat/stream', outcome='error')
+                            yield _sse('error', {'status': event.data.status})
+
+                        case ErrorEvent():
+                            self._metrics.chats.inc(
+                                route='/chat/stream', outcome='error')
+                            yield _sse(
+                                'error', {'message': event.data.message})
+
+
+def _sse(event: str, data: Any) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
 
 
 app = Quart(__name__)
@@ -116,9 +563,68 @@ def server(app) -> BaseServer:
     return app.config["SERVER"]
 
 
+@app.errorhandler(UnknownTenant)
+async def unknown_tenant(e: UnknownTenant):
+    return jsonify({"error": f"unknown tenant {e.args[0]}"}), 404
+
+
+class AdminDenied(PermissionError):
+    """an admin route was called without the admin token, or from another
+    host when there is none"""
+    status: int
+
+    def __init__(self, message: str, status: int) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+LOCAL_ADDRESSES = frozenset({'127.0.0.1', '::1'})
+
+
+def check_admin() -> None:
+    """
+    let the request through to an admin route if it brings the admin token
+    as its bearer token, or comes from this host when no admin token is
+    configured
+    """
+    token = app.config.get("ADMIN_TOKEN")
+    if token is None:
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            raise AdminDenied(
+                'admin routes only answer local callers without an admin '
+                'token configured', 403)
+        return
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(
+            authorization.encode(), f'Bearer {token}'.encode()):
+        raise AdminDenied('a valid admin token is required', 401)
+
+
+@app.errorhandler(AdminDenied)
+async def admin_denied(e: AdminDenied):
+    headers = {"WWW-Authenticate": "Bearer"} if e.status == 401 else {}
+    return jsonify({"error": str(e)}), e.status, headers
+
+
+@app.errorhandler(Overloaded)
+async def overloaded(e: Overloaded):
+    return jsonify({"error": str(e)}), 429, \
+        {"Retry-After": str(e.retry_after)}
+
+
+@app.before_serving
+async def setup():
+    await server(app).setup()
+
+
+@app.after_serving
+async def teardown():
+    await server(app).teardown()
+
+
 @app.route('/thread', methods=['POST'])
 async def post_thread():
-    return server(app).post_thread()
+    return await server(app).post_thread()
 
 
 @app.route('/chat', methods=['POST'])
@@ -126,78 +632,407 @@ async def chat():
     return await server(app).chat()
 
 
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    return await server(app).chat_stream()
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return await server(app).get_metrics()
+
+
+@app.route('/admin/reload', methods=['POST'])
+async def reload():
+    check_admin()
+    return (await server(app).reload()).model_dump()
+
+
 class Server(BaseServer):
-    _openai: OpenAI
+    _openai: AsyncOpenAI
     _assistant_id: str
     _logger: Logger
     _function_registry: FunctionRegistry
+    _tenants: dict[str, TenantRegistry]
+    """the registries of the tenants, on top of `_function_registry`"""
+    _tool_concurrency: int
+    """upper bound of tool calls invoked at once for a single run step"""
+    _composite: bool
+    """whether the tool calls of a step bound for the same org are sent
+    as one Salesforce composite request"""
+    _tool_top_k: int | None
+    """when set, runs only carry the `_tool_top_k` function tools most
+    relevant to the message instead of every function of the registry"""
+    _tool_selector: ToolSelector | None
+    _base_tools: list[Any]
+    """the non-function tools of the assistant definition"""
+    _assistant_def_file: str
+    _assistant_lock_file: str
+    _metrics: Metrics
+    _spec_source: Callable[[], str] | None
+    """reads the current spec text, reloads are off when unset"""
+    _spec_token: Token
+    _reload_lock: asyncio.Lock
 
     def __init__(
             self,
-            openai: OpenAI,
+            openai: AsyncOpenAI,
             logger: Logger,
-            spec: Any,
-            token: str | None) -> None:
+            function_registry: FunctionRegistry,
+            tool_concurrency: int = DEFAULT_TOOL_CONCURRENCY,
+            tool_top_k: int | None = None,
+            assistant_def_file: str = ASSISTANT_DEF_FILE,
+            assistant_lock_file: str = ASSISTANT_LOCK_FILE,
+            metrics: Metrics | None = None,
+            poll_qps: float = DEFAULT_POLL_QPS,
+            max_concurrent_chats: int = DEFAULT_MAX_CONCURRENT_CHATS,
+            max_queued_chats: int = DEFAULT_MAX_QUEUED_CHATS,
+            spec_source: Callable[[], str] | None = None,
+            spec_token: Token = None,
+            composite: bool = True,
+            events: EventLog | None = None,
+            tenants: dict[str, TenantRegistry] | None = None) -> None:
         self._openai = openai
         self._logger = logger
-        self._function_registry = FunctionRegistry.from_openapi_spec(
-            spec, token)
-        self._configure_assistant()
-
-    def _configure_assistant(self) -> None:
-        more_tools = self._function_registry.dump_assistant_tools()
-        if os.path.exists(ASSISTANT_LOCK_FILE):
-            with open(ASSISTANT_LOCK_FILE, 'r') as file:
-                assistant_data = json.load(file)
-                assistant_id = assistant_data['id']
-                self._logger.info(
-                        f'Loaded existing assistant ID {assistant_id}')
-                self._assistant_id = assistant_id
-            return
+        self._events = events if events else EventLog(logger)
+        # the tool calls are measured along with the chats
+        if metrics is None:
+            metrics = function_registry.transport.metrics or Metrics()
+        if function_registry.transport.metrics is None:
+            function_registry.transport.metrics = metrics
+        self._metrics = metrics
+        self._poller = RunPoller(openai, metrics, max_qps=poll_qps)
+        self._admission = AdmissionControl(
+            max_concurrent_chats, max_queued_chats)
+        self._assistant_def_file = assistant_def_file
+        self._assistant_lock_file = assistant_lock_file
+        self._tool_concurrency = tool_concurrency
+        self._composite = composite
+        self._base_tools = []
+        self._spec_source = spec_source
+        self._spec_token = spec_token
+        self._reload_lock = asyncio.Lock()
+        self._tenants = tenants or {}
+        self._use_registry(function_registry, tool_top_k)
+
+    def _use_registry(
+            self,
+            function_registry: FunctionRegistry,
+            tool_top_k: int | None) -> None:
+        tools = function_registry.dump_assistant_tools()
+        if tool_top_k is None and len(tools) > ASSISTANT_TOOL_LIMIT:
+            self._logger.info(
+                f'{len(tools)} functions exceed the assistant tool limit, '
+                f'selecting the top {DEFAULT_TOOL_TOP_K} tools per message')
+            tool_top_k = DEFAULT_TOOL_TOP_K
+        selector = ToolSelector(tools) if tool_top_k else None
+
+        # swapped together without yielding, chats see one registry or the
+        # other but never a mix
+        self._function_registry = function_registry
+        self._tenants = {
+            name: tenant if tenant.base is function_registry
+            else tenant.rebased(function_registry)
+            for name, tenant in self._tenants.items()}
+        self._tool_top_k = tool_top_k
+        self._tool_selector = selector
+
+    def _check_tenant(self, tenant: str | None) -> None:
+        if tenant is not None and tenant not in self._tenants:
+            raise UnknownTenant(tenant)
+
+    def _registry(self, tenant: str | None) -> FunctionRegistry:
+        if tenant is None:
+            return self._function_registry
+        try:
+            return self._tenants[tenant]
+        except KeyError:
+            raise UnknownTenant(tenant)
+
+    async def setup(self) -> None:
+        await self._configure_assistant()
+        if self._spec_source is not None:
+            try:
+                asyncio.get_running_loop().add_signal_handler(
+                    signal.SIGHUP, self._reload_in_background)
+            except (NotImplementedError, RuntimeError, ValueError):
+                self._logger.warning('reloading on SIGHUP is not available')
+
+    def _reload_in_background(self) -> None:
+        async def reload() -> None:
+            try:
+                await self.reload()
+            except Exception:
+                self._logger.exception('failed to reload the spec')
 
-        with open(ASSISTANT_DEF_FILE, 'r') as def_f:
+        asyncio.ensure_future(reload())
+
+    async def reload(self) -> RegistryDiff:
+        if self._spec_source is None:
+            raise RuntimeError('no spec to reload from')
+        spec_source = self._spec_source
+
+        async with self._reload_lock:
+            # parsing runs off the event loop, chats carry on meanwhile
+            registry, diff = await asyncio.to_thread(
+                lambda: self._function_registry.reload_openapi_spec(
+                    spec_source(), self._spec_token))
+            self._logger.info(
+                f'reloaded the spec, added {diff.added}, '
+                f'changed {diff.changed}, removed {diff.removed}')
+            if diff.empty:
+                return diff
+
+            self._use_registry(
+                registry, self._tool_top_k if self._tool_selector else None)
+            # pushes the tools only when the assistant differs
+            await self._configure_assistant()
+            return diff
+
+    async def teardown(self) -> None:
+        await self._poller.aclose()
+        await self._function_registry.transport.aclose()
+
+    def _run_options(self, req: ChatRequest) -> dict[str, Any]:
+        registry = self._registry(req.tenant)
+        # the tools of the assistant are those of the whole spec
+        operations = registry.operations \
+            if isinstance(registry, TenantRegistry) else None
+        if self._tool_selector is None or self._tool_top_k is None:
+            if operations is None:
+                return {}
+            return {
+                "tools": self._base_tools + registry.dump_assistant_tools()}
+
+        selected = self._tool_selector.select(
+            req.content, self._tool_top_k, operations)
+        self._events.event(
+            'tools.selected',
+            tools=[tool['function']['name'] for tool in selected])
+        return {"tools": self._base_tools + selected}
+
+    async def _configure_assistant(self) -> None:
+        with open(self._assistant_def_file, 'r') as def_f:
             assistant_def = json.load(def_f)
 
-        tools = assistant_def["tools"]
+        self._base_tools = assistant_def["tools"]
+
+        # with tool selection the function tools are attached per run
+        more_tools = [] if self._tool_selector \
+            else self._function_registry.dump_assistant_tools()
 
-        assistant = self._openai.beta.assistants.create(
-            instructions=assistant_def['instructions'],
-            model=assistant_def['model'],
-            tools=tools + more_tools
-        )
+        config = {
+            'instructions': assistant_def['instructions'],
+            'model': assistant_def['model'],
+            'tools': self._base_tools + more_tools,
+        }
+        digest = assistant_hash(config)
 
-        with open(ASSISTANT_LOCK_FILE, 'w') as file:
-            file.write(assistant.model_dump_json(indent=2, exclude_unset=True))
+        # every worker process configures the assistant on startup, the
+        # lock file is held exclusively so only the first one creates or
+        # updates it and the others reuse it
+        with open(self._assistant_lock_file, 'a+') as file:
+            await asyncio.to_thread(fcntl.flock, file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                locked = json.loads(content) if content else None
+                if locked and (locked.get('metadata') or {}) \
+                        .get(ASSISTANT_HASH_KEY) == digest:
+                    self._logger.info(
+                            f'Loaded existing assistant ID {locked["id"]}')
+                    self._assistant_id = locked['id']
+                    return
 
-        self._assistant_id = assistant.id
+                assistant = await self._sync_assistant(
+                    locked['id'] if locked else None, config, digest)
 
-    def _execute_tool_calls(
+                file.seek(0)
+                file.truncate()
+                file.write(
+                    assistant.model_dump_json(indent=2, exclude_unset=True))
+                file.flush()
+                os.fsync(file.fileno())
+                self._assistant_id = assistant.id
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    async def _sync_assistant(
+            self,
+            assistant_id: str | None,
+            config: dict[str, Any],
+            digest: str) -> Assistant:
+        """
+        bring the assistant in line with `config`, updating it in place
+        unless its metadata says it already is, and creating it only when
+        there is none yet
+        """
+        if assistant_id is not None:
+            try:
+                remote = await self._openai.beta.assistants.retrieve(
+                    assistant_id)
+            except NotFoundError:
+                self._logger.warning(
+                    f'Assistant {assistant_id} is gone, creating a new one')
+            else:
+                metadata = dict(remote.metadata or {})
+                if metadata.get(ASSISTANT_HASH_KEY) == digest:
+                    self._logger.info(
+                        f'Assistant {assistant_id} is up to date')
+                    return remote
+
+                self._logger.info(f'Updating assistant {assistant_id}')
+                metadata[ASSISTANT_HASH_KEY] = digest
+                return await self._openai.beta.assistants.update(
+                    assistant_id, **config, metadata=metadata)
+
+        assistant = await self._openai.beta.assistants.create(
+            **config, metadata={ASSISTANT_HASH_KEY: digest})
+        self._logger.info(f'Created assistant {assistant.id}')
+        return assistant
+
+    async def _execute_tool_calls(
             self,
             thread_id: str,
             run_id: str,
             tool_calls: list[RequiredActionFunctionToolCall],
-            security: dict[str, str]):
-        for tool_call in tool_calls:
-            self._logger.info(f"function name: {tool_call.function.name}")
-            self._logger.info(
-                "tool_call.function.arguments: "
-                f"{tool_call.function.arguments}")
+            security: dict[str, str],
+            tenant: str | None = None):
+        outputs = await self._invoke_tool_calls(tool_calls, security, tenant)
+        with self._metrics.stage('runs.submit_tool_outputs'):
+            await self._openai.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run_id,
+                tool_outputs=outputs)
 
-            arguments = json.loads(tool_call.function.arguments)
+    async def _invoke_tool_calls(
+            self,
+            tool_calls: list[RequiredActionFunctionToolCall],
+            security: dict[str, str],
+            tenant: str | None = None) -> list[ToolOutput]:
+        registry = self._registry(tenant)
+        semaphore = asyncio.Semaphore(self._tool_concurrency)
+        if self._composite:
+            groups = registry.composite_groups([
+                (tool_call.function.name,
+                 self._bearer(tool_call.function.name, security))
+                for tool_call in tool_calls])
+        else:
+            groups = [[i] for i in range(len(tool_calls))]
 
-            fn_ident = tool_call.function.name
+        async def bounded(group: list[int]) -> list[ToolOutput]:
+            async with semaphore:
+                if len(group) == 1:
+                    return [await self._invoke_tool_call(
+                        tool_calls[group[0]], security, registry)]
+                return await self._invoke_composite(
+                    [tool_calls[i] for i in group], security, registry)
 
-            bearer = security.get(fn_ident)
-            if not bearer:
-                bearer = security.get("__default__")
+        outputs: dict[int, ToolOutput] = {}
+        for group, group_outputs in zip(groups, await asyncio.gather(
+                *(bounded(group) for group in groups))):
+            outputs.update(zip(group, group_outputs))
+        return [outputs[i] for i in range(len(tool_calls))]
 
-            output = self._function_registry.invoke(
-                fn_ident, bearer, **arguments)
+    @staticmethod
+    def _bearer(fn_ident: str, security: dict[str, str]) -> str | None:
+        bearer = security.get(fn_ident)
+        if not bearer:
+            bearer = security.get("__default__")
+        return bearer
 
-            self._logger.info(f"received openapi invoke result: {output}")
-            self._openai.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread_id,
-                run_id=run_id,
-                tool_outputs=[{
-                    "tool_call_id": tool_call.id,
-                    "output": json.dumps(output)}])
+    def _tool_output(
+            self,
+            tool_call: RequiredActionFunctionToolCall,
+            output: Any) -> ToolOutput:
+        if isinstance(output, InvalidArguments):
+            # tell the model what to fix rather than how it failed
+            self._logger.warning(
+                f"invalid arguments for {tool_call.function.name}: {output}")
+            output = {
+                "error": f"{type(output).__name__}: {output}",
+                "invalid_arguments": output.errors,
+            }
+        elif isinstance(output, CircuitOpen):
+            self._logger.warning(
+                f"not invoking {tool_call.function.name}: {output}")
+            output = {
+                "error": f"{type(output).__name__}: {output}",
+                "retry_after": output.retry_after,
+            }
+        elif isinstance(output, Exception):
+            self._logger.error(
+                f"failed to invoke {tool_call.function.name}",
+                exc_info=output)
+            output = {"error": f"{type(output).__name__}: {output}"}
+        self._events.event(
+            'tool_output', DEBUG, operation=tool_call.function.name,
+            tool_call_id=tool_call.id, output=output)
+        return {"tool_call_id": tool_call.id, "output": json.dumps(output)}
+
+    async def _invoke_tool_call(
+            self,
+            tool_call: RequiredActionFunctionToolCall,
+            security: dict[str, str],
+            registry: FunctionRegistry) -> ToolOutput:
+        """
+        invoke a single tool call, a failure is captured as the output of
+        that call so it does not take down its siblings or the run
+        """
+        self._events.event(
+            'tool_call', operation=tool_call.function.name,
+            tool_call_id=tool_call.id, arguments=tool_call.function.arguments)
+
+        fn_ident = tool_call.function.name
+        bearer = self._bearer(fn_ident, security)
+
+        try:
+            with self._metrics.tracer.span(
+                    'tool_call', operation=fn_ident,
+                    tool_call_id=tool_call.id):
+                arguments = json.loads(tool_call.function.arguments)
+                output = await registry.ainvoke(
+                    fn_ident, bearer, **arguments)
+        except Exception as e:
+            output = e
+
+        return self._tool_output(tool_call, output)
+
+    async def _invoke_composite(
+            self,
+            tool_calls: list[RequiredActionFunctionToolCall],
+            security: dict[str, str],
+            registry: FunctionRegistry) -> list[ToolOutput]:
+        """
+        invoke tool calls bound for the same org as one composite request,
+        each failure is captured as the output of its own call
+        """
+        outputs: dict[str, Any] = {}
+        calls = []
+        for tool_call in tool_calls:
+            self._events.event(
+                'tool_call', operation=tool_call.function.name,
+                tool_call_id=tool_call.id, composite=True,
+                arguments=tool_call.function.arguments)
+            fn_ident = tool_call.function.name
+            try:
+                arguments = json.loads(tool_call.function.arguments)
+            except Exception as e:
+                outputs[tool_call.id] = e
+                continue
+            calls.append((
+                tool_call, (fn_ident, self._bearer(fn_ident, security),
+                            arguments)))
+
+        if calls:
+            with self._metrics.tracer.span(
+                    'composite',
+                    operations=','.join(call[0] for _, call in calls)):
+                results = await registry.ainvoke_composite(
+                    [call for _, call in calls])
+            for (tool_call, _), result in zip(calls, results):
+                outputs[tool_call.id] = result
+
+        return [
+            self._tool_output(tool_call, outputs[tool_call.id])
+            for tool_call in tool_calls]
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+from typing import Any
+
+from .functions import FunctionRegistry
+
+SNAPSHOT_VERSION = 8
+"""bumped whenever the fields of a snapshot change, so older snapshots are
+compiled again rather than loaded without them"""
+DEFAULT_SNAPSHOT_FILE = '.functions.snapshot.json'
+
+
+def spec_hash(spec: str) -> str:
+    """
+    content hash of the raw spec a snapshot is compiled from
+    """
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+
+def write_snapshot(
+        path: str, digest: str, registry: FunctionRegistry) -> None:
+    """
+    write the compiled `registry` of the spec hashed to `digest`
+    """
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "spec_hash": digest,
+        **registry.dump_snapshot(),
+    }
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str, digest: str) -> dict[str, Any] | None:
+    """
+    the snapshot at `path` if it was compiled from the spec hashed to
+    `digest` by this version of the format, None otherwise
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as file:
+        snapshot = json.load(file)
+
+    if snapshot.get("version") != SNAPSHOT_VERSION \
+            or snapshot.get("spec_hash") != digest:
+        return None
+    return snapshot
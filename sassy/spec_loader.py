@@ -0,0 +1,212 @@
+import hashlib
+import json
+import re
+from typing import Any, Callable, Iterator, TypeVar
+
+from .data_model.oas import Components, Info, OpenAPI, Parameter, \
+        PathItem, Reference, RequestBody, Schema, Server
+from .oasx import ComponentTable, ReferenceIndex
+
+T = TypeVar('T')
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_COMPONENT_REF = re.compile(
+    r'"\$ref"\s*:\s*"#/components/([^/"]+)/([^"]+)"')
+
+Span = tuple[int, int]
+"""[start, end) of a json value in the spec text"""
+
+
+def _skip_ws(text: str, idx: int) -> int:
+    m = _WHITESPACE.match(text, idx)
+    assert m is not None
+    return m.end()
+
+
+def _value_end(text: str, start: int) -> int:
+    # decoding is the fastest way to find the end of a value, the decoded
+    # value is dropped right away
+    _, end = _decoder.raw_decode(text, start)
+    return end
+
+
+def scan_object(
+        text: str, idx: int, member: Callable[[str, int], int]) -> int:
+    """
+    walk the members of the json object starting at `idx`, calling
+    `member(key, start of the value)` for each of them, which returns the
+    end of the value. Returns the end of the object.
+    """
+    idx = _skip_ws(text, idx)
+    if text[idx] != '{':
+        raise ValueError(f"expected an object at {idx}")
+    idx = _skip_ws(text, idx + 1)
+    if text[idx] == '}':
+        return idx + 1
+
+    while True:
+        key, idx = _decoder.raw_decode(text, idx)
+        idx = _skip_ws(text, idx)
+        if text[idx] != ':':
+            raise ValueError(f"expected ':' at {idx}")
+        idx = _skip_ws(text, member(key, _skip_ws(text, idx + 1)))
+        match text[idx]:
+            case ',':
+                idx = _skip_ws(text, idx + 1)
+            case '}':
+                return idx + 1
+            case _:
+                raise ValueError(f"expected ',' or '}}' at {idx}")
+
+
+class LazySpec:
+    """
+    An OpenAPI spec loaded lazily from its json text.
+
+    Only the member spans of the document are indexed up front. Path items
+    are decoded one at a time while iterating `paths`, and a component is
+    only decoded and parsed when a reference to it is resolved, so the
+    memory used scales with the operations registered rather than with the
+    size of the spec. Dropping the `LazySpec` releases the text.
+    """
+    _text: str
+    _root: dict[str, Span]
+    _paths: dict[str, Span]
+    _components: dict[str, dict[str, Span]]
+    """kind of component -> name -> span"""
+    spec: OpenAPI
+    """the spec without paths, its reference index resolves components
+    from the text on demand"""
+
+    def __init__(self, text: str) -> None:
+        self._text = text
+        self._root = {}
+        self._paths = {}
+        self._components = {}
+        self._scan()
+
+        index = ReferenceIndex(
+            self._table('schemas', Schema),
+            self._table('requestBodies', RequestBody),
+            self._table('parameters', Parameter))
+
+        self.spec = OpenAPI.model_construct(
+            openapi=self._decode(self._root['openapi']),
+            info=Info(**self._decode(self._root['info'])),
+            servers=[
+                Server(**s) for s in self._decode(self._root['servers'])],
+            paths={},
+            components=Components())
+        self.spec._ref_index = index
+
+    def _scan(self) -> None:
+        """
+        index the spans of the path items and components in a single pass,
+        only one of them is ever decoded at a time
+        """
+        text = self._text
+
+        def path(key: str, start: int) -> int:
+            end = _value_end(text, start)
+            self._paths[key] = (start, end)
+            return end
+
+        def component(kind: str, start: int) -> int:
+            entries = self._components.setdefault(kind, {})
+
+            def entry(key: str, start: int) -> int:
+                end = _value_end(text, start)
+                entries[key] = (start, end)
+                return end
+
+            return scan_object(text, start, entry)
+
+        def root(key: str, start: int) -> int:
+            match key:
+                case 'paths':
+                    end = scan_object(text, start, path)
+                case 'components':
+                    end = scan_object(text, start, component)
+                case _:
+                    end = _value_end(text, start)
+            self._root[key] = (start, end)
+            return end
+
+        scan_object(text, 0, root)
+
+    def _decode(self, span: Span) -> Any:
+        value, _ = _decoder.raw_decode(self._text, span[0])
+        return value
+
+    def _table(
+            self, name: str, kind: Callable[..., T]) -> ComponentTable[T]:
+        def load(span: Span) -> T | Reference:
+            raw = self._decode(span)
+            return Reference(**raw) if '$ref' in raw else kind(**raw)
+
+        return ComponentTable(
+            f'#/components/{name}/', self._components.get(name), load)
+
+    def paths(self) -> Iterator[tuple[str, PathItem]]:
+        """
+        the path items of the spec, parsed one at a time
+        """
+        for path in self._paths:
+            yield path, self.path_item(path)
+
+    def path_item(self, path: str) -> PathItem:
+        return PathItem(**self._decode(self._paths[path]))
+
+    def _canonical(self, span: Span) -> str:
+        """
+        the value at `span` re-encoded regardless of the formatting of the
+        spec
+        """
+        return json.dumps(
+            self._decode(span), sort_keys=True, separators=(',', ':'))
+
+    def path_digests(self) -> dict[str, str]:
+        """
+        path -> content hash of everything its operations are built from:
+        the servers, the path item and the components it references,
+        directly or not, so it changes whenever one of its operations does
+        """
+        components: dict[tuple[str, str], tuple[str, list] | None] = {}
+
+        def component(kind: str, name: str) -> tuple[str, list] | None:
+            """(content hash, references) of a component"""
+            if (kind, name) not in components:
+                span = self._components.get(kind, {}).get(name)
+                if span is None:
+                    components[(kind, name)] = None
+                else:
+                    text = self._canonical(span)
+                    components[(kind, name)] = (
+                        hashlib.sha256(text.encode()).hexdigest(),
+                        _COMPONENT_REF.findall(text))
+            return components[(kind, name)]
+
+        servers = self._canonical(self._root['servers'])
+        digests = {}
+        for path, span in self._paths.items():
+            item = self._canonical(span)
+            reached: dict[tuple[str, str], str] = {}
+            pending = _COMPONENT_REF.findall(item)
+            while pending:
+                kind, name = pending.pop()
+                found = component(kind, name)
+                if (kind, name) in reached or found is None:
+                    continue
+                reached[(kind, name)] = found[0]
+                pending.extend(found[1])
+
+            digest = hashlib.sha256()
+            parts = [servers, path, item] + [
+                f'{kind}/{name}:{sha}'
+                for (kind, name), sha in sorted(reached.items())]
+            for part in parts:
+                digest.update(part.encode())
+                digest.update(b'\0')
+            digests[path] = digest.hexdigest()
+        return digests
@@ -0,0 +1,121 @@
+"""
+Tenants, the Salesforce orgs served by one process: each has its own server,
+token and subset of the operations of the spec, and calls the functions
+compiled once for all of them.
+"""
+import json
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+from .auth import Token, token_from_settings
+from .functions import Function, FunctionRegistry, RESTFunctionInvoker
+from .transport import HTTPTransport
+
+
+class Tenant(BaseModel):
+    """an org, as listed in the tenants file"""
+    name: str
+    server_url: str | None = Field(default=None, alias="serverUrl")
+    """replaces the server of the spec, such as
+    https://acme.my.salesforce.com/services"""
+    operations: list[str] | None = None
+    """the operations the tenant may call, all of them when unset"""
+    access_token: str | None = Field(default=None, alias="accessToken")
+    client_id: str | None = Field(default=None, alias="clientId")
+    client_secret: str | None = Field(default=None, alias="clientSecret")
+    username: str | None = None
+    private_key_file: str | None = Field(
+        default=None, alias="privateKeyFile")
+    login_url: str | None = Field(default=None, alias="loginUrl")
+
+    def token(self, transport: HTTPTransport | None = None) -> Token:
+        return token_from_settings(
+            self.access_token, self.client_id, self.client_secret,
+            self.username, self.private_key_file, self.login_url, transport)
+
+
+class UnknownTenant(KeyError):
+    """a chat asked for a tenant that is not served"""
+
+
+def read_tenants(path: str) -> list[Tenant]:
+    """
+    the tenants of a JSON file holding a list of them
+    """
+    with open(path) as f:
+        data: list[dict[str, Any]] = json.load(f)
+    return [Tenant(**tenant) for tenant in data]
+
+
+class TenantRegistry(FunctionRegistry):
+    """
+    The functions of a base registry as a tenant calls them, on its server
+    and with its token. They share the functions of the base but for the
+    invoker, which is only made on the first call of each operation, so a
+    tenant costs memory for the operations it calls rather than for the
+    whole spec.
+    """
+    tenant: Tenant
+    base: FunctionRegistry
+    token: Token
+    _operations: frozenset[str] | None
+
+    def __init__(
+            self,
+            tenant: Tenant,
+            base: FunctionRegistry,
+            token: Token) -> None:
+        super().__init__(base.transport, base.cache, base.pool)
+        self.tenant = tenant
+        self.base = base
+        self.token = token
+        self._operations = frozenset(tenant.operations) \
+            if tenant.operations is not None else None
+
+    def function(self, ident: str) -> Function:
+        fn = self._registry.get(ident)
+        if fn is not None:
+            return fn
+        if self._operations is not None and ident not in self._operations:
+            raise KeyError(ident)
+        fn = self.base.function(ident)
+        if not isinstance(fn.fn_invoker, RESTFunctionInvoker):
+            raise NotImplementedError(
+                f'{ident} cannot be called by a tenant')
+        fn = fn.with_invoker(fn.fn_invoker.rebased(
+            self.tenant.server_url, self.token))
+        self._registry[ident] = fn
+        return fn
+
+    def rebased(self, base: FunctionRegistry) -> 'TenantRegistry':
+        """
+        the same tenant on another base registry, such as a reloaded one
+        """
+        return type(self)(self.tenant, base, self.token)
+
+    @property
+    def operations(self) -> frozenset[str] | None:
+        return self._operations
+
+    def dump_assistant_tools(self) -> Any:
+        return [
+            tool for tool in self.base.dump_assistant_tools()
+            if self._operations is None
+            or tool["function"]["name"] in self._operations]
+
+    def dump_snapshot(self) -> dict[str, Any]:
+        raise NotImplementedError('snapshot the base registry instead')
+
+
+def tenant_registries(
+        tenants: list[Tenant],
+        base: FunctionRegistry) -> dict[str, TenantRegistry]:
+    """
+    the registry of each tenant on top of `base`, their token providers
+    share its transport
+    """
+    return {
+        tenant.name: TenantRegistry(
+            tenant, base, tenant.token(base.transport))
+        for tenant in tenants}
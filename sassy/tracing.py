@@ -0,0 +1,45 @@
+import contextlib
+from typing import Any, ContextManager
+
+
+class Tracer:
+    """
+    Minimal span API used across sassy, spans nest along the async call
+    stack so a chat request links to the tool calls it triggers.
+    """
+
+    def span(self, name: str, **attributes: Any) -> ContextManager[Any]:
+        return contextlib.nullcontext()
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Tracer backed by the OpenTelemetry API, the spans go wherever the
+    installed OpenTelemetry SDK exports them
+    """
+    _tracer: Any
+
+    def __init__(self, name: str = 'sassy') -> None:
+        try:
+            from opentelemetry import trace  # type: ignore[import]
+        except ImportError as e:
+            raise ImportError(
+                'OpenTelemetry spans need opentelemetry-api, install '
+                'sassy with the tracing extra') from e
+        self._tracer = trace.get_tracer(name)
+
+    def span(self, name: str, **attributes: Any) -> ContextManager[Any]:
+        return self._tracer.start_as_current_span(
+            name,
+            attributes={k: v for k, v in attributes.items() if v is not None})
+
+
+def default_tracer() -> Tracer:
+    """
+    an OpenTelemetry tracer when `opentelemetry-api` is installed, a no-op
+    tracer otherwise
+    """
+    try:
+        return OpenTelemetryTracer()
+    except ImportError:
+        return Tracer()
@@ -0,0 +1,124 @@
+import contextlib
+from typing import Any, ContextManager
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import Metrics, ToolCallObservation
+from .upstream import HostGuard, UpstreamGuards
+
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+
+
+class HTTPTransport:
+    """
+    HTTP transport shared by all the function invokers.
+
+    Keeps one keep-alive connection pool per host (scheme, host and port),
+    for both the blocking and the async path, so consecutive tool calls to
+    the same org reuse their connections instead of paying a new TCP+TLS
+    handshake each time.
+    """
+    _limits: httpx.Limits
+    _timeout: httpx.Timeout
+    _http2: bool
+    _event_hooks: dict[str, list[Any]] | None
+    """httpx event hooks, installed on the async clients"""
+    _clients: dict[str, httpx.Client]
+    _async_clients: dict[str, httpx.AsyncClient]
+    metrics: Metrics | None
+    """where the tool calls going through this transport are measured"""
+    guards: UpstreamGuards | None
+    """concurrency limits and circuit breakers of the hosts, the calls go
+    out unchecked when unset"""
+    _mock: httpx.MockTransport | None
+    """answers the requests in place of the hosts, for tests"""
+
+    def __init__(
+            self,
+            connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+            read_timeout: float = DEFAULT_READ_TIMEOUT,
+            max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST,
+            keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+            http2: bool = False,
+            event_hooks: dict[str, list[Any]] | None = None,
+            metrics: Metrics | None = None,
+            guards: UpstreamGuards | None = None,
+            mock: httpx.MockTransport | None = None) -> None:
+        self._limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_connections_per_host,
+            keepalive_expiry=keepalive_expiry)
+        self._timeout = httpx.Timeout(
+            read_timeout, connect=connect_timeout)
+        self._http2 = http2
+        self._event_hooks = event_hooks
+        self._clients = {}
+        self._async_clients = {}
+        self.metrics = metrics
+        self.guards = guards if guards is not None \
+            else UpstreamGuards(max_limit=max_connections_per_host)
+        self._mock = mock
+
+    @staticmethod
+    def _host(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'
+
+    def client(self, url: str) -> httpx.Client:
+        """
+        the blocking client pooling connections to the host of `url`
+        """
+        host = self._host(url)
+        client = self._clients.get(host)
+        if client is None:
+            client = httpx.Client(
+                limits=self._limits, timeout=self._timeout,
+                http2=self._http2, transport=self._mock)
+            self._clients[host] = client
+        return client
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """
+        the async client pooling connections to the host of `url`
+        """
+        host = self._host(url)
+        client = self._async_clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=self._limits, timeout=self._timeout,
+                http2=self._http2, event_hooks=self._event_hooks,
+                transport=self._mock)
+            self._async_clients[host] = client
+        return client
+
+    def guard(self, url: str) -> HostGuard | None:
+        """
+        the concurrency limit and circuit breaker of the host of `url`
+        """
+        return self.guards.guard(url) if self.guards else None
+
+    def observe(
+            self,
+            operation: str | None) -> ContextManager[ToolCallObservation]:
+        """
+        measure a tool call of `operation`, a no-op without `metrics`
+        """
+        if self.metrics is None:
+            return contextlib.nullcontext(ToolCallObservation())
+        return self.metrics.tool_call(operation)
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+        self._clients = {}
+
+    async def aclose(self) -> None:
+        for client in self._async_clients.values():
+            await client.aclose()
+        self._async_clients = {}
+        self.close()
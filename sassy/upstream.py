@@ -0,0 +1,387 @@
+"""
+Protection of the upstream hosts from the tool calls: an adaptive limit on
+the calls in flight to each host, a circuit breaker failing the calls fast
+while a host is down or out of API requests and a budget of the retries.
+"""
+import asyncio
+import collections
+import contextlib
+import math
+import time
+from typing import Any, AsyncIterator, Callable, Iterator
+from urllib.parse import urlsplit
+
+from .data_model.oas import UpstreamPolicy
+
+
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MAX_LIMIT = 20
+"""the connection pool of a host holds that many connections by default"""
+DEFAULT_LATENCY_TOLERANCE = 2.0
+"""a call slower than that many times the baseline latency of its host is
+taken as a sign of queueing upstream"""
+DEFAULT_FAILURE_THRESHOLD = 5
+"""consecutive failures opening the circuit of a host"""
+DEFAULT_COOLDOWN = 30.0
+"""seconds a circuit stays open before a call is let through to probe it"""
+DEFAULT_RETRY_RATIO = 0.1
+"""retries and hedges allowed per call to a host"""
+DEFAULT_RETRY_RESERVE = 10.0
+"""retries and hedges a host may take at once on top of the ratio"""
+
+OVERLOADED_STATUSES = frozenset({429, 503})
+LIMIT_ERROR_CODES = frozenset({"REQUEST_LIMIT_EXCEEDED"})
+
+
+class CircuitOpen(Exception):
+    """
+    the host of a call failed too often lately, the call was not sent and
+    should be tried again after `retry_after` seconds
+    """
+    host: str
+    retry_after: int
+
+    def __init__(self, host: str, retry_after: int) -> None:
+        super().__init__(
+            f'{host} is failing, not calling it for {retry_after}s')
+        self.host = host
+        self.retry_after = retry_after
+
+
+def limit_exceeded(body: Any) -> bool:
+    """
+    whether a response body is a Salesforce error list reporting the org
+    ran out of API requests
+    """
+    return isinstance(body, list) and any(
+        isinstance(error, dict) and error.get("errorCode") in LIMIT_ERROR_CODES
+        for error in body)
+
+
+class Outcome:
+    """
+    what the host answered to a call, set by the caller before leaving its
+    slot. A call leaving its slot with an exception is a failure.
+    """
+    status: int | None
+    body: Any
+    cancelled: bool
+    """the call was abandoned, such as the losing request of a hedge, it
+    says nothing about the host"""
+
+    def __init__(self) -> None:
+        self.status = None
+        self.body = None
+        self.cancelled = False
+
+    def observe(self, status: int, body: Any = None) -> None:
+        self.status = status
+        self.body = body
+
+    @property
+    def overloaded(self) -> bool:
+        return self.status in OVERLOADED_STATUSES or limit_exceeded(self.body)
+
+    @property
+    def failed(self) -> bool:
+        return self.status is None or self.status >= 500 or self.overloaded
+
+
+class AdaptiveLimit:
+    """
+    AIMD limit of the calls in flight: it grows by one per round of calls
+    answered in time, and shrinks by `backoff` when the host is overloaded
+    or by a tenth when the latency climbs past `tolerance` times its
+    baseline.
+    """
+    limit: float
+    min_limit: int
+    max_limit: int
+    tolerance: float
+    backoff: float
+    baseline: float | None
+    """lowest recent latency, creeps up so a lasting change is followed"""
+    _inflight: int
+    _waiters: collections.deque[asyncio.Future]
+
+    def __init__(
+            self,
+            initial: int = DEFAULT_INITIAL_LIMIT,
+            max_limit: int = DEFAULT_MAX_LIMIT,
+            min_limit: int = 1,
+            tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+            backoff: float = 0.5) -> None:
+        self.limit = float(min(initial, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baseline = None
+        self._inflight = 0
+        self._waiters = collections.deque()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    async def acquire(self) -> None:
+        if self._inflight < int(self.limit) and not self._waiters:
+            self._inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # woken up at the same time, pass the slot on
+                self._inflight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: float | None, overloaded: bool) -> None:
+        """
+        leave the slot of a call taking `latency` seconds, None for a call
+        that was abandoned
+        """
+        self._inflight -= 1
+        if latency is not None:
+            self._adapt(latency, overloaded)
+        self._wake()
+
+    def _adapt(self, latency: float, overloaded: bool) -> None:
+        if overloaded:
+            self.limit *= self.backoff
+        elif self.baseline is not None \
+                and latency > self.tolerance * self.baseline:
+            self.limit *= 0.9
+        else:
+            self.limit += 1 / self.limit
+        self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+
+        if not overloaded:
+            self.baseline = latency if self.baseline is None \
+                else min(latency, self.baseline * 1.01)
+
+    def _wake(self) -> None:
+        while self._waiters and self._inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._inflight += 1
+                waiter.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, or at once when
+    the host is overloaded, and fails the calls fast for `cooldown`
+    seconds. A single call then probes the host: the circuit closes if it
+    succeeds and opens again otherwise.
+    """
+    failure_threshold: int
+    cooldown: float
+    _failures: int
+    _opened_at: float | None
+    _probing: bool
+    _clock: Callable[[], float]
+
+    def __init__(
+            self,
+            failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+            cooldown: float = DEFAULT_COOLDOWN,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._clock = clock
+
+    @property
+    def open(self) -> bool:
+        return self._opened_at is not None
+
+    def retry_after(self) -> float:
+        """
+        seconds until a call may go through, 0 when the circuit is closed
+        """
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.cooldown - self._clock())
+
+    def allow(self) -> bool:
+        """
+        whether a call may go out now, the first call after the cooldown
+        is the probe
+        """
+        if self._opened_at is None:
+            return True
+        if self._probing or self.retry_after() > 0:
+            return False
+        self._probing = True
+        return True
+
+    def abandon(self) -> None:
+        """
+        a call let through was abandoned, another call may probe
+        """
+        self._probing = False
+
+    def record(self, failed: bool, overloaded: bool) -> None:
+        self._probing = False
+        if not failed:
+            self._failures = 0
+            self._opened_at = None
+            return
+        self._failures += 1
+        if overloaded or self._failures >= self.failure_threshold \
+                or self._opened_at is not None:
+            self._opened_at = self._clock()
+
+
+class RetryBudget:
+    """
+    Retries and hedges allowed to a host: every call earns `ratio` of one,
+    up to `reserve`, so they add at most that share of load on top of a
+    burst of `reserve`, and cannot snowball while the host struggles.
+    """
+    ratio: float
+    reserve: float
+    balance: float
+
+    def __init__(
+            self,
+            ratio: float = DEFAULT_RETRY_RATIO,
+            reserve: float = DEFAULT_RETRY_RESERVE) -> None:
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = reserve
+
+    def deposit(self) -> None:
+        self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class HostGuard:
+    """
+    the adaptive limit, the circuit breaker and the retry budget of one
+    host
+    """
+    host: str
+    limit: AdaptiveLimit
+    breaker: CircuitBreaker
+    budget: RetryBudget
+    _clock: Callable[[], float]
+
+    def __init__(
+            self, host: str, limit: AdaptiveLimit, breaker: CircuitBreaker,
+            clock: Callable[[], float] = time.monotonic,
+            budget: RetryBudget | None = None) -> None:
+        self.host = host
+        self.limit = limit
+        self.breaker = breaker
+        self.budget = budget if budget is not None else RetryBudget()
+        self._clock = clock
+
+    def _admit(self, policy: UpstreamPolicy | None) -> None:
+        if not self.breaker.allow() and (
+                policy is None or policy.circuit_breaker):
+            raise CircuitOpen(
+                self.host, max(1, math.ceil(self.breaker.retry_after())))
+
+    def _record(self, outcome: Outcome) -> None:
+        if outcome.cancelled:
+            self.breaker.abandon()
+        else:
+            self.breaker.record(outcome.failed, outcome.overloaded)
+
+    @contextlib.asynccontextmanager
+    async def slot(
+            self,
+            policy: UpstreamPolicy | None = None,
+            semaphore: asyncio.Semaphore | None = None) \
+            -> AsyncIterator[Outcome]:
+        """
+        wait for room to call the host, raises `CircuitOpen` instead when
+        the host is failing. `semaphore` bounds the calls of the operation.
+        """
+        self._admit(policy)
+        adaptive = policy is None or policy.adaptive
+        async with semaphore or contextlib.nullcontext():
+            if adaptive:
+                await self.limit.acquire()
+            outcome = Outcome()
+            started = self._clock()
+            try:
+                yield outcome
+            except asyncio.CancelledError:
+                outcome.cancelled = True
+                raise
+            finally:
+                if adaptive:
+                    self.limit.release(
+                        None if outcome.cancelled
+                        else self._clock() - started,
+                        outcome.overloaded or outcome.status is None)
+                self._record(outcome)
+
+    @contextlib.contextmanager
+    def slot_sync(
+            self, policy: UpstreamPolicy | None = None) -> Iterator[Outcome]:
+        """
+        blocking counterpart of `slot`, only the circuit breaker applies
+        """
+        self._admit(policy)
+        outcome = Outcome()
+        try:
+            yield outcome
+        finally:
+            self._record(outcome)
+
+
+class UpstreamGuards:
+    """
+    the `HostGuard` of every host called, created on first use with the
+    same settings
+    """
+    initial_limit: int
+    max_limit: int
+    failure_threshold: int
+    cooldown: float
+    _guards: dict[str, HostGuard]
+    _clock: Callable[[], float]
+
+    def __init__(
+            self,
+            initial_limit: int = DEFAULT_INITIAL_LIMIT,
+            max_limit: int = DEFAULT_MAX_LIMIT,
+            failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+            cooldown: float = DEFAULT_COOLDOWN,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._guards = {}
+        self._clock = clock
+
+    def guard(self, url: str) -> HostGuard:
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        guard = self._guards.get(host)
+        if guard is None:
+            guard = HostGuard(
+                host,
+                AdaptiveLimit(self.initial_limit, self.max_limit),
+                CircuitBreaker(
+                    self.failure_threshold, self.cooldown, self._clock),
+                self._clock)
+            self._guards[host] = guard
+        return guard
@@ -0,0 +1,104 @@
+import asyncio
+import gc
+from logging import Logger
+import os
+import signal
+import socket
+from typing import Any
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from .logs import stop_logging
+
+
+def serve_workers(
+        app: Any,
+        host: str,
+        port: int,
+        workers: int,
+        logger: Logger) -> None:
+    """
+    Serve `app` with hypercorn from `workers` forked processes accepting on
+    one shared listening socket.
+
+    Everything loaded before the call, notably the function registry, is
+    inherited by the workers and stays shared copy-on-write as long as it
+    is not written to. Returns once every worker is gone, stopping all of
+    them when one exits on its own so a supervisor can restart the lot.
+    SIGHUP is passed on to every worker.
+    """
+    assert workers > 0, "at least one worker is needed"
+
+    sock = socket.create_server(
+        (host, port), family=socket.AF_INET6 if ':' in host
+        else socket.AF_INET)
+    sock.set_inheritable(True)
+
+    config = Config()
+    config.bind = [f'fd://{sock.fileno()}']
+
+    # keep the collector from touching the inherited objects, which would
+    # copy the pages they live in
+    gc.freeze()
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # until the server takes it over to reload the spec
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            code = 0
+            try:
+                asyncio.run(serve(app, config))
+            except BaseException:
+                logger.exception(f'worker {os.getpid()} failed')
+                code = 1
+            finally:
+                stop_logging()
+                os._exit(code)
+        return pid
+
+    children: set[int] = set()
+    stopping = False
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward(signum: int, frame: Any) -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, forward)
+
+    for _ in range(workers):
+        children.add(spawn())
+    logger.info(
+        f'serving on {host}:{port} with {workers} workers '
+        f'{sorted(children)}')
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.error(
+                f'worker {pid} exited with status '
+                f'{os.waitstatus_to_exitcode(status)}, stopping')
+            stop(signal.SIGTERM, None)
+
+    sock.close()
@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from sassy.admission import AdmissionControl, Overloaded
+
+
+class TestAdmissionControl(unittest.IsolatedAsyncioTestCase):
+
+    async def test_runs_the_chats_of_a_thread_in_order(self):
+        admission = AdmissionControl(max_concurrent=4)
+        order: list[int] = []
+
+        async def chat(i: int) -> None:
+            async with admission.admit('thread'):
+                order.append(i)
+                await asyncio.sleep(0.01 * (3 - i))
+                order.append(i)
+
+        await asyncio.gather(*(chat(i) for i in range(3)))
+
+        self.assertEqual(order, [0, 0, 1, 1, 2, 2])
+
+    async def test_bounds_concurrent_chats(self):
+        admission = AdmissionControl(max_concurrent=2)
+        running = 0
+        peak = 0
+
+        async def chat(thread_id: str) -> None:
+            nonlocal running, peak
+            async with admission.admit(thread_id):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(chat(f'thread{i}') for i in range(6)))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(admission.waiting, 0)
+
+    async def test_turns_chats_away_once_the_queue_is_full(self):
+        admission = AdmissionControl(max_concurrent=1, max_queued=1)
+        running = admission.admit('a')
+        await running.__aenter__()
+        queued = admission.admit('b')
+
+        with self.assertRaises(Overloaded) as ctx:
+            admission.admit('c')
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+
+        await running.__aexit__(None, None, None)
+        async with queued:
+            pass
+        async with admission.admit('c'):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+from benchmarks.chat import render_spec
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from sassy.auth import ClientCredentialsProvider
+from sassy.functions import FunctionRegistry
+
+
+class Clock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestClientCredentialsProvider(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeSalesforce()
+        self.fake_server = await LocalServer(self.fake.app).__aenter__()
+        self.clock = Clock()
+        self.provider = ClientCredentialsProvider(
+            'client', 'secret', self.fake_server.url,
+            lifetime=600, refresh_margin=60, clock=self.clock)
+
+    async def asyncTearDown(self):
+        await self.fake_server.__aexit__(None, None, None)
+
+    async def test_fetches_one_token_for_concurrent_calls(self):
+        tokens = await asyncio.gather(
+            *(self.provider.token() for _ in range(20)))
+
+        self.assertEqual(set(tokens), {tokens[0]})
+        self.assertEqual(self.fake.requests['oauth2.token'], 1)
+
+    async def test_refreshes_ahead_of_expiry(self):
+        first = await self.provider.token()
+
+        self.clock.now = 550
+        self.assertEqual(await self.provider.token(), first)
+        await asyncio.sleep(0.1)
+        second = await self.provider.token()
+
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.fake.requests['oauth2.token'], 2)
+
+    async def test_rejects_bad_credentials(self):
+        provider = ClientCredentialsProvider(
+            'client', 'wrong', self.fake_server.url)
+        with self.assertRaises(PermissionError):
+            await provider.token()
+
+    async def test_retries_once_with_a_fresh_token_on_401(self):
+        registry = FunctionRegistry.from_openapi_spec(
+            render_spec(self.fake_server.url), self.provider)
+        await registry.ainvoke('getWelcomeMessage', None)
+        # the session expires on the Salesforce side
+        assert self.fake.sessions is not None
+        self.fake.sessions.clear()
+
+        result = await registry.ainvoke('getWelcomeMessage', None)
+
+        self.assertEqual(result, {"message": "Welcome to Salesforce!"})
+        self.assertEqual(self.fake.requests['oauth2.token'], 2)
+
+    async def test_does_not_retry_the_token_of_the_call(self):
+        registry = FunctionRegistry.from_openapi_spec(
+            render_spec(self.fake_server.url), self.provider)
+        await self.provider.token()
+
+        result = await registry.ainvoke('getWelcomeMessage', 'revoked')
+
+        self.assertEqual(result[0]["errorCode"], "INVALID_SESSION_ID")
+        self.assertEqual(self.fake.requests['oauth2.token'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
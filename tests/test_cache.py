@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from sassy.cache import ResponseCache, SingleFlight
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = ResponseCache(4, clock)
+        key = ResponseCache.key("get", "https://x/a", {}, "token")
+
+        cache.put(key, {"a": 1}, 10)
+        self.assertEqual(cache.lookup(key), (True, {"a": 1}))
+
+        clock.now = 11
+        self.assertEqual(cache.lookup(key), (False, None))
+        self.assertEqual(cache.stats(), {"size": 0, "hits": 1, "misses": 1})
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(2)
+        cache.put("a", 1, 60)
+        cache.put("b", 2, 60)
+        cache.lookup("a")
+        cache.put("c", 3, 60)
+
+        self.assertEqual(cache.lookup("a"), (True, 1))
+        self.assertEqual(cache.lookup("b"), (False, None))
+        self.assertEqual(len(cache), 2)
+
+    def test_key_isolates_bearers(self):
+        a = ResponseCache.key("get", "https://x/a", {"q": "1"}, "tenant-a")
+        b = ResponseCache.key("get", "https://x/a", {"q": "1"}, "tenant-b")
+
+        self.assertNotEqual(a, b)
+        self.assertNotIn("tenant-a", a)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_coalesces_concurrent_calls(self):
+        flights = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"calls": calls}
+
+        key = SingleFlight.key("getObjectMetadata", "t", {"sObject": "A"})
+        results = await asyncio.gather(
+            *(flights.do(key, fetch) for _ in range(5)))
+
+        self.assertEqual(calls, 1)
+        self.assertEqual(results, [{"calls": 1}] * 5)
+        self.assertEqual(flights.coalesced, 4)
+
+        await flights.do(key, fetch)
+        self.assertEqual(calls, 2)
+
+    async def test_shares_exceptions(self):
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            flights.do("k", fail), flights.do("k", fail),
+            return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
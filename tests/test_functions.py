@@ -0,0 +1,321 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import httpx
+from pydantic import ValidationError
+
+from benchmarks.chat import render_spec
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from benchmarks.micro import synthetic_spec
+from sassy.data_model.jsons import JsonObject
+from sassy.functions import FunctionRegistry
+from sassy.plan import InvalidArguments
+from sassy.main import render_openapi
+from sassy.snapshot import SNAPSHOT_VERSION, read_snapshot, \
+    write_snapshot
+from sassy.transport import HTTPTransport
+
+
+class TestFunctionRegistrySnapshot(unittest.TestCase):
+
+    def test_roundtrip(self):
+        compiled = FunctionRegistry.from_openapi_spec(
+            json.loads(render_openapi()), None)
+        snapshot = json.loads(json.dumps(compiled.dump_snapshot()))
+
+        loaded = FunctionRegistry.from_snapshot(snapshot, None)
+
+        self.assertEqual(
+            loaded.dump_assistant_tools(), compiled.dump_assistant_tools())
+        self.assertEqual(loaded.dump_snapshot(), compiled.dump_snapshot())
+
+    def test_loads_shared_schemas_once_and_faster_than_compiling(self):
+        spec = json.dumps(synthetic_spec(operations=400, schemas=40))
+        snapshot = json.dumps(
+            FunctionRegistry.from_openapi_spec(spec, None).dump_snapshot())
+
+        def fastest(load):
+            times = []
+            for _ in range(5):
+                started = time.perf_counter()
+                load()
+                times.append(time.perf_counter() - started)
+            return min(times)
+
+        loading = fastest(
+            lambda: FunctionRegistry.from_snapshot(json.loads(snapshot), None))
+        compiling = fastest(
+            lambda: FunctionRegistry.from_openapi_spec(spec, None))
+        loaded = FunctionRegistry.from_snapshot(json.loads(snapshot), None)
+
+        self.assertLessEqual(loading, compiling)
+        first = loaded.function('postObject1').fn_meta.parameters
+        second = loaded.function('postObject41').fn_meta.parameters
+        assert isinstance(first, JsonObject)
+        assert isinstance(second, JsonObject)
+        self.assertIs(first.properties["parent"], second.properties["parent"])
+
+    def test_snapshots_of_older_versions_are_not_read(self):
+        compiled = FunctionRegistry.from_openapi_spec(
+            json.loads(render_openapi()), None)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.json')
+            write_snapshot(path, 'digest', compiled)
+            self.assertIsNotNone(read_snapshot(path, 'digest'))
+
+            with open(path) as f:
+                snapshot = json.load(f)
+            snapshot["version"] = SNAPSHOT_VERSION - 1
+            with open(path, 'w') as f:
+                json.dump(snapshot, f)
+
+            self.assertIsNone(read_snapshot(path, 'digest'))
+
+
+class TestToolJson(unittest.TestCase):
+
+    def test_nested_schemas_keep_their_fields(self):
+        contact = {
+            "type": "object",
+            "properties": {
+                "address": {
+                    "type": "object",
+                    "properties": {"city": {"type": "string"}},
+                    "required": ["city"],
+                },
+                "tags": {
+                    "type": "array",
+                    "items": {"type": "array", "items": {"type": "number"}},
+                },
+            },
+            "required": [],
+        }
+        spec = {
+            "openapi": "3.0.3",
+            "info": {"version": "1.0.0", "title": "nested"},
+            "servers": [{"url": "https://example.com"}],
+            "paths": {"/contacts": {"post": {
+                "operationId": "postContact",
+                "requestBody": {"content": {"application/json": {
+                    "schema": contact}}},
+            }}},
+            "components": {},
+        }
+
+        [tool] = FunctionRegistry.from_openapi_spec(
+            spec, None).dump_assistant_tools()
+
+        self.assertEqual(tool["function"]["parameters"], contact)
+
+
+class TestLazySpecLoading(unittest.TestCase):
+
+    def test_matches_eager_loading(self):
+        spec = render_openapi()
+
+        eager = FunctionRegistry.from_openapi_spec(json.loads(spec), None)
+        lazy = FunctionRegistry.from_openapi_spec(spec, None)
+
+        self.assertEqual(
+            lazy.dump_assistant_tools(), eager.dump_assistant_tools())
+        self.assertEqual(
+            lazy.dump_snapshot()["functions"],
+            eager.dump_snapshot()["functions"])
+
+    def test_matches_eager_loading_with_inline_schemas(self):
+        types = ["string", "boolean", "number"]
+        spec = {
+            "openapi": "3.0.3",
+            "info": {"version": "1.0.0", "title": "inline"},
+            "servers": [{"url": "https://example.com"}],
+            "paths": {
+                f"/op{i}": {"post": {
+                    "operationId": f"op{i}",
+                    "requestBody": {"content": {"application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                f"f{i}": {"type": types[i % 3]},
+                            },
+                        },
+                    }}},
+                }}
+                for i in range(300)},
+            "components": {},
+        }
+
+        eager = FunctionRegistry.from_openapi_spec(spec, None)
+        lazy = FunctionRegistry.from_openapi_spec(json.dumps(spec), None)
+
+        self.assertEqual(
+            lazy.dump_assistant_tools(), eager.dump_assistant_tools())
+
+    def test_materializes_referenced_components_only(self):
+        spec = json.loads(render_openapi())
+        spec["components"]["schemas"]["Unused"] = {"type": "bogus"}
+
+        with self.assertRaises(ValidationError):
+            FunctionRegistry.from_openapi_spec(spec, None)
+
+        registry = FunctionRegistry.from_openapi_spec(
+            json.dumps(spec, indent=2), None)
+        self.assertEqual(len(registry.dump_assistant_tools()), 7)
+
+
+class TestSpecReload(unittest.TestCase):
+
+    def test_rebuilds_changed_paths_only(self):
+        spec = json.loads(render_openapi())
+        registry = FunctionRegistry.from_openapi_spec(json.dumps(spec), None)
+
+        spec["components"]["schemas"]["Lead"]["description"] = "a lead"
+        del spec["paths"]["/data/v59.0/sobjects/Task"]
+        spec["paths"]["/data/v59.0/sobjects/Case"] = {"post": {
+            **spec["paths"]["/data/v59.0/sobjects/Contact"]["post"],
+            "operationId": "postCase",
+        }}
+        reloaded, diff = registry.reload_openapi_spec(
+            json.dumps(spec, indent=2), None)
+
+        self.assertEqual(diff.added, ["postCase"])
+        self.assertEqual(diff.changed, ["postLead"])
+        self.assertEqual(diff.removed, ["postTask"])
+        self.assertIs(
+            reloaded._registry["postAccount"],
+            registry._registry["postAccount"])
+        self.assertIsNot(
+            reloaded._registry["postLead"], registry._registry["postLead"])
+        self.assertEqual(len(registry.dump_assistant_tools()), 7)
+
+    def test_reloads_nothing_from_an_unchanged_snapshot(self):
+        spec = render_openapi()
+        compiled = FunctionRegistry.from_openapi_spec(spec, None)
+        loaded = FunctionRegistry.from_snapshot(
+            json.loads(json.dumps(compiled.dump_snapshot())), None)
+
+        _, diff = loaded.reload_openapi_spec(spec, None)
+
+        self.assertTrue(diff.empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestInvocation(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeSalesforce(records=3)
+        self.fake_server = await LocalServer(self.fake.app).__aenter__()
+        self.registry = FunctionRegistry.from_openapi_spec(
+            render_spec(self.fake_server.url), 'token')
+
+    async def asyncTearDown(self):
+        await self.fake_server.__aexit__(None, None, None)
+
+    def test_groups_calls_by_org_and_token(self):
+        groups = self.registry.composite_groups([
+            ("postContact", None),
+            ("getWelcomeMessage", None),
+            ("postAccount", None),
+            ("postAccount", "other"),
+            ("unknown", None),
+        ])
+        self.assertCountEqual(groups, [[0, 2], [1], [3], [4]])
+
+    def test_keeps_calls_with_guarantees_of_their_own_out(self):
+        spec = json.loads(render_spec(self.fake_server.url))
+        sobjects = spec["paths"]
+        sobjects["/data/v59.0/sobjects/Contact"]["post"][
+            "x-sassy-output"] = {"maxBytes": 1024}
+        sobjects["/data/v59.0/sobjects/Task"]["post"][
+            "x-sassy-upstream"] = {"maxConcurrency": 2}
+        registry = FunctionRegistry.from_openapi_spec(
+            json.dumps(spec), 'token')
+
+        groups = registry.composite_groups([
+            # identical queries are coalesced, and may be retried
+            ("querySalesforceRecords", None),
+            ("querySalesforceRecords", None),
+            ("postContact", None),
+            ("postContact", None),
+            ("postTask", None),
+            ("postTask", None),
+        ])
+
+        self.assertCountEqual(groups, [[0], [1], [2], [3], [4], [5]])
+
+    def test_splits_groups_at_the_composite_limit(self):
+        groups = self.registry.composite_groups(
+            [("postAccount", None)] * 30)
+        self.assertEqual([len(g) for g in groups], [25, 5])
+
+    def test_caps_the_query_subrequests_of_a_group(self):
+        spec = json.loads(render_spec(self.fake_server.url))
+        collection = json.loads(json.dumps(
+            spec["paths"]["/data/v59.0/sobjects/Account"]))
+        collection["post"]["operationId"] = "postRecords"
+        spec["paths"]["/data/v59.0/composite/sobjects"] = collection
+        registry = FunctionRegistry.from_openapi_spec(
+            json.dumps(spec), 'token')
+
+        groups = registry.composite_groups([
+            ("postRecords" if i < 7 else "postAccount", None)
+            for i in range(9)])
+
+        self.assertEqual(groups, [[0, 1, 2, 3, 4], [5, 6, 7, 8]])
+
+    async def test_splits_subresponses_per_call(self):
+        results = await self.registry.ainvoke_composite([
+            ("postContact", None, {"LastName": "Doe"}),
+            ("postAccount", None, {"Name": "Acme"}),
+        ])
+
+        self.assertEqual(self.fake.requests, {
+            "composite": 1, "postContact": 1, "postAccount": 1})
+        contact, account = results
+        self.assertTrue(contact["success"])
+        self.assertTrue(account["id"].startswith("Acc"))
+
+    async def test_failed_composite_falls_back_to_single_calls(self):
+        requests: list[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request.url.path)
+            if request.url.path.endswith('/composite'):
+                return httpx.Response(400, json=[{"errorCode": "INVALID"}])
+            return httpx.Response(201, json={"success": True})
+
+        registry = FunctionRegistry.from_openapi_spec(
+            render_spec('https://org.example.com'), 'token',
+            HTTPTransport(mock=httpx.MockTransport(handler)))
+
+        results = await registry.ainvoke_composite([
+            ("postContact", None, {"LastName": "Doe"}),
+            ("postAccount", None, {"Name": "Acme"}),
+        ])
+
+        self.assertEqual(results, [{"success": True}] * 2)
+        self.assertEqual(requests[0], '/services/data/v59.0/composite')
+        self.assertCountEqual(requests[1:], [
+            '/services/data/v59.0/sobjects/Contact',
+            '/services/data/v59.0/sobjects/Account',
+        ])
+
+    async def test_substitutes_path_parameters(self):
+        result = await self.registry.ainvoke(
+            "getObjectMetadata", None, sObject="Account")
+
+        self.assertEqual(result["objectDescribe"]["name"], "Account")
+
+    async def test_rejects_invalid_arguments_locally(self):
+        with self.assertRaises(InvalidArguments) as raised:
+            await self.registry.ainvoke(
+                "querySalesforceRecords", None, q=42)
+
+        self.assertEqual(raised.exception.errors, [
+            {"path": "$.q", "message": "expected string, got int"}])
+        self.assertEqual(self.fake.requests, {})
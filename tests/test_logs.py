@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import time
+import unittest
+
+from sassy.logs import EventLog, cap, configure_logging, redact, \
+    stop_logging
+
+
+class TestCap(unittest.TestCase):
+
+    def test_large_payloads_are_cut_short(self):
+        records = [{"Id": f'001{i:015}', "Name": 'x' * 100}
+                   for i in range(100_000)]
+
+        started = time.perf_counter()
+        capped = cap({"records": records, "totalSize": len(records)}, 500)
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(len(json.dumps(capped)), 1000)
+        self.assertEqual(capped["records"][-1], '...(+99996 more)')
+        self.assertLess(elapsed, 0.05)
+
+    def test_long_strings_count_what_is_left_out(self):
+        self.assertEqual(cap('a' * 30, 10), 'a' * 10 + '...(+20 chars)')
+
+    def test_secrets_are_redacted(self):
+        self.assertEqual(
+            redact('Authorization: Bearer abc.def-123 sent'),
+            'Authorization: Bearer [redacted] sent')
+        self.assertEqual(
+            redact('sid 00D5e000000abcd!AQ0AQH.x_y'), 'sid [redacted]')
+        self.assertEqual(
+            cap({"security": {"__default__": 'tok'}, "q": 'SELECT'}),
+            {"security": '[redacted]', "q": 'SELECT'})
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        configure_logging(
+            logging.INFO, self.stream, logger='tests.logs')
+        self.logger = logging.getLogger('tests.logs.server')
+
+    def tearDown(self):
+        stop_logging()
+
+    def lines(self):
+        stop_logging()
+        return [
+            json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_events_are_written_as_json_lines(self):
+        events = EventLog(self.logger, field_limit=20)
+        events.event('tool_call', operation='getAccount', arguments='x' * 50)
+
+        [line] = self.lines()
+
+        self.assertEqual(line["message"], 'tool_call')
+        self.assertEqual(line["logger"], 'tests.logs.server')
+        self.assertEqual(line["operation"], 'getAccount')
+        self.assertEqual(line["arguments"], 'x' * 20 + '...(+30 chars)')
+
+    def test_events_are_sampled_and_filtered_by_level(self):
+        events = EventLog(self.logger, sample_rates={"tool_output": 0.0})
+        events.event('tool_output', output='ok')
+        events.event('chat.response', logging.DEBUG, response='hi')
+        events.event('chat.response', response='hi')
+
+        self.assertEqual(
+            [line["message"] for line in self.lines()], ['chat.response'])
+
+    def test_exceptions_keep_their_traceback(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.logger.exception('failed')
+
+        [line] = self.lines()
+
+        self.assertEqual(line["message"], 'failed')
+        self.assertIn('ValueError: boom', line["exception"])
+
+
+if __name__ == '__main__':
+    unittest.main()
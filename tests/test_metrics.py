@@ -0,0 +1,55 @@
+import unittest
+
+from sassy.metrics import Counter, Histogram, Metrics
+from sassy.tracing import Tracer
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_renders_counters(self):
+        counter = Counter('requests_total', 'Requests.', ('route',))
+        counter.inc(route='/chat')
+        counter.inc(2, route='/chat')
+        counter.inc(route='a"b')
+
+        self.assertEqual(counter.render(), '\n'.join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{route="/chat"} 3',
+            'requests_total{route="a\\"b"} 1',
+        ]))
+
+    def test_renders_cumulative_histogram_buckets(self):
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(1, 2))
+        histogram.observe(0.5)
+        histogram.observe(1)
+        histogram.observe(3)
+
+        self.assertEqual(histogram.render(), '\n'.join([
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="2"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            'latency_seconds_sum 4.5',
+            'latency_seconds_count 3',
+        ]))
+
+    def test_labels_tool_calls_with_their_status(self):
+        metrics = Metrics(Tracer())
+
+        with metrics.tool_call('getAccount') as call:
+            call.status = '200'
+        with self.assertRaises(RuntimeError):
+            with metrics.tool_call('getAccount'):
+                raise RuntimeError()
+
+        seconds = metrics.tool_call_seconds
+        self.assertEqual(
+            seconds.count(operation='getAccount', status='200'), 1)
+        self.assertEqual(
+            seconds.count(operation='getAccount', status='error'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+from sassy.data_model.jsons import JsonArray, JsonObject
+from sassy.data_model.oas import OpenAPI, Reference
+from sassy.oasx import as_json_schema, reference_index, \
+        resolve_reference_schema
+
+
+def spec_with(schemas: dict) -> OpenAPI:
+    return OpenAPI(**{
+        "openapi": "3.0.3",
+        "info": {"version": "1.0.0", "title": "test"},
+        "servers": [{"url": "https://example.com"}],
+        "paths": {},
+        "components": {"schemas": schemas},
+    })
+
+
+class TestReferenceIndex(unittest.TestCase):
+
+    def test_follows_reference_chains(self):
+        spec = spec_with({
+            "Alias": {"$ref": "#/components/schemas/Account"},
+            "Account": {"type": "string", "description": "an account"},
+        })
+
+        sch = resolve_reference_schema(
+            spec, Reference(**{"$ref": "#/components/schemas/Alias"}))
+
+        self.assertEqual(sch.description, "an account")
+        self.assertIs(reference_index(spec), reference_index(spec))
+
+    def test_rejects_unknown_reference(self):
+        spec = spec_with({})
+
+        with self.assertRaises(NotImplementedError):
+            resolve_reference_schema(
+                spec, Reference(**{"$ref": "#/components/schemas/Nope"}))
+
+    def test_rejects_circular_alias(self):
+        spec = spec_with({
+            "A": {"$ref": "#/components/schemas/B"},
+            "B": {"$ref": "#/components/schemas/A"},
+        })
+
+        with self.assertRaises(ValueError):
+            reference_index(spec)
+
+
+class TestAsJsonSchema(unittest.TestCase):
+
+    def test_shares_converted_subtrees(self):
+        spec = spec_with({
+            "Address": {
+                "type": "object",
+                "properties": {"city": {"type": "string"}},
+            },
+            "Account": {
+                "type": "object",
+                "properties": {
+                    "billing": {"$ref": "#/components/schemas/Address"},
+                    "shipping": {"$ref": "#/components/schemas/Address"},
+                },
+            },
+        })
+
+        account = as_json_schema(
+            spec, Reference(**{"$ref": "#/components/schemas/Account"}),
+            "the account")
+
+        assert isinstance(account, JsonObject)
+        self.assertEqual(account.description, "the account")
+        self.assertIs(
+            account.properties["billing"], account.properties["shipping"])
+
+    def test_cuts_recursive_schemas(self):
+        spec = spec_with({
+            "Node": {
+                "type": "object",
+                "properties": {
+                    "children": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/Node"},
+                    },
+                },
+            },
+        })
+
+        node = as_json_schema(
+            spec, Reference(**{"$ref": "#/components/schemas/Node"}), None)
+
+        assert isinstance(node, JsonObject)
+        children = node.properties["children"]
+        assert isinstance(children, JsonArray)
+        self.assertEqual(children.items, JsonObject(properties={}))
+
+    def test_dumps_nested_schemas(self):
+        spec = spec_with({
+            "Node": {
+                "type": "object",
+                "properties": {
+                    "tags": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                    },
+                },
+            },
+        })
+
+        node = as_json_schema(
+            spec, Reference(**{"$ref": "#/components/schemas/Node"}), None)
+
+        self.assertEqual(
+            node.model_dump(by_alias=True, exclude_none=True),
+            {
+                "type": "object",
+                "properties": {
+                    "tags": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": [],
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()
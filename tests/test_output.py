@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from sassy.data_model.oas import OutputShape, ParameterLocation
+from sassy.functions import RESTFunctionInvoker
+from sassy.output import decode_prefix, select, shape_output
+from sassy.transport import HTTPTransport
+
+NEXT_RECORDS_URL = "/services/data/v59.0/query/01g-2000"
+
+
+def query_result(records: int) -> dict:
+    return {
+        "totalSize": records * 2,
+        "done": False,
+        "nextRecordsUrl": NEXT_RECORDS_URL,
+        "records": [
+            {"attributes": {"type": "Account"}, "Id": f"001{i}",
+             "Name": f"Account {i}"}
+            for i in range(records)],
+    }
+
+
+class TestDecodePrefix(unittest.TestCase):
+
+    def test_keeps_the_complete_records(self):
+        text = json.dumps(query_result(10))
+        cut = text[:text.index('"Account 7"')]
+
+        value, complete = decode_prefix(cut)
+
+        self.assertFalse(complete)
+        self.assertEqual(value["nextRecordsUrl"], NEXT_RECORDS_URL)
+        self.assertEqual(
+            [record["Id"] for record in value["records"]],
+            [f"001{i}" for i in range(7)])
+
+    def test_decodes_complete_documents(self):
+        self.assertEqual(decode_prefix('[1, 2.5, "x"]'), ([1, 2.5, "x"], True))
+        self.assertEqual(decode_prefix('[1, 2.5, 3'), ([1, 2.5], False))
+
+
+class TestShapeOutput(unittest.TestCase):
+
+    def test_projects_and_caps_records(self):
+        shape = OutputShape(**{"fields": ["Id", "Name"], "maxRecords": 2})
+
+        value = shape_output(query_result(5), shape)
+
+        self.assertEqual(value["records"], [
+            {"Id": "0010", "Name": "Account 0"},
+            {"Id": "0011", "Name": "Account 1"},
+        ])
+        self.assertTrue(value["truncated"])
+        self.assertEqual(value["nextRecordsUrl"], NEXT_RECORDS_URL)
+
+    def test_selects_with_jsonpath(self):
+        result = query_result(3)
+
+        self.assertEqual(
+            select(result, "$.records[*].Name"),
+            ["Account 0", "Account 1", "Account 2"])
+        self.assertEqual(select(result, "$.records[1].Id"), "0011")
+        self.assertEqual(select(result, "$['totalSize']"), 6)
+        self.assertIsNone(select(result, "$.missing.Id"))
+
+
+class TestByteBudget(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reads_at_most_the_byte_budget(self):
+        fake = FakeSalesforce(records=5000)
+        async with LocalServer(fake.app) as server:
+            transport = HTTPTransport()
+            invoker = RESTFunctionInvoker(
+                f"{server.url}/services/data/v59.0/query", "get",
+                {"q": ParameterLocation.QUERY}, None, transport,
+                output=OutputShape(maxRecords=100, maxBytes=4096))
+
+            result = await invoker.ainvoke(None, q="SELECT Id FROM Account")
+            await transport.aclose()
+
+        # the budget runs out before the record cap
+        self.assertTrue(result["truncated"])
+        self.assertGreater(len(result["records"]), 0)
+        self.assertLess(len(result["records"]), 100)
+        self.assertLess(
+            len(json.dumps(result["records"], separators=(",", ":"))), 4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
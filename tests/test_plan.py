@@ -0,0 +1,72 @@
+import unittest
+
+from sassy.data_model.jsons import JsonArray, JsonNumber, JsonObject, \
+    JsonString
+from sassy.data_model.oas import ParameterLocation
+from sassy.plan import InvalidArguments, InvocationPlan
+
+
+class TestInvocationPlan(unittest.TestCase):
+
+    def test_substitutes_path_parameters(self):
+        plan = InvocationPlan(
+            "https://{instance}/services/data/v59.0/sobjects/{sObject}/{id}",
+            {"sObject": ParameterLocation.PATH,
+             "id": ParameterLocation.PATH,
+             "fields": ParameterLocation.QUERY})
+
+        url, params, body, headers = plan.request(
+            {"sObject": "Account", "id": "a/b", "fields": "Name"})
+
+        self.assertEqual(
+            url,
+            "https://{instance}/services/data/v59.0/sobjects/Account/a%2Fb")
+        self.assertEqual(params, {"fields": "Name"})
+        self.assertEqual(body, {})
+        self.assertEqual(headers, {})
+
+    def test_partitions_parameters(self):
+        plan = InvocationPlan(
+            "https://example.com/items",
+            {"q": ParameterLocation.QUERY,
+             "X-Trace": ParameterLocation.HEADER})
+
+        _, params, body, headers = plan.request(
+            {"q": "x", "X-Trace": 1, "Name": "Acme"})
+
+        self.assertEqual(params, {"q": "x"})
+        self.assertEqual(headers, {"X-Trace": "1"})
+        self.assertEqual(body, {"Name": "Acme"})
+
+    def test_rejects_arguments_not_matching_the_schema(self):
+        plan = InvocationPlan(
+            "https://example.com/sobjects/{sObject}",
+            {"sObject": ParameterLocation.PATH},
+            JsonObject(
+                properties={
+                    "sObject": JsonString(),
+                    "amount": JsonNumber(),
+                    "tags": JsonArray(items=JsonString()),
+                },
+                required=["sObject"]))
+
+        with self.assertRaises(InvalidArguments) as raised:
+            plan.request({"amount": "12", "tags": ["a", 1], "extra": True})
+
+        self.assertEqual(raised.exception.errors, [
+            {"path": "$.sObject", "message": "missing required property"},
+            {"path": "$.amount", "message": "expected number, got str"},
+            {"path": "$.tags[1]", "message": "expected string, got int"},
+        ])
+
+    def test_rejects_missing_path_parameter_without_schema(self):
+        plan = InvocationPlan(
+            "https://example.com/sobjects/{sObject}",
+            {"sObject": ParameterLocation.PATH})
+
+        with self.assertRaises(InvalidArguments):
+            plan.request({})
+
+
+if __name__ == '__main__':
+    unittest.main()
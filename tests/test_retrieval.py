@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from sassy.functions import FunctionRegistry
+from sassy.main import render_openapi
+from sassy.retrieval import ToolSelector, tokenize
+
+
+class TestToolSelector(unittest.TestCase):
+
+    def setUp(self):
+        registry = FunctionRegistry.from_openapi_spec(
+            json.loads(render_openapi()), None)
+        self.selector = ToolSelector(registry.dump_assistant_tools())
+
+    def select(self, text: str, k: int) -> list[str]:
+        return [t['function']['name'] for t in self.selector.select(text, k)]
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("getObjectMetadata for the Accounts"),
+            ["get", "object", "metadata", "account"])
+
+    def test_selects_relevant_tools(self):
+        self.assertEqual(
+            self.select("log a call with my contact", 1), ["postTask"])
+        self.assertEqual(
+            self.select("create a new lead for Acme", 1), ["postLead"])
+        self.assertIn(
+            "querySalesforceRecords",
+            self.select("query the records of opportunities", 2))
+
+    def test_no_match(self):
+        self.assertEqual(self.select("zzz", 3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import asyncio
+import unittest
+
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from sassy.data_model.oas import RetryPolicy
+from sassy.functions import Method, RESTFunctionInvoker
+from sassy.retry import LatencyWindow, hedged, retrying
+from sassy.transport import HTTPTransport
+from sassy.upstream import CircuitOpen, RetryBudget
+
+
+def transient(result):
+    return isinstance(result, (ConnectionError, TimeoutError)) \
+        or result == 'unavailable'
+
+
+class Attempts:
+    """
+    an attempt taking the next of `delays` seconds and giving the next of
+    `results`, raising it when it is an exception
+    """
+
+    def __init__(self, delays, results):
+        self.delays = list(delays)
+        self.results = list(results)
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        n = self.started
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delays[n])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.results[n], BaseException):
+            raise self.results[n]
+        return self.results[n]
+
+
+class TestLatencyWindow(unittest.TestCase):
+
+    def test_quantile_once_there_are_enough_samples(self):
+        window = LatencyWindow(size=100)
+        for i in range(10):
+            window.add(i / 100)
+        self.assertIsNone(window.quantile(0.95))
+
+        for i in range(10, 200):
+            window.add(i / 100)
+        self.assertEqual(len(window), 100)
+        quantile = window.quantile(0.95)
+        assert quantile is not None
+        self.assertAlmostEqual(quantile, 1.94)
+
+
+class TestHedged(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hedge_wins_and_the_slow_request_is_cancelled(self):
+        attempts = Attempts([10, 0], ['slow', 'fast'])
+        policy = RetryPolicy(hedge=True, hedgeAfter=0.01)
+
+        result = await asyncio.wait_for(
+            hedged(attempts, policy, LatencyWindow()), 1)
+
+        self.assertEqual(result, 'fast')
+        self.assertEqual(attempts.cancelled, 1)
+
+    async def test_success_wins_when_both_finish_together(self):
+        for results in (
+                [ConnectionError(), 'hedged'], ['first', ConnectionError()]):
+            gate = asyncio.Event()
+            started = []
+
+            async def attempt():
+                n = len(started)
+                started.append(n)
+                if n == 1:
+                    gate.set()
+                await gate.wait()
+                if isinstance(results[n], BaseException):
+                    raise results[n]
+                return results[n]
+
+            policy = RetryPolicy(hedge=True, hedgeAfter=0.01)
+
+            result = await hedged(attempt, policy, LatencyWindow())
+
+            self.assertIn(result, ('hedged', 'first'))
+
+    async def test_no_hedge_without_budget(self):
+        attempts = Attempts([0.05, 0], ['slow', 'fast'])
+        budget = RetryBudget(reserve=0)
+        policy = RetryPolicy(hedge=True, hedgeAfter=0.01)
+
+        result = await hedged(attempts, policy, LatencyWindow(), budget)
+
+        self.assertEqual(result, 'slow')
+        self.assertEqual(attempts.started, 1)
+
+
+class TestRetrying(unittest.IsolatedAsyncioTestCase):
+
+    async def test_retries_transient_failures(self):
+        attempts = Attempts(
+            [0, 0, 0], [ConnectionError(), 'unavailable', 'ok'])
+        policy = RetryPolicy(maxAttempts=3, backoff=0.001)
+
+        result = await retrying(
+            attempts, policy, LatencyWindow(), RetryBudget(), transient)
+
+        self.assertEqual(result, 'ok')
+        self.assertEqual(attempts.started, 3)
+
+    async def test_gives_up_when_the_budget_runs_out(self):
+        attempts = Attempts([0, 0, 0], ['unavailable'] * 3)
+        policy = RetryPolicy(maxAttempts=3, backoff=0.001)
+
+        result = await retrying(
+            attempts, policy, LatencyWindow(), RetryBudget(reserve=1),
+            transient)
+
+        self.assertEqual(result, 'unavailable')
+        self.assertEqual(attempts.started, 2)
+
+    async def test_keeps_the_failure_when_the_circuit_opens(self):
+        attempts = Attempts(
+            [0, 0], ['unavailable', CircuitOpen('https://org', 30)])
+        policy = RetryPolicy(maxAttempts=3, backoff=0.001)
+
+        result = await retrying(
+            attempts, policy, LatencyWindow(), None, transient)
+
+        self.assertEqual(result, 'unavailable')
+
+
+class TestRetriedOperations(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeSalesforce()
+        self.fake_server = await LocalServer(self.fake.app).__aenter__()
+        self.transport = HTTPTransport()
+
+    async def asyncTearDown(self):
+        await self.transport.aclose()
+        await self.fake_server.__aexit__(None, None, None)
+
+    def _invoker(
+            self, path: str, method: Method,
+            policy: RetryPolicy) -> RESTFunctionInvoker:
+        return RESTFunctionInvoker(
+            f'{self.fake_server.url}/services{path}', method, {}, 'token',
+            self.transport, retry=policy)
+
+    async def test_gets_are_retried_on_bad_gateway(self):
+        invoker = self._invoker(
+            '/apexrest/examples/welcome', 'get',
+            RetryPolicy(maxAttempts=3, backoff=0.001))
+        self.fake.outage = (502, [{"message": "bad gateway"}])
+
+        result = await invoker.ainvoke(None)
+
+        self.assertEqual(result, [{"message": "bad gateway"}])
+        self.assertEqual(self.fake.requests, {'outage': 3})
+
+    async def test_posts_are_not_retried(self):
+        invoker = self._invoker(
+            '/data/v59.0/sobjects/Account', 'post',
+            RetryPolicy(maxAttempts=3, backoff=0.001))
+        self.fake.outage = (502, [{"message": "bad gateway"}])
+
+        await invoker.ainvoke(None, Name='Acme')
+
+        self.assertEqual(self.fake.requests, {'outage': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,395 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, cast
+import unittest
+
+from openai import AsyncOpenAI
+from openai.types.beta.threads import RequiredActionFunctionToolCall
+from openai.types.beta.threads.required_action_function_tool_call import \
+    Function as CalledFunction
+
+from benchmarks.chat import render_spec, run_chat_benchmark
+from benchmarks.fakes import DEFAULT_SCRIPT, FakeOpenAI, LocalServer, \
+    Reply, ToolCalls
+from sassy.data_model.jsons import JsonObject
+from sassy.functions import Function, FunctionInvoker, FunctionRegistry, \
+    RegistryDiff
+from sassy.metrics import Metrics
+from sassy.server import RunPoller, Server, app
+from sassy.tracing import Tracer
+
+
+class FakeRuns:
+    """
+    runs that stay queued for `pending` polls before requiring action
+    """
+
+    def __init__(self, pending: int, headers: dict | None = None) -> None:
+        self.pending = pending
+        self.headers = headers or {}
+        self.polls: dict[str, list[float]] = {}
+        self.with_raw_response = self
+
+    async def retrieve(self, thread_id: str, run_id: str):
+        polls = self.polls.setdefault(run_id, [])
+        polls.append(time.monotonic())
+        status = 'queued' if len(polls) <= self.pending \
+            else 'requires_action'
+        run = SimpleNamespace(id=run_id, status=status)
+        return SimpleNamespace(headers=self.headers, parse=lambda: run)
+
+
+def fake_openai(runs: FakeRuns) -> AsyncOpenAI:
+    """
+    the client of the poller, only `beta.threads.runs` is faked
+    """
+    return cast(AsyncOpenAI, SimpleNamespace(beta=SimpleNamespace(
+        threads=SimpleNamespace(runs=runs))))
+
+
+class CountingInvoker(FunctionInvoker):
+    """
+    takes `delay` seconds per call and counts the calls in flight, fails
+    the calls asking for it
+    """
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    def invoke(self, bearer: str | None, **kwargs) -> Any:
+        raise NotImplementedError
+
+    async def ainvoke(self, bearer: str | None, **kwargs) -> Any:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if kwargs.get('fail'):
+                raise RuntimeError('boom')
+            return kwargs['n']
+        finally:
+            self.active -= 1
+
+
+def tool_call(n: int, fail: bool = False) -> RequiredActionFunctionToolCall:
+    return RequiredActionFunctionToolCall(
+        id=f'call{n}', type='function', function=CalledFunction(
+            name='count', arguments=json.dumps({'n': n, 'fail': fail})))
+
+
+class TestAssistantBootstrap(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeOpenAI(think_time=0.05)
+        self.fake_server = await LocalServer(self.fake.app).__aenter__()
+        self.openai = AsyncOpenAI(
+            api_key='fake', base_url=f'{self.fake_server.url}/v1')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.def_file = os.path.join(self.tmp.name, 'assistant.json')
+        self.write_definition('be helpful')
+
+    async def asyncTearDown(self):
+        await self.openai.close()
+        await self.fake_server.__aexit__(None, None, None)
+        self.tmp.cleanup()
+
+    def write_definition(self, instructions: str) -> None:
+        with open(self.def_file, 'w') as file:
+            json.dump(
+                {'instructions': instructions, 'model': 'fake', 'tools': []},
+                file)
+
+    async def start_servers(self, count: int) -> list[Server]:
+        servers = [
+            Server(
+                self.openai, logging.getLogger(__name__),
+                FunctionRegistry(),
+                assistant_def_file=self.def_file,
+                assistant_lock_file=os.path.join(
+                    self.tmp.name, 'assistant.lock'))
+            for _ in range(count)]
+        await asyncio.gather(*(server.setup() for server in servers))
+        for server in servers:
+            await server.teardown()
+        return servers
+
+    async def test_creates_a_single_assistant(self):
+        servers = await self.start_servers(4)
+
+        self.assertEqual(self.fake.requests['assistants.create'], 1)
+        self.assertEqual(
+            len({server._assistant_id for server in servers}), 1)
+
+    async def test_skips_unchanged_assistant(self):
+        await self.start_servers(1)
+        requests = dict(self.fake.requests)
+
+        await self.start_servers(1)
+
+        self.assertEqual(self.fake.requests, requests)
+
+    async def test_updates_changed_assistant_in_place(self):
+        first, = await self.start_servers(1)
+        self.write_definition('be concise')
+
+        second, = await self.start_servers(1)
+
+        self.assertEqual(second._assistant_id, first._assistant_id)
+        self.assertEqual(self.fake.requests['assistants.create'], 1)
+        self.assertEqual(self.fake.requests['assistants.update'], 1)
+
+        await self.start_servers(1)
+        self.assertEqual(self.fake.requests['assistants.update'], 1)
+
+    async def test_reload_pushes_changed_tools_only(self):
+        spec = json.loads(render_spec('https://example.com'))
+        server = Server(
+            self.openai, logging.getLogger(__name__),
+            FunctionRegistry.from_openapi_spec(json.dumps(spec), None),
+            assistant_def_file=self.def_file,
+            assistant_lock_file=os.path.join(self.tmp.name, 'assistant.lock'),
+            spec_source=lambda: json.dumps(spec))
+        await server.setup()
+
+        diff = await server.reload()
+        self.assertTrue(diff.empty)
+
+        del spec['paths']['/data/v59.0/sobjects/Task']
+        diff = await server.reload()
+        await server.teardown()
+
+        self.assertEqual(diff.removed, ['postTask'])
+        self.assertEqual(self.fake.requests['assistants.create'], 1)
+        self.assertEqual(self.fake.requests['assistants.update'], 1)
+        self.assertEqual(
+            len(server._function_registry.dump_assistant_tools()), 6)
+
+
+class TestRunPoller(unittest.IsolatedAsyncioTestCase):
+
+    async def test_wakes_up_each_run(self):
+        runs = FakeRuns(pending=2)
+        poller = RunPoller(
+            fake_openai(runs), Metrics(Tracer()), max_qps=1000,
+            min_interval=0.01, max_interval=0.02)
+
+        done = await asyncio.gather(
+            *(poller.wait('thread', f'run{i}') for i in range(5)))
+        await poller.aclose()
+
+        self.assertEqual(
+            [run.status for run in done], ['requires_action'] * 5)
+        self.assertEqual([len(p) for p in runs.polls.values()], [3] * 5)
+
+    async def test_bounds_total_polling_rate(self):
+        runs = FakeRuns(pending=1)
+        poller = RunPoller(
+            fake_openai(runs), Metrics(Tracer()), max_qps=50,
+            min_interval=0, max_interval=0)
+
+        await asyncio.gather(
+            *(poller.wait('thread', f'run{i}') for i in range(10)))
+        await poller.aclose()
+
+        polls = sorted(t for p in runs.polls.values() for t in p)
+        self.assertEqual(len(polls), 20)
+        self.assertGreaterEqual(polls[-1] - polls[0], 19 / 50 * 0.9)
+
+    async def test_pauses_when_rate_limit_is_spent(self):
+        runs = FakeRuns(pending=1, headers={
+            'x-ratelimit-remaining-requests': '0',
+            'x-ratelimit-reset-requests': '200ms',
+        })
+        poller = RunPoller(
+            fake_openai(runs), Metrics(Tracer()), max_qps=1000,
+            min_interval=0, max_interval=0)
+
+        await poller.wait('thread', 'run')
+        await poller.aclose()
+
+        first, second = runs.polls['run']
+        self.assertGreaterEqual(second - first, 0.18)
+
+
+class TestToolCalls(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.invoker = CountingInvoker(delay=0.02)
+        registry = FunctionRegistry()
+        registry._add(Function(
+            'count', 'counts', JsonObject(properties={}), self.invoker))
+        self.server = Server(
+            AsyncOpenAI(api_key='fake'), logging.getLogger(__name__),
+            registry, tool_concurrency=3)
+
+    async def test_runs_at_most_the_tool_concurrency_at_once(self):
+        started = time.perf_counter()
+        outputs = await self.server._invoke_tool_calls(
+            [tool_call(n) for n in range(9)], {})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(self.invoker.max_active, 3)
+        self.assertEqual(
+            [output.get("output") for output in outputs],
+            [str(n) for n in range(9)])
+        self.assertLess(elapsed, 9 * 0.02)
+
+    async def test_a_failing_call_only_fails_its_own_output(self):
+        outputs = await self.server._invoke_tool_calls(
+            [tool_call(0), tool_call(1, fail=True), tool_call(2)], {})
+
+        self.assertEqual(
+            [output.get("tool_call_id") for output in outputs],
+            ['call0', 'call1', 'call2'])
+        self.assertEqual(outputs[0].get("output"), '0')
+        self.assertEqual(
+            json.loads(outputs[1].get("output", '')),
+            {"error": "RuntimeError: boom"})
+        self.assertEqual(outputs[2].get("output"), '2')
+
+
+class TestChatStreamAdmission(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unstarted_stream_keeps_no_place_in_the_queue(self):
+        server = Server(
+            AsyncOpenAI(api_key='fake'), logging.getLogger(__name__),
+            FunctionRegistry())
+        body = {'thread_id': 'thread', 'content': 'hi', 'security': {}}
+
+        async with app.test_request_context(
+                '/chat/stream', method='POST', json=body):
+            # the client is gone before the body is streamed
+            await server.chat_stream()
+
+        self.assertEqual(server._admission.waiting, 0)
+        self.assertEqual(server._admission._threads, {})
+
+
+class ReloadingServer:
+
+    def __init__(self) -> None:
+        self.reloads = 0
+
+    async def reload(self) -> RegistryDiff:
+        self.reloads += 1
+        return RegistryDiff()
+
+
+class TestAdminReload(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.config = dict(app.config)
+        self.server = ReloadingServer()
+        app.config["SERVER"] = self.server
+
+    def tearDown(self):
+        app.config.clear()
+        app.config.update(self.config)
+
+    async def reload(self, client: str, headers: dict | None = None):
+        return await app.test_client().post(
+            '/admin/reload', headers=headers,
+            scope_base={'client': (client, 40000)})
+
+    async def test_takes_the_admin_token(self):
+        app.config["ADMIN_TOKEN"] = 'secret'
+
+        unauthenticated = await self.reload('127.0.0.1')
+        wrong = await self.reload(
+            '10.0.0.1', {'Authorization': 'Bearer guess'})
+        self.assertEqual(unauthenticated.status_code, 401)
+        self.assertEqual(wrong.status_code, 401)
+        self.assertEqual(self.server.reloads, 0)
+
+        authenticated = await self.reload(
+            '10.0.0.1', {'Authorization': 'Bearer secret'})
+        self.assertEqual(authenticated.status_code, 200)
+        self.assertEqual(self.server.reloads, 1)
+
+    async def test_only_answers_local_callers_without_an_admin_token(self):
+        app.config["ADMIN_TOKEN"] = None
+
+        remote = await self.reload('10.0.0.1')
+        local = await self.reload('127.0.0.1')
+
+        self.assertEqual(remote.status_code, 403)
+        self.assertEqual(local.status_code, 200)
+        self.assertEqual(self.server.reloads, 1)
+
+
+class TestChat(unittest.IsolatedAsyncioTestCase):
+    """
+    end to end chats against the local fakes of OpenAI and Salesforce
+    """
+
+    async def test_chat_runs_tool_calls(self):
+        result = await run_chat_benchmark(
+            requests=2, concurrency=2, think_time=0, sf_latency=0)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(result.latencies), 2)
+        self.assertEqual(
+            result.upstream['openai']['runs.submit_tool_outputs'], 2)
+        self.assertIn(
+            'sassy_chat_requests_total{route="/chat",outcome="ok"} 2',
+            result.metrics)
+        self.assertIn(
+            'sassy_chat_stage_seconds_count{stage="requires_action"} 2',
+            result.metrics)
+        self.assertIn(
+            'sassy_tool_call_seconds_count'
+            '{operation="getWelcomeMessage",status="200"}',
+            result.metrics)
+
+    async def test_chat_stream_runs_tool_calls(self):
+        result = await run_chat_benchmark(
+            requests=2, concurrency=1, think_time=0, sf_latency=0,
+            stream=True, script=DEFAULT_SCRIPT)
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(result.latencies), 2)
+        self.assertGreater(sum(result.upstream['salesforce'].values()), 0)
+
+    async def test_composite_batches_calls_to_the_same_org(self):
+        script = [
+            ToolCalls([
+                ("querySalesforceRecords", {"q": "SELECT Id FROM Account"}),
+                ("postAccount", {"Name": "Acme"}),
+                ("postContact", {"LastName": "Doe"}),
+                ("getWelcomeMessage", {}),
+            ]),
+            Reply("done"),
+        ]
+        batched = await run_chat_benchmark(
+            requests=2, concurrency=1, think_time=0, sf_latency=0,
+            script=script)
+        unbatched = await run_chat_benchmark(
+            requests=2, concurrency=1, think_time=0, sf_latency=0,
+            script=script, server_options={'composite': False})
+
+        self.assertEqual(batched.errors, [])
+        self.assertEqual(batched.upstream['salesforce'], {
+            'composite': 2,
+            'postAccount': 2,
+            'postContact': 2,
+            # coalesced queries go out on their own, and Apex REST is out
+            # of reach of the composite API
+            'querySalesforceRecords': 2,
+            'getWelcomeMessage': 2,
+        })
+        self.assertNotIn('composite', unbatched.upstream['salesforce'])
+        self.assertIn(
+            'sassy_tool_call_seconds_count'
+            '{operation="postAccount",status="201"} 2',
+            batched.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import logging
+import unittest
+
+from openai import AsyncOpenAI
+
+from benchmarks.chat import render_spec
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from sassy.functions import FunctionPool, FunctionRegistry
+from sassy.server import ChatRequest, Server
+from sassy.tenants import Tenant, TenantRegistry, UnknownTenant, \
+    tenant_registries
+
+
+class TestFunctionPool(unittest.TestCase):
+
+    def test_identical_functions_share_their_meta(self):
+        pool = FunctionPool()
+        first = FunctionRegistry.from_openapi_spec(
+            render_spec('https://acme.example.com'), None, pool=pool)
+        second = FunctionRegistry.from_openapi_spec(
+            render_spec('https://globex.example.com'), None, pool=pool)
+
+        self.assertEqual(len(pool), 7)
+        for ident in ('postAccount', 'querySalesforceRecords'):
+            self.assertIs(
+                first.function(ident).fn_meta,
+                second.function(ident).fn_meta)
+        self.assertIsNot(
+            first.function('postAccount').fn_invoker,
+            second.function('postAccount').fn_invoker)
+
+
+class TestTenantRegistry(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.spec_org = FakeSalesforce()
+        self.tenant_org = FakeSalesforce()
+        self.tenant_org.sessions = {'acme-token'}
+        self.spec_server = await LocalServer(
+            self.spec_org.app).__aenter__()
+        self.tenant_server = await LocalServer(
+            self.tenant_org.app).__aenter__()
+        self.base = FunctionRegistry.from_openapi_spec(
+            render_spec(self.spec_server.url), 'spec-token')
+        self.tenants = tenant_registries([Tenant(
+            name='acme',
+            serverUrl=f'{self.tenant_server.url}/services',
+            accessToken='acme-token',
+            operations=['getWelcomeMessage', 'querySalesforceRecords'])],
+            self.base)
+
+    async def asyncTearDown(self):
+        await self.spec_server.__aexit__(None, None, None)
+        await self.tenant_server.__aexit__(None, None, None)
+
+    async def test_calls_go_to_the_org_of_the_tenant(self):
+        acme = self.tenants['acme']
+
+        result = await acme.ainvoke(
+            'querySalesforceRecords', None, q='SELECT Id FROM Account')
+
+        self.assertEqual(result["totalSize"], 5)
+        self.assertEqual(
+            self.tenant_org.requests, {'querySalesforceRecords': 1})
+        self.assertEqual(self.spec_org.requests, {})
+        self.assertIs(
+            acme.function('querySalesforceRecords').fn_meta,
+            self.base.function('querySalesforceRecords').fn_meta)
+
+    async def test_only_the_operations_of_the_tenant(self):
+        acme = self.tenants['acme']
+
+        with self.assertRaises(KeyError):
+            await acme.ainvoke('postAccount', None, Name='Acme')
+
+        self.assertEqual(
+            [tool["function"]["name"]
+             for tool in acme.dump_assistant_tools()],
+            ['getWelcomeMessage', 'querySalesforceRecords'])
+        self.assertEqual(acme._registry, {})
+
+    async def test_chats_pick_their_tenant(self):
+        server = Server(
+            AsyncOpenAI(api_key='fake'), logging.getLogger(__name__),
+            self.base, tenants=self.tenants)
+
+        with self.assertRaises(UnknownTenant):
+            server._check_tenant('globex')
+        options = server._run_options(ChatRequest(
+            thread_id='thread', content='hi', security={}, tenant='acme'))
+
+        self.assertEqual(
+            [tool["function"]["name"] for tool in options["tools"]],
+            ['getWelcomeMessage', 'querySalesforceRecords'])
+        self.assertIsInstance(server._registry('acme'), TenantRegistry)
+        self.assertEqual(server._run_options(ChatRequest(
+            thread_id='thread', content='hi', security={})), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
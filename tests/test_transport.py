@@ -0,0 +1,58 @@
+import unittest
+
+import httpx
+
+from benchmarks.chat import render_spec
+from sassy.functions import FunctionRegistry
+from sassy.transport import HTTPTransport
+
+
+class TestHTTPTransport(unittest.IsolatedAsyncioTestCase):
+
+    async def test_invokers_share_one_pooled_client_per_host(self):
+        requests: list[httpx.Request] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json={"ok": True})
+
+        transport = HTTPTransport(
+            connect_timeout=2, read_timeout=7,
+            mock=httpx.MockTransport(handler))
+        registry = FunctionRegistry.from_openapi_spec(
+            render_spec('https://org.example.com'), 'token', transport)
+
+        for _ in range(2):
+            await registry.ainvoke('getWelcomeMessage', None)
+            await registry.ainvoke(
+                'querySalesforceRecords', None, q='SELECT Id FROM Account')
+        clients = dict(transport._async_clients)
+        await transport.aclose()
+
+        self.assertEqual(len(requests), 4)
+        self.assertEqual(list(clients), ['https://org.example.com'])
+        self.assertEqual(
+            {request.url.host for request in requests}, {'org.example.com'})
+        self.assertEqual(requests[0].extensions["timeout"], {
+            "connect": 2, "read": 7, "write": 7, "pool": 7})
+
+    def test_the_pool_of_a_host_is_reused_and_configured(self):
+        transport = HTTPTransport(
+            max_connections_per_host=7, keepalive_expiry=3, http2=True)
+
+        client = transport.async_client('https://org.example.com/services')
+
+        self.assertIs(
+            transport.async_client('https://org.example.com/apexrest'),
+            client)
+        self.assertIsNot(
+            transport.async_client('https://other.example.com'), client)
+        pool = client._transport._pool  # type: ignore[attr-defined]
+        self.assertEqual(pool._max_connections, 7)
+        self.assertEqual(pool._max_keepalive_connections, 7)
+        self.assertEqual(pool._keepalive_expiry, 3)
+        self.assertTrue(pool._http2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import unittest
+
+from benchmarks.chat import render_spec
+from benchmarks.fakes import FakeSalesforce, LocalServer
+from sassy.functions import FunctionRegistry
+from sassy.transport import HTTPTransport
+from sassy.upstream import AdaptiveLimit, CircuitBreaker, CircuitOpen, \
+    UpstreamGuards
+
+
+class Clock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+LIMIT_EXCEEDED = [{
+    "message": "TotalRequests Limit exceeded.",
+    "errorCode": "REQUEST_LIMIT_EXCEEDED",
+}]
+
+
+class TestAdaptiveLimit(unittest.IsolatedAsyncioTestCase):
+
+    async def test_grows_while_latency_holds(self):
+        limit = AdaptiveLimit(initial=2, max_limit=10)
+        for _ in range(20):
+            await limit.acquire()
+            limit.release(0.1, overloaded=False)
+        self.assertGreater(limit.limit, 4)
+
+    async def test_backs_off_on_overload_and_latency(self):
+        limit = AdaptiveLimit(initial=8, max_limit=10)
+        await limit.acquire()
+        limit.release(0.1, overloaded=False)
+        before = limit.limit
+
+        await limit.acquire()
+        limit.release(1.0, overloaded=False)
+        self.assertAlmostEqual(limit.limit, before * 0.9)
+
+        await limit.acquire()
+        limit.release(0.1, overloaded=True)
+        self.assertAlmostEqual(limit.limit, before * 0.9 * 0.5)
+
+    async def test_queues_calls_past_the_limit(self):
+        limit = AdaptiveLimit(initial=1, max_limit=1)
+        await limit.acquire()
+        waiting = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+
+        limit.release(0.1, overloaded=False)
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(limit.inflight, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, cooldown=10)
+        for _ in range(2):
+            breaker.record(failed=True, overloaded=False)
+        self.assertTrue(breaker.allow())
+        breaker.record(failed=True, overloaded=False)
+        self.assertFalse(breaker.allow())
+
+    def test_probes_once_after_the_cooldown(self):
+        clock = Clock()
+        breaker = CircuitBreaker(cooldown=10, clock=clock)
+        breaker.record(failed=True, overloaded=True)
+        self.assertFalse(breaker.allow())
+
+        clock.now = 11
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(failed=False, overloaded=False)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.open)
+
+
+class TestUpstreamGuards(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fake = FakeSalesforce()
+        self.fake_server = await LocalServer(self.fake.app).__aenter__()
+        self.registry = FunctionRegistry.from_openapi_spec(
+            render_spec(self.fake_server.url), 'token',
+            HTTPTransport(guards=UpstreamGuards(cooldown=60)))
+
+    async def asyncTearDown(self):
+        await self.fake_server.__aexit__(None, None, None)
+
+    async def test_fails_fast_once_the_org_is_out_of_requests(self):
+        self.fake.outage = (403, LIMIT_EXCEEDED)
+        result = await self.registry.ainvoke(
+            'querySalesforceRecords', None, q='SELECT Id FROM Account')
+        self.assertEqual(result, LIMIT_EXCEEDED)
+
+        with self.assertRaises(CircuitOpen) as raised:
+            await self.registry.ainvoke('getWelcomeMessage', None)
+
+        self.assertGreater(raised.exception.retry_after, 50)
+        self.assertEqual(self.fake.requests, {'outage': 1})
+
+    async def test_operations_may_bypass_the_breaker(self):
+        spec = json.loads(render_spec(self.fake_server.url))
+        spec["paths"]["/apexrest/examples/welcome"]["get"][
+            "x-sassy-upstream"] = {"circuitBreaker": False}
+        registry = FunctionRegistry.from_openapi_spec(
+            json.dumps(spec), 'token',
+            HTTPTransport(guards=UpstreamGuards(cooldown=60)))
+        self.fake.outage = (403, LIMIT_EXCEEDED)
+        await registry.ainvoke(
+            'querySalesforceRecords', None, q='SELECT Id FROM Account')
+        self.fake.outage = None
+
+        with self.assertRaises(CircuitOpen):
+            await registry.ainvoke(
+                'querySalesforceRecords', None, q='SELECT Id FROM Account')
+        result = await registry.ainvoke('getWelcomeMessage', None)
+
+        self.assertEqual(result, {"message": "Welcome to Salesforce!"})
+
+
+if __name__ == '__main__':
+    unittest.main()